@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试以 python/ 为根导入 utils 与 web_api，与 web_api.py 的运行方式一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from utils import admission
+from utils.admission import MemoryAdmission, admit_decode, estimate_decode_bytes
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def _acquire_async(gate, cost, order):
+    admitted = threading.Event()
+
+    def run():
+        gate.acquire(cost)
+        order.append(cost)
+        admitted.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return admitted
+
+
+def test_blocks_until_budget_released():
+    gate = MemoryAdmission(100)
+    gate.acquire(60)
+    admitted = _acquire_async(gate, 50, [])
+    _wait_until(lambda: gate.stats()["waiting"] == 1)
+    assert not admitted.is_set()
+    gate.release(60)
+    assert admitted.wait(5.0)
+    stats = gate.stats()
+    assert (stats["in_flight_bytes"], stats["active"], stats["waits"], stats["peak_bytes"]) == (50, 1, 1, 60)
+
+
+def test_oversized_request_runs_alone():
+    gate = MemoryAdmission(100)
+    # 超过整个预算的请求在没有在途解码时直接放行，之后的请求等它释放
+    gate.acquire(500)
+    admitted = _acquire_async(gate, 10, [])
+    _wait_until(lambda: gate.stats()["waiting"] == 1)
+    gate.release(500)
+    assert admitted.wait(5.0)
+
+
+def test_head_of_queue_reserves_budget():
+    gate = MemoryAdmission(100)
+    order = []
+    gate.acquire(60)
+    big = _acquire_async(gate, 80, order)
+    _wait_until(lambda: gate.stats()["waiting"] == 1)
+    # 60 + 30 未超预算，但队首的 80 已预留额度，小请求不能插队
+    small = _acquire_async(gate, 30, order)
+    _wait_until(lambda: gate.stats()["waiting"] == 2)
+    gate.release(60)
+    assert big.wait(5.0)
+    _wait_until(lambda: gate.stats()["waiting"] == 1)
+    assert not small.is_set()
+    gate.release(80)
+    assert small.wait(5.0)
+    assert order == [80, 30]
+
+
+def test_admit_decode_charges_estimate(tmp_path, monkeypatch):
+    path = str(tmp_path / "photo.png")
+    cv2.imwrite(path, np.zeros((40, 60, 3), dtype=np.uint8))
+    gate = MemoryAdmission(1 << 20)
+    monkeypatch.setattr(admission, "decode_admission", gate)
+
+    cost = estimate_decode_bytes(path)
+    assert cost >= 40 * 60 * 5
+    with admit_decode(path):
+        assert gate.stats()["in_flight_bytes"] == cost
+    assert gate.stats()["in_flight_bytes"] == 0
+    # 不可读的文件估算为 0，照常放行，由之后的真实读取报错
+    with admit_decode(str(tmp_path / "missing.png")):
+        assert gate.stats()["active"] == 1
@@ -0,0 +1,20 @@
+from utils.dedup import find_exact_duplicates, restrict_duplicates
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_find_exact_duplicates_first_copy_is_primary(tmp_path):
+    a = _write(tmp_path / "a.jpg", b"same" * 1000)
+    b = _write(tmp_path / "b.jpg", b"same" * 1000)
+    c = _write(tmp_path / "c.jpg", b"diff" * 1000)
+    d = _write(tmp_path / "d.jpg", b"same" * 1000)
+    assert find_exact_duplicates([a, b, c, d]) == {b: a, d: a}
+
+
+def test_restrict_duplicates_promotes_first_enabled_copy():
+    duplicate_of = {"b": "a", "d": "a", "y": "x"}
+    assert restrict_duplicates(duplicate_of, ["b", "c", "d", "x"]) == {"d": "b"}
+    assert restrict_duplicates(duplicate_of, ["a", "b", "x", "y"]) == {"b": "a", "y": "x"}
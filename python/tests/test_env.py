@@ -0,0 +1,32 @@
+import math
+
+from utils.env import env_float, env_int
+
+
+def test_env_int_parses_and_defaults(monkeypatch):
+    monkeypatch.setenv("MEDIA_TOOLBOX_TEST_INT", " 12 ")
+    assert env_int("MEDIA_TOOLBOX_TEST_INT", 3) == 12
+    monkeypatch.setenv("MEDIA_TOOLBOX_TEST_INT", "")
+    assert env_int("MEDIA_TOOLBOX_TEST_INT", 3) == 3
+    monkeypatch.delenv("MEDIA_TOOLBOX_TEST_INT")
+    assert env_int("MEDIA_TOOLBOX_TEST_INT", 3) == 3
+
+
+def test_env_int_invalid_falls_back(monkeypatch, capsys):
+    monkeypatch.setenv("MEDIA_TOOLBOX_TEST_INT", "64MB")
+    assert env_int("MEDIA_TOOLBOX_TEST_INT", 64) == 64
+    assert "MEDIA_TOOLBOX_TEST_INT" in capsys.readouterr().out
+
+
+def test_env_int_minimum(monkeypatch):
+    monkeypatch.setenv("MEDIA_TOOLBOX_TEST_INT", "0")
+    assert env_int("MEDIA_TOOLBOX_TEST_INT", 4, minimum=1) == 1
+
+
+def test_env_float_invalid_and_nan(monkeypatch):
+    monkeypatch.setenv("MEDIA_TOOLBOX_TEST_FLOAT", "0,5")
+    assert env_float("MEDIA_TOOLBOX_TEST_FLOAT", 1.5) == 1.5
+    monkeypatch.setenv("MEDIA_TOOLBOX_TEST_FLOAT", "nan")
+    assert env_float("MEDIA_TOOLBOX_TEST_FLOAT", 1.5) == 1.5
+    monkeypatch.setenv("MEDIA_TOOLBOX_TEST_FLOAT", "2.5")
+    assert math.isclose(env_float("MEDIA_TOOLBOX_TEST_FLOAT", 1.5), 2.5)
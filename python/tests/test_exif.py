@@ -0,0 +1,185 @@
+import io
+
+import cv2
+import numpy as np
+
+import struct
+import zlib
+
+from tiff_builders import ASCII, LONG, SHORT, Ref, TiffBuilder, jpeg_bytes, jpeg_with_exif, webp_with_exif
+from utils.exif import (
+    HEADER_BYTES,
+    embedded_thumbnail,
+    parse_header_metadata,
+    read_capture_time,
+    read_exif_payload,
+    read_header_metadata,
+)
+
+_DATETIME = "2024:05:01 10:20:30"
+_SECONDS = 1714558830.0
+
+
+def _exif_tiff(endian="<"):
+    return (
+        TiffBuilder(endian)
+        .ifd(
+            "ifd0",
+            [(0x010F, ASCII, "FUJIFILM"), (0x0110, ASCII, "X-T5"), (0x0112, SHORT, 8), (0x8769, LONG, Ref("exif"))],
+        )
+        .ifd("exif", [(0x9003, ASCII, _DATETIME), (0xA434, ASCII, "XF23mmF1.4 R LM WR")])
+        .build()
+    )
+
+
+def _webp_image_chunk(width, height):
+    """cv2 编码的无损 WebP 去掉 RIFF 头后的 VP8L 块；噪声图让图像数据远大于 HEADER_BYTES。"""
+    noise = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    encoded = cv2.imencode(".webp", noise, [cv2.IMWRITE_WEBP_QUALITY, 101])[1].tobytes()
+    assert encoded[12:16] == b"VP8L"
+    return encoded[12:]
+
+
+def test_webp_exif_after_large_image_chunk(tmp_path):
+    image_chunk = _webp_image_chunk(400, 300)
+    assert len(image_chunk) > HEADER_BYTES
+    path = tmp_path / "a.webp"
+    path.write_bytes(webp_with_exif(image_chunk, b"Exif\x00\x00" + _exif_tiff(), 400, 300))
+
+    with open(path, "rb") as f:
+        meta = read_header_metadata(f)
+    assert (meta.width, meta.height) == (400, 300)
+    assert meta.orientation == 8
+    assert meta.capture_time == _SECONDS
+    assert (meta.make, meta.model, meta.lens) == ("FUJIFILM", "X-T5", "XF23mmF1.4 R LM WR")
+    assert read_capture_time(str(path)) == _SECONDS
+
+
+def test_webp_exif_without_prefix_and_big_endian():
+    data = webp_with_exif(_webp_image_chunk(32, 24), _exif_tiff(">"), 32, 24)
+    f = io.BytesIO(data)
+    start, payload = read_exif_payload(f, f.read(HEADER_BYTES))
+    assert payload[:2] == b"MM"
+    assert data[start : start + 2] == b"MM"
+
+
+class _CountingReader(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_webp_walk_reads_only_chunk_headers():
+    image_chunk = _webp_image_chunk(400, 300)
+    tiff = _exif_tiff()
+    f = _CountingReader(webp_with_exif(image_chunk, tiff, 400, 300))
+    assert read_exif_payload(f, f.read(HEADER_BYTES)) is not None
+    # 文件头 + 一个块头 + EXIF 载荷，图像数据的其余部分不读
+    assert f.bytes_read == HEADER_BYTES + 8 + len(tiff)
+
+
+def test_webp_without_exif_and_truncated_riff():
+    image_chunk = _webp_image_chunk(32, 24)
+    data = webp_with_exif(image_chunk, b"", 32, 24)
+    # 去掉末尾的空 EXIF 块：RIFF 长度仍大于文件，块头读到文件末尾时停止
+    truncated = data[:-8]
+    f = io.BytesIO(truncated)
+    assert read_exif_payload(f, f.read(HEADER_BYTES)) is None
+
+
+def _camera_tiff(endian="<", thumb=None, ifd1_next=None):
+    """IFD0（相机 / 方向）-> Exif IFD（拍摄时间 + 亚秒 + 镜头），可选 IFD1 内嵌缩略图。"""
+    builder = TiffBuilder(endian).ifd(
+        "ifd0",
+        [
+            (0x010F, ASCII, "NIKON CORPORATION"),
+            (0x0110, ASCII, "NIKON Z 6"),
+            (0x0112, SHORT, 6),
+            (0x8769, LONG, Ref("exif")),
+        ],
+        Ref("ifd1") if thumb is not None else None,
+    )
+    builder.ifd("exif", [(0x9003, ASCII, _DATETIME), (0x9291, ASCII, "25"), (0xA434, ASCII, "NIKKOR Z 50mm")])
+    if thumb is not None:
+        builder.ifd("ifd1", [(0x0201, LONG, Ref("thumb")), (0x0202, LONG, len(thumb))], ifd1_next)
+        builder.blob("thumb", thumb)
+    return builder.build()
+
+
+def test_jpeg_exif_fields_and_thumbnail():
+    thumb = jpeg_bytes(16, 12)
+    head = jpeg_with_exif(_camera_tiff(thumb=thumb), 64, 48)
+    meta = parse_header_metadata(head)
+    assert (meta.width, meta.height, meta.orientation) == (64, 48, 6)
+    assert meta.capture_time == _SECONDS + 0.25
+    assert (meta.make, meta.model, meta.lens) == ("NIKON CORPORATION", "NIKON Z 6", "NIKKOR Z 50mm")
+    # 缩略图偏移相对文件开头
+    assert head[meta.thumb_offset : meta.thumb_offset + meta.thumb_length] == thumb
+    assert embedded_thumbnail(head) == (thumb, 6)
+
+
+def test_big_endian_tiff_dimensions_from_ifd0():
+    data = (
+        TiffBuilder(">")
+        .ifd("ifd0", [(0x0100, LONG, 6048), (0x0101, SHORT, 4024), (0x0112, SHORT, 1), (0x0132, ASCII, _DATETIME)])
+        .build()
+    )
+    meta = parse_header_metadata(data)
+    assert (meta.width, meta.height, meta.orientation) == (6048, 4024, 1)
+    # 没有 Exif IFD 时回退到 IFD0 的 DateTime
+    assert meta.capture_time == _SECONDS
+    assert embedded_thumbnail(data) is None
+
+
+def test_png_exif_chunk():
+    png = cv2.imencode(".png", np.zeros((20, 30, 3), np.uint8))[1].tobytes()
+    tiff = _camera_tiff(">")
+    chunk = struct.pack(">I", len(tiff)) + b"eXIf" + tiff + struct.pack(">I", zlib.crc32(b"eXIf" + tiff))
+    head = png[:33] + chunk + png[33:]
+    meta = parse_header_metadata(head)
+    assert (meta.width, meta.height, meta.orientation) == (30, 20, 6)
+    assert meta.capture_time == _SECONDS + 0.25
+
+
+def test_ifd_loops_do_not_hang():
+    # IFD1 的下一个 IFD 指回 IFD0，Exif 指针指向 IFD0 自己
+    thumb = jpeg_bytes(16, 12)
+    data = bytearray(_camera_tiff(thumb=thumb, ifd1_next=Ref("ifd0")))
+    exif_entry = 8 + 2 + 12 * 3
+    struct.pack_into("<I", data, exif_entry + 8, 8)
+    head = jpeg_with_exif(bytes(data))
+    meta = parse_header_metadata(head)
+    assert meta.orientation == 6
+    assert meta.capture_time is None
+    assert embedded_thumbnail(head) == (thumb, 6)
+
+
+def test_truncated_exif_yields_partial_metadata():
+    tiff = _camera_tiff(thumb=jpeg_bytes(16, 12))
+    full = jpeg_with_exif(tiff)
+    app1_payload = full.index(b"Exif\x00\x00") + 6
+    for cut in (app1_payload + 4, app1_payload + 8 + 2 + 12 * 2, app1_payload + len(tiff) - 10):
+        meta = parse_header_metadata(full[:cut])
+        assert meta.width is None
+        assert embedded_thumbnail(full[:cut]) is None
+    # IFD0 完整时仍能读到方向
+    assert parse_header_metadata(full[: app1_payload + 8 + 2 + 12 * 4 + 4]).orientation == 6
+
+
+def test_thumbnail_length_past_payload_is_rejected():
+    thumb = jpeg_bytes(16, 12)
+    data = bytearray(_camera_tiff(thumb=thumb))
+    length_entry = data.index(struct.pack("<HHI", 0x0202, LONG, 1))
+    struct.pack_into("<I", data, length_entry + 8, len(thumb) + 4096)
+    assert embedded_thumbnail(jpeg_with_exif(bytes(data))) is None
+
+
+def test_not_an_image():
+    meta = parse_header_metadata(b"GIF89a" + b"\x00" * 64)
+    assert meta == (None,) * 9
+    assert embedded_thumbnail(b"") is None
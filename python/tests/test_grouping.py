@@ -0,0 +1,53 @@
+import numpy as np
+
+from utils.grouping import banded_similarity, group_enabled_files, time_gap_mask
+
+
+def _channels(n, bins=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.random((n, bins), dtype=np.float32) for _ in range(3)]
+
+
+def _pair_similarity(channels, i, k):
+    total = 0.0
+    for ch in channels:
+        a, b = ch[i].astype(np.float64), ch[k].astype(np.float64)
+        total += float(a @ b) / (np.sqrt(float(a @ a) * float(b @ b)) + 1e-6)
+    return total / len(channels)
+
+
+def test_banded_similarity_matches_pairwise():
+    channels = _channels(7)
+    sim = banded_similarity(channels, 3)
+    assert np.isnan(sim[0]).all() and np.isnan(sim[1, 1:]).all()
+    for i in range(7):
+        for j in range(1, 4):
+            if i - j >= 0:
+                assert np.isclose(sim[i, j - 1], _pair_similarity(channels, i, i - j))
+
+
+def test_time_gap_mask_skips_gated_pairs():
+    times = [0.0, 1.0, 2.0, 100.0, None, 102.0]
+    gated = time_gap_mask(times, 10.0, 3)
+    # 第 3 张（100s）与前三张都相差超过 10s；第 4 张缺时间，沿用 100s
+    assert gated[3].tolist() == [True, True, True]
+    assert gated[4].tolist() == [False, True, True]
+    assert gated[5].tolist() == [False, False, True]
+    assert time_gap_mask(times, 0.0, 3) is None
+
+    channels = _channels(6)
+    full = banded_similarity(channels, 3)
+    sim = banded_similarity(channels, 3, gated)
+    assert np.isnan(sim[gated]).all()
+    np.testing.assert_array_equal(sim[~gated], full[~gated])
+
+
+def test_window_grouping_splits_on_time_gap():
+    # 六张完全相同的直方图：不加门限时全是一组，3 与 2 之间的时间间隔把它们切成两组
+    hist = (np.ones(8, np.float32),) * 3
+    files = [f"{i}.jpg" for i in range(6)]
+    cache = {f: hist for f in files}
+    times = [0.0, 1.0, 2.0, 100.0, 101.0, 102.0]
+    assert group_enabled_files(files, [1.0] * 6, cache, 0.9, window=3) == [0] * 6
+    ids = group_enabled_files(files, [1.0] * 6, cache, 0.9, window=3, capture_times=times, max_time_gap=10.0)
+    assert ids == [0, 0, 0, 1, 1, 1]
@@ -0,0 +1,54 @@
+import numpy as np
+
+from utils.ranking import DEFAULT_RANK_WEIGHTS, _minmax, group_ranks, resolve_weights, score_features
+
+
+def _features(rows):
+    """每行 (IQA, 清晰度)；其余列缺失（NaN），exposure / eyes 等项对所有行相同。"""
+    features = np.full((len(rows), 9), np.nan)
+    features[:, :2] = rows
+    return features
+
+
+def test_group_ranks_orders_within_each_group():
+    group_ids = np.array([2, 1, 2, 1, 2, 3])
+    scores = np.array([0.5, 0.1, 0.9, 0.7, 0.2, 0.4])
+    ranks = group_ranks(group_ids, scores)
+    # 组 1: 0.7 > 0.1；组 2: 0.9 > 0.5 > 0.2；组 3 只有一张
+    assert ranks.tolist() == [1, 1, 0, 0, 2, 0]
+    assert group_ranks(np.array([], dtype=np.int64), np.array([])).shape == (0,)
+
+
+def test_minmax_handles_nan_and_constant_columns():
+    out = _minmax(np.array([2.0, np.nan, 4.0, 3.0]))
+    assert out.tolist() == [0.0, 0.0, 1.0, 0.5]
+    assert _minmax(np.array([np.nan, 1.0, 3.0]), fill=0.5).tolist() == [0.5, 0.0, 1.0]
+    # 全库取值相同 / 全部缺失时整列为 fill，不除以 0
+    assert _minmax(np.array([3.0, 3.0, np.nan]), fill=0.25).tolist() == [0.25, 0.25, 0.25]
+    assert _minmax(np.full(3, np.nan)).tolist() == [0.0, 0.0, 0.0]
+
+
+def test_resolve_weights_overrides():
+    resolved = resolve_weights({"iqa": "2", "eyes": -1, "sharpness": "x", "unknown": 5})
+    assert resolved["iqa"] == 2.0
+    assert resolved["eyes"] == 0.0
+    assert resolved["sharpness"] == DEFAULT_RANK_WEIGHTS["sharpness"]
+    assert "unknown" not in resolved
+    assert resolve_weights(None) == DEFAULT_RANK_WEIGHTS
+
+
+def test_weight_overrides_change_ranking():
+    # 第 0 张 IQA 高但模糊，第 1 张 IQA 低但清晰
+    features = _features([[0.9, 10.0], [0.1, 1000.0]])
+    iqa_only = resolve_weights({"iqa": 1.0, "sharpness": 0.0})
+    sharp_only = resolve_weights({"iqa": 0.0, "sharpness": 1.0})
+    group_ids = np.zeros(2, dtype=np.int64)
+    assert group_ranks(group_ids, score_features(features, iqa_only)).tolist() == [0, 1]
+    assert group_ranks(group_ids, score_features(features, sharp_only)).tolist() == [1, 0]
+
+
+def test_missing_iqa_scores_as_zero():
+    features = _features([[np.nan, 5.0], [0.2, 5.0], [0.4, 5.0]])
+    weights = {key: 0.0 for key in DEFAULT_RANK_WEIGHTS}
+    weights["iqa"] = 1.0
+    assert score_features(features, weights).tolist() == [0.0, 0.0, 1.0]
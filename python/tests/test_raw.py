@@ -0,0 +1,149 @@
+import io
+import struct
+
+import pytest
+
+from tiff_builders import IFD, LONG, SHORT, Ref, TiffBuilder, jpeg_bytes, raf_bytes
+from utils import raw
+from utils.raw import find_raw_preview, raw_jpeg_pairs, read_raw_preview
+
+SMALL = jpeg_bytes(32, 24)
+LARGE = jpeg_bytes(320, 240)
+# CFA 传感器数据：以 FFD8 开头的无损 JPEG，但不是可显示的预览
+CFA = b"\xff\xd8" + b"\x00" * (len(LARGE) * 2)
+
+
+def _nef_like(endian="<", magic=42, orientation=6):
+    """IFD0 带小预览（JPEGInterchangeFormat）与 SubIFDs：一个 CFA 主图、一个全尺寸 JPEG 预览。"""
+    return (
+        TiffBuilder(endian, magic)
+        .ifd(
+            "ifd0",
+            [
+                (0x0112, SHORT, orientation),
+                (0x014A, IFD, [Ref("cfa"), Ref("preview")]),
+                (0x0201, LONG, Ref("small")),
+                (0x0202, LONG, len(SMALL)),
+            ],
+        )
+        .ifd(
+            "cfa",
+            [(0x0103, SHORT, 7), (0x0106, SHORT, 32803), (0x0111, LONG, Ref("cfa_data")), (0x0117, LONG, len(CFA))],
+        )
+        .ifd(
+            "preview",
+            [(0x0103, SHORT, 6), (0x0106, SHORT, 6), (0x0111, LONG, Ref("large")), (0x0117, LONG, len(LARGE))],
+        )
+        .blob("small", SMALL)
+        .blob("large", LARGE)
+        .blob("cfa_data", CFA)
+    )
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_largest_jpeg_preview_wins(tmp_path, endian):
+    path = _write(tmp_path, "a.nef", _nef_like(endian).build())
+    preview = find_raw_preview(path)
+    assert preview is not None
+    assert (preview.length, preview.orientation) == (len(LARGE), 6)
+    assert read_raw_preview(path) == (LARGE, 6)
+
+
+@pytest.mark.parametrize("magic", [0x4F52, 0x55])
+def test_orf_and_rw2_magics(tmp_path, magic):
+    path = _write(tmp_path, "a.orf", _nef_like(magic=magic).build())
+    assert find_raw_preview(path).length == len(LARGE)
+
+
+def test_unknown_tiff_magic_is_rejected(tmp_path):
+    path = _write(tmp_path, "a.nef", _nef_like(magic=43).build())
+    assert find_raw_preview(path) is None
+
+
+def test_raf_header(tmp_path):
+    path = _write(tmp_path, "a.raf", raf_bytes(LARGE))
+    preview = find_raw_preview(path)
+    assert (preview.offset, preview.length, preview.orientation) == (100, len(LARGE), 0)
+    assert read_raw_preview(path) == (LARGE, 0)
+
+
+def test_raf_preview_past_end_of_file(tmp_path):
+    path = _write(tmp_path, "a.raf", raf_bytes(LARGE)[:-1])
+    assert find_raw_preview(path) is None
+
+
+def test_truncated_raf_header(tmp_path):
+    assert find_raw_preview(_write(tmp_path, "a.raf", raf_bytes(LARGE)[:90])) is None
+
+
+def test_ifd_chain_loop_terminates():
+    # IFD0 -> IFD1 -> IFD0 ...，SubIFDs 也指回自己
+    data = (
+        TiffBuilder()
+        .ifd(
+            "ifd0",
+            [(0x014A, IFD, [Ref("ifd0")]), (0x0201, LONG, Ref("small")), (0x0202, LONG, len(SMALL))],
+            Ref("ifd1"),
+        )
+        .ifd("ifd1", [(0x0112, SHORT, 3)], Ref("ifd0"))
+        .blob("small", SMALL)
+        .build()
+    )
+    candidates, orientation = raw._walk_tiff(io.BytesIO(data), "<", 8)
+    assert candidates == [(data.index(SMALL), len(SMALL))]
+    # Orientation 只取 IFD0 的
+    assert orientation == 1
+
+
+def test_ifd_count_is_bounded():
+    # 每个 IFD 都指向一个新的 IFD：遍历数不超过 _MAX_IFDS
+    builder = TiffBuilder()
+    n = raw._MAX_IFDS + 10
+    for i in range(n):
+        next_ifd = Ref(f"ifd{i + 1}") if i + 1 < n else None
+        builder.ifd(f"ifd{i}", [(0x0201, LONG, Ref("small")), (0x0202, LONG, len(SMALL))], next_ifd)
+    data = builder.blob("small", SMALL).build()
+    candidates, _ = raw._walk_tiff(io.BytesIO(data), "<", 8)
+    assert len(candidates) == raw._MAX_IFDS
+
+
+def test_truncated_ifds(tmp_path):
+    data = _nef_like().build()
+    ifd0_end = 8 + 2 + 12 * 4 + 4
+    # IFD0 的条目表被截断：整个 IFD 跳过，不抛异常
+    candidates, orientation = raw._walk_tiff(io.BytesIO(data[:20]), "<", 8)
+    assert (candidates, orientation) == ([], 1)
+    # IFD0 完整、SubIFD 被截断：只剩 IFD0 的小预览，且它的数据也已不在文件内
+    path = _write(tmp_path, "a.nef", data[: ifd0_end + 10])
+    assert find_raw_preview(path) is None
+    # 只有 TIFF 头
+    assert find_raw_preview(_write(tmp_path, "b.nef", data[:8])) is None
+
+
+def test_out_of_range_offsets_are_ignored(tmp_path):
+    data = bytearray(_nef_like().build())
+    # 把第一个 IFD 偏移改到文件之外
+    struct.pack_into("<I", data, 4, len(data) + 1000)
+    assert find_raw_preview(_write(tmp_path, "a.nef", bytes(data))) is None
+
+
+def test_non_jpeg_candidate_is_skipped(tmp_path):
+    data = (
+        TiffBuilder()
+        .ifd("ifd0", [(0x0201, LONG, Ref("junk")), (0x0202, LONG, 4096)])
+        .blob("junk", b"\x00" * 4096)
+        .build()
+    )
+    assert find_raw_preview(_write(tmp_path, "a.dng", data)) is None
+
+
+def test_raw_jpeg_pairs_ignore_case_and_separators():
+    paths = ["C:\\photos\\DSC_1.NEF", "c:/photos/dsc_1.jpg", "c:/photos/dsc_2.nef", "c:/other/dsc_2.jpg"]
+    pairs = raw_jpeg_pairs(paths)
+    assert pairs == {"C:\\photos\\DSC_1.NEF": "c:/photos/dsc_1.jpg"}
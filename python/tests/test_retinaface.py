@@ -0,0 +1,162 @@
+"""
+RetinaFace 解码与 NMS 与 insightface 原实现的一致性。
+
+data/retinaface_net_outs.npz 是一份 det_10g 形状的输出（9 个头：3 个 stride 各自的 score / bbox / kps，
+64x64 输入）与对应输入图；分数量化到 1/64，保证出现同分与恰好等于阈值的锚点。
+"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from utils.model_zoo.retinaface import RetinaFace
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "retinaface_net_outs.npz")
+STRIDES = (8, 16, 32)
+
+
+class _Meta:
+    def __init__(self, name, shape):
+        self.name = name
+        self.shape = shape
+
+
+class _RecordedSession:
+    """回放录制输出的 Session；没有 io_binding，run_with_binding 会走 session.run。"""
+
+    def __init__(self, net_outs, expected_blob):
+        self.net_outs = net_outs
+        self.expected_blob = expected_blob
+
+    def get_inputs(self):
+        return [_Meta("input.1", [1, 3, "?", "?"])]
+
+    def get_outputs(self):
+        return [_Meta(f"out{i}", list(out.shape)) for i, out in enumerate(self.net_outs)]
+
+    def run(self, output_names, feeds):
+        np.testing.assert_allclose(feeds["input.1"], self.expected_blob, rtol=0, atol=1e-6)
+        return [out.copy() for out in self.net_outs]
+
+
+def _baseline_distance2bbox(points, distance):
+    x1 = points[:, 0] - distance[:, 0]
+    y1 = points[:, 1] - distance[:, 1]
+    x2 = points[:, 0] + distance[:, 2]
+    y2 = points[:, 1] + distance[:, 3]
+    return np.stack([x1, y1, x2, y2], axis=-1)
+
+
+def _baseline_distance2kps(points, distance):
+    preds = []
+    for i in range(0, distance.shape[1], 2):
+        px = points[:, i % 2] + distance[:, i]
+        py = points[:, i % 2 + 1] + distance[:, i + 1]
+        preds.append(px)
+        preds.append(py)
+    return np.stack(preds, axis=-1)
+
+
+def _baseline_forward(net_outs, input_height, input_width, threshold, num_anchors=2):
+    """原 forward 的解码部分：全部锚点解码后再按阈值筛选。"""
+    fmc = len(STRIDES)
+    scores_list, bboxes_list, kpss_list = [], [], []
+    for idx, stride in enumerate(STRIDES):
+        scores = net_outs[idx]
+        height = input_height // stride
+        width = input_width // stride
+        anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+        anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+        anchor_centers = np.stack([anchor_centers] * num_anchors, axis=1).reshape((-1, 2))
+        pos_inds = np.where(scores >= threshold)[0]
+        bboxes = _baseline_distance2bbox(anchor_centers, net_outs[idx + fmc] * stride)
+        kpss = _baseline_distance2kps(anchor_centers, net_outs[idx + fmc * 2] * stride)
+        kpss = kpss.reshape((kpss.shape[0], -1, 2))
+        scores_list.append(scores[pos_inds])
+        bboxes_list.append(bboxes[pos_inds])
+        kpss_list.append(kpss[pos_inds])
+    return scores_list, bboxes_list, kpss_list
+
+
+@pytest.fixture(scope="module")
+def recorded():
+    with np.load(DATA) as data:
+        net_outs = [data[f"{head}_{i}"] for head in ("score", "bbox", "kps") for i in range(len(STRIDES))]
+        return net_outs, data["img"]
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.5, 0.75, 1.0])
+def test_forward_matches_baseline_decode(recorded, threshold):
+    net_outs, img = recorded
+    blob = cv2.dnn.blobFromImage(img, 1.0 / 128.0, img.shape[1::-1], (127.5, 127.5, 127.5), swapRB=True)
+    model = RetinaFace(session=_RecordedSession(net_outs, blob))
+
+    scores, bboxes, kpss = model.forward(img, threshold)
+    ref_scores, ref_bboxes, ref_kpss = _baseline_forward(net_outs, img.shape[0], img.shape[1], threshold)
+
+    assert len(scores) == len(ref_scores) == len(STRIDES)
+    for got, ref in zip(scores, ref_scores):
+        np.testing.assert_array_equal(got, ref)
+    for got, ref in zip(bboxes, ref_bboxes):
+        np.testing.assert_array_equal(got, ref)
+    for got, ref in zip(kpss, ref_kpss):
+        assert got.shape == ref.shape
+        np.testing.assert_array_equal(got, ref)
+
+
+def _model(nms_thresh=0.4):
+    model = RetinaFace.__new__(RetinaFace)
+    model.nms_thresh = nms_thresh
+    return model
+
+
+def _dets(rows):
+    return np.asarray(rows, dtype=np.float32).reshape(-1, 5)
+
+
+def test_nms_tied_scores_follow_argsort_order():
+    # 三个框两两重叠且同分：保留哪个取决于 argsort 对同分的排序
+    dets = _dets([[0, 0, 9, 9, 0.9], [1, 1, 10, 10, 0.9], [2, 2, 11, 11, 0.9], [40, 40, 49, 49, 0.9]])
+    model = _model()
+    assert model.nms(dets) == model._nms_greedy(dets)
+
+
+def test_nms_iou_exactly_at_threshold_is_kept():
+    # 宽 7 高 10（+1 约定下面积 70），横向重叠 4 像素：IoU = 40 / (140 - 40) = 0.4，不超过阈值应保留
+    dets = _dets([[0, 0, 6, 9, 0.9], [3, 0, 9, 9, 0.8]])
+    model = _model(0.4)
+    assert model._nms_greedy(dets) == [0, 1]
+    assert model.nms(dets) == [0, 1]
+
+
+def test_nms_touching_boxes_overlap_by_one_pixel():
+    # x2 == x1 的相邻框在 +1 约定下重叠一列像素；1x1 的框完全重合
+    dets = _dets([[0, 0, 0, 0, 0.9], [0, 0, 0, 0, 0.8], [5, 0, 10, 5, 0.7], [10, 0, 15, 5, 0.6]])
+    model = _model(0.1)
+    assert model.nms(dets) == model._nms_greedy(dets)
+
+
+def test_nms_degenerate_boxes_fall_back_to_greedy():
+    dets = _dets([[5, 5, 2, 2, 0.9], [0, 0, 9, 9, 0.8], [1, 1, 10, 10, 0.7]])
+    model = _model()
+    assert model.nms(dets) == model._nms_greedy(dets)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_nms_matches_greedy_on_random_boxes(seed):
+    rng = np.random.default_rng(seed)
+    n = 200
+    # 整数坐标与量化分数：大量同分与恰好相接的框
+    xy = rng.integers(0, 60, (n, 2))
+    wh = rng.integers(0, 20, (n, 2))
+    scores = rng.integers(1, 16, n) / 16
+    dets = np.column_stack([xy, xy + wh, scores]).astype(np.float32)
+    for thresh in (0.3, 0.4, 0.5):
+        model = _model(thresh)
+        assert model.nms(dets) == model._nms_greedy(dets)
+
+
+def test_nms_empty():
+    assert _model().nms(np.zeros((0, 5), dtype=np.float32)) == []
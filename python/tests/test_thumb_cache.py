@@ -0,0 +1,91 @@
+import os
+
+import cv2
+import numpy as np
+from fastapi.testclient import TestClient
+
+import web_api
+from utils.thumb_cache import (
+    BATCH_ERROR,
+    BATCH_FRAME_HEADER,
+    BATCH_OK,
+    ThumbnailCache,
+    etag_matches,
+    iter_thumbnail_batch,
+    thumbnail_etag,
+)
+
+
+def _write_image(path, seed=0):
+    rng = np.random.default_rng(seed)
+    cv2.imwrite(str(path), rng.integers(0, 256, (120, 160, 3), dtype=np.uint8))
+    return str(path)
+
+
+def test_lru_evicts_by_byte_budget():
+    cache = ThumbnailCache(10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    # a 刚被访问，超出 10 字节时淘汰最久未用的 b
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    # 覆盖同一个键按新长度记账；超过上限的单个条目不缓存
+    cache.put("a", b"a")
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 5, 1)
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+
+
+def test_etag_matches():
+    etag = '"abc-1-2-64x64-v1"'
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_get_thumbnail_returns_304_until_source_changes(tmp_path):
+    photo = _write_image(tmp_path / "photo.jpg")
+    client = TestClient(web_api.app)
+    params = {"photo_path": photo, "width": 64, "height": 64, "thumbs_path": str(tmp_path / "thumbs")}
+
+    first = client.get("/get_thumbnail", params=params)
+    assert first.status_code == 200 and first.content[:4] == b"RIFF"
+    etag = first.headers["etag"]
+    assert etag == thumbnail_etag(photo, 64, 64)
+
+    cached = client.get("/get_thumbnail", params=params, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    # 源文件 mtime 变化后 ETag 随之变化，旧 ETag 不再命中
+    st = os.stat(photo)
+    os.utime(photo, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    changed = client.get("/get_thumbnail", params=params, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_batch_stream_framing(tmp_path):
+    paths = [_write_image(tmp_path / "a.jpg", 1), str(tmp_path / "missing.jpg"), _write_image(tmp_path / "b.jpg", 2)]
+    stream = b"".join(iter_thumbnail_batch(paths, 64, 64))
+
+    frames = {}
+    offset = 0
+    while offset < len(stream):
+        index, status, length = BATCH_FRAME_HEADER.unpack_from(stream, offset)
+        offset += BATCH_FRAME_HEADER.size
+        frames[index] = (status, stream[offset : offset + length])
+        offset += length
+    assert offset == len(stream)
+    assert sorted(frames) == [0, 1, 2]
+    for index in (0, 2):
+        status, payload = frames[index]
+        assert status == BATCH_OK and payload[:4] == b"RIFF"
+        assert cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR).shape[:2] == (48, 64)
+    status, payload = frames[1]
+    assert status == BATCH_ERROR and payload
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from utils import thumb_jobs
+from utils.thumb_jobs import ThumbnailJobManager
+
+
+class FakeGenerator:
+    """代替 generate_thumbnails：记录执行顺序；gate 未放行时第一个任务一直"运行"到被取消。"""
+
+    def __init__(self):
+        self.order = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, file_paths, thumbs_path, width, height, progress, cancel_event=None, sizes=None, analyzer=None):
+        self.order.append(file_paths[0])
+        self.started.set()
+        while not self.gate.is_set() and not cancel_event.is_set():
+            time.sleep(0.005)
+        progress("done", value=len(file_paths), total=len(file_paths))
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    generator = FakeGenerator()
+    monkeypatch.setattr(thumb_jobs, "generate_thumbnails", generator)
+    yield generator
+    generator.gate.set()
+
+
+def _manager():
+    return ThumbnailJobManager(lambda *args, **kwargs: None, log_fn=lambda message: None)
+
+
+def _submit(manager, name, priority=0, supersede=False):
+    return manager.submit([name], "thumbs", 128, 128, priority=priority, supersede=supersede).job_id
+
+
+def _wait_state(manager, job_id, state, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while manager.get(job_id)["state"] != state:
+        assert time.monotonic() < deadline, manager.get(job_id)
+        time.sleep(0.005)
+
+
+def _start_blocker(manager, fake):
+    job_id = _submit(manager, "blocker")
+    assert fake.started.wait(5.0)
+    return job_id
+
+
+def test_priority_ordering(fake):
+    manager = _manager()
+    blocker = _start_blocker(manager, fake)
+    low = _submit(manager, "low", priority=0)
+    high_a = _submit(manager, "high_a", priority=5)
+    high_b = _submit(manager, "high_b", priority=5)
+    fake.gate.set()
+    for job_id in (blocker, low, high_a, high_b):
+        _wait_state(manager, job_id, "done")
+    # priority 越大越先执行，同优先级先到先得
+    assert fake.order == ["blocker", "high_a", "high_b", "low"]
+    assert manager.get(low)["done"] == 1
+
+
+def test_supersede_cancels_queued_and_running(fake):
+    manager = _manager()
+    running = _start_blocker(manager, fake)
+    queued = _submit(manager, "queued")
+    latest = _submit(manager, "latest", supersede=True)
+    assert manager.get(queued)["state"] == "cancelled"
+    _wait_state(manager, running, "cancelled")
+    fake.gate.set()
+    _wait_state(manager, latest, "done")
+    assert fake.order == ["blocker", "latest"]
+
+
+def test_cancel(fake):
+    manager = _manager()
+    running = _start_blocker(manager, fake)
+    queued = _submit(manager, "queued")
+    assert manager.cancel(queued)
+    assert manager.get(queued)["state"] == "cancelled"
+    assert not manager.cancel(queued)
+    assert not manager.cancel("missing")
+    assert manager.cancel(running)
+    _wait_state(manager, running, "cancelled")
+    # 已取消的排队任务出队时跳过，不会再执行
+    follow_up = _submit(manager, "follow_up")
+    fake.gate.set()
+    _wait_state(manager, follow_up, "done")
+    assert fake.order == ["blocker", "follow_up"]
+
+
+def test_finished_jobs_trimmed(fake, monkeypatch):
+    monkeypatch.setattr(thumb_jobs, "FINISHED_JOBS_KEPT", 2)
+    manager = _manager()
+    running = _start_blocker(manager, fake)
+    cancelled = [_submit(manager, f"job{i}") for i in range(3)]
+    for job_id in cancelled:
+        manager.cancel(job_id)
+    # 只保留最近结束的 2 个；运行中的任务不受影响
+    assert manager.get(cancelled[0]) is None
+    assert [manager.get(job_id)["state"] for job_id in cancelled[1:]] == ["cancelled", "cancelled"]
+    assert {job["job_id"] for job in manager.list()} == {running, *cancelled[1:]}
+    fake.gate.set()
+    _wait_state(manager, running, "done")
+    assert manager.get(cancelled[1]) is None
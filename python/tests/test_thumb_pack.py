@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from utils import thumb_pack
+from utils.thumb_pack import ThumbPack
+
+
+def _fill(pack):
+    # a 被重写一次，旧版本成为空洞，压缩后 b 的偏移会变
+    pack.put("/photos/a.jpg", b"a-old" * 100)
+    pack.put("/photos/b.jpg", b"b" * 300)
+    pack.put("/photos/a.jpg", b"a-new" * 50)
+    pack.flush()
+
+
+def test_compact_reclaims_garbage(tmp_path):
+    pack = ThumbPack(str(tmp_path))
+    _fill(pack)
+    assert pack.compact() == 500
+    assert pack.get("/photos/a.jpg") == b"a-new" * 50
+    assert pack.get("/photos/b.jpg") == b"b" * 300
+    pack.close()
+
+
+def test_crash_before_replace_keeps_old_pack(tmp_path, monkeypatch):
+    pack = ThumbPack(str(tmp_path))
+    _fill(pack)
+
+    def crash(src, dst):
+        raise OSError("simulated crash")
+
+    monkeypatch.setattr(thumb_pack.os, "replace", crash)
+    with pytest.raises(OSError):
+        pack.compact()
+    monkeypatch.undo()
+    assert os.path.exists(pack.path + ".tmp")
+
+    reopened = ThumbPack(str(tmp_path))
+    assert not os.path.exists(reopened.path + ".tmp")
+    assert reopened.get("/photos/a.jpg") == b"a-new" * 50
+    assert reopened.get("/photos/b.jpg") == b"b" * 300
+    reopened.close()
+
+
+def test_crash_after_replace_applies_new_offsets(tmp_path, monkeypatch):
+    pack = ThumbPack(str(tmp_path))
+    _fill(pack)
+
+    def crash(self):
+        raise RuntimeError("simulated crash")
+
+    monkeypatch.setattr(ThumbPack, "_apply_compaction_locked", crash)
+    with pytest.raises(RuntimeError):
+        pack.compact()
+    monkeypatch.undo()
+    assert os.path.getsize(pack.path) == 550
+
+    reopened = ThumbPack(str(tmp_path))
+    assert reopened.get("/photos/a.jpg") == b"a-new" * 50
+    assert reopened.get("/photos/b.jpg") == b"b" * 300
+    assert reopened.stats()["garbage_bytes"] == 0
+    reopened.close()
@@ -0,0 +1,40 @@
+import pytest
+
+from utils.image_compute import estimate_tiered_iqa, select_tiered_iqa_targets
+
+# 两组连拍：组 0 三张、组 1 两张，清晰度各不相同
+FILES = ["a0", "a1", "a2", "b0", "b1"]
+GROUP_IDS = [0, 0, 0, 1, 1]
+SHARPNESS = {"a0": 50.0, "a1": 400.0, "a2": 100.0, "b0": 30.0, "b1": 10.0}
+
+
+def test_selects_sharpest_per_group():
+    assert sorted(select_tiered_iqa_targets(FILES, GROUP_IDS, SHARPNESS, top_k=1, blur_floor=0.0)) == ["a1", "b0"]
+    assert sorted(select_tiered_iqa_targets(FILES, GROUP_IDS, SHARPNESS, top_k=2, blur_floor=0.0)) == [
+        "a1",
+        "a2",
+        "b0",
+        "b1",
+    ]
+
+
+def test_blur_floor_adds_sharp_frames():
+    # 组 0 的 a2 不在前 1 名，但清晰度达到下限也入选；组 1 没有达到下限的照片，仍保留前 1 名
+    targets = select_tiered_iqa_targets(FILES, GROUP_IDS, SHARPNESS, top_k=1, blur_floor=80.0)
+    assert sorted(targets) == ["a1", "a2", "b0"]
+
+
+def test_estimates_scale_below_scored_frames():
+    targets = ["a1", "a2", "b0"]
+    iqa = {"a1": 0.8, "a2": 0.6, "b0": 0.5}
+    estimates = estimate_tiered_iqa(FILES, GROUP_IDS, targets, iqa, SHARPNESS)
+    # 参照为组内最低的已评分帧：a2（0.6, 100）与 b0（0.5, 30）
+    assert estimates.keys() == {"a0", "b1"}
+    assert estimates["a0"] == pytest.approx(0.6 * 50.0 / 100.0)
+    assert estimates["b1"] == pytest.approx(0.5 * 10.0 / 30.0)
+
+
+def test_estimates_skip_groups_without_reference():
+    # 已有真实 IQA 的照片不估计；组内没有跑过完整模型的照片时不估计
+    estimates = estimate_tiered_iqa(FILES, GROUP_IDS, ["a1"], {"a1": 0.8, "a0": 0.3}, SHARPNESS)
+    assert estimates == {"a2": pytest.approx(0.8 * 100.0 / 400.0)}
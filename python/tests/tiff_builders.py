@@ -0,0 +1,131 @@
+"""
+测试用的合成文件：按 IFD 描述拼出 TIFF 结构的字节串，以及 JPEG / WebP / RAF 外壳。
+
+偏移都由 build() 按布局计算：条目值可以写 Ref("名字")，指向同一个 TIFF 里某个 IFD 或数据块的偏移。
+"""
+
+import struct
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+ASCII, SHORT, LONG, UNDEFINED, IFD = 2, 3, 4, 7, 13
+_TYPE_SIZES = {ASCII: 1, SHORT: 2, LONG: 4, UNDEFINED: 1, IFD: 4}
+
+
+class Ref(NamedTuple):
+    name: str
+
+
+Value = Union[int, Ref, str, bytes, Sequence[Union[int, Ref]]]
+
+
+class TiffBuilder:
+    def __init__(self, endian: str = "<", magic: int = 42):
+        self.endian = endian
+        self.magic = magic
+        self._ifds: List[Tuple[str, List[Tuple[int, int, Value]], Optional[Union[Ref, int]]]] = []
+        self._blobs: List[Tuple[str, bytes]] = []
+
+    def ifd(self, name: str, entries: List[Tuple[int, int, Value]], next_ifd: Optional[Union[Ref, int]] = None):
+        """追加一个 IFD；第一个 IFD 即 IFD0。next_ifd 为下一个 IFD（Ref 或原始偏移）。"""
+        self._ifds.append((name, entries, next_ifd))
+        return self
+
+    def blob(self, name: str, data: bytes):
+        self._blobs.append((name, data))
+        return self
+
+    def build(self) -> bytes:
+        e = self.endian
+        encoded: List[List[Tuple[int, int, int, object]]] = []
+        offsets: Dict[str, int] = {}
+        pos = 8
+        for name, entries, _ in self._ifds:
+            offsets[name] = pos
+            pos += 2 + 12 * len(entries) + 4
+        # 超过 4 字节的值放在所有 IFD 之后
+        data_offsets: Dict[Tuple[int, int], int] = {}
+        for i, (_, entries, _) in enumerate(self._ifds):
+            for j, (tag, typ, value) in enumerate(entries):
+                count = _count(typ, value)
+                if count * _TYPE_SIZES[typ] > 4:
+                    data_offsets[(i, j)] = pos
+                    pos += count * _TYPE_SIZES[typ] + (count * _TYPE_SIZES[typ]) % 2
+        for name, data in self._blobs:
+            offsets[name] = pos
+            pos += len(data)
+
+        def resolve(v):
+            return offsets[v.name] if isinstance(v, Ref) else v
+
+        out = bytearray(pos)
+        out[0:2] = b"II" if e == "<" else b"MM"
+        struct.pack_into(e + "HI", out, 2, self.magic, offsets[self._ifds[0][0]] if self._ifds else 0)
+        for i, (name, entries, next_ifd) in enumerate(self._ifds):
+            at = offsets[name]
+            struct.pack_into(e + "H", out, at, len(entries))
+            for j, (tag, typ, value) in enumerate(entries):
+                raw = _value_bytes(e, typ, value, resolve)
+                entry = at + 2 + 12 * j
+                struct.pack_into(e + "HHI", out, entry, tag, typ, _count(typ, value))
+                if (i, j) in data_offsets:
+                    struct.pack_into(e + "I", out, entry + 8, data_offsets[(i, j)])
+                    out[data_offsets[(i, j)] : data_offsets[(i, j)] + len(raw)] = raw
+                else:
+                    out[entry + 8 : entry + 8 + len(raw)] = raw
+            struct.pack_into(e + "I", out, at + 2 + 12 * len(entries), resolve(next_ifd) or 0)
+        for name, data in self._blobs:
+            out[offsets[name] : offsets[name] + len(data)] = data
+        return bytes(out)
+
+
+def _count(typ: int, value: Value) -> int:
+    if typ == ASCII:
+        return len(value.encode() if isinstance(value, str) else value) + (1 if isinstance(value, str) else 0)
+    if typ == UNDEFINED:
+        return len(value)
+    return len(value) if isinstance(value, (list, tuple)) and not isinstance(value, Ref) else 1
+
+
+def _value_bytes(e: str, typ: int, value: Value, resolve) -> bytes:
+    if typ == ASCII:
+        return value.encode() + b"\x00" if isinstance(value, str) else bytes(value)
+    if typ == UNDEFINED:
+        return bytes(value)
+    values = value if isinstance(value, (list, tuple)) and not isinstance(value, Ref) else [value]
+    return struct.pack(e + ("H" if typ == SHORT else "I") * len(values), *(resolve(v) for v in values))
+
+
+def jpeg_bytes(width: int = 64, height: int = 48, quality: int = 90) -> bytes:
+    img = np.zeros((height, width, 3), np.uint8)
+    img[:, : width // 2] = (40, 120, 200)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def jpeg_with_exif(tiff: bytes, width: int = 64, height: int = 48) -> bytes:
+    """把 TIFF 结构作为 APP1 "Exif" 段插在 JFIF APP0 之后。"""
+    jpeg = jpeg_bytes(width, height)
+    app0_end = 4 + struct.unpack_from(">H", jpeg, 4)[0]
+    payload = b"Exif\x00\x00" + tiff
+    app1 = b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+    return jpeg[:app0_end] + app1 + jpeg[app0_end:]
+
+
+def riff_chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack("<I", len(data)) + data + (b"\x00" if len(data) & 1 else b"")
+
+
+def webp_with_exif(image_chunk: bytes, exif: bytes, width: int, height: int) -> bytes:
+    """扩展格式 WebP：VP8X + 图像块 + EXIF 块（与 libwebp 一样写在图像数据之后）。"""
+    vp8x = struct.pack("<I", 0x08) + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little")
+    body = b"WEBP" + riff_chunk(b"VP8X", vp8x) + image_chunk + riff_chunk(b"EXIF", exif)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def raf_bytes(preview: bytes) -> bytes:
+    """RAF：固定文件头，偏移 84 处为大端的预览 (偏移, 长度)。"""
+    header = bytearray(b"FUJIFILMCCD-RAW 0201FF383501" + b"\x00" * 72)
+    struct.pack_into(">II", header, 84, len(header), len(preview))
+    return bytes(header) + preview
@@ -0,0 +1,160 @@
+"""
+解码内存准入控制：按文件头估算解码后的内存占用，在途总量不超过预算时才放行。
+
+generate_thumbnails 的默认线程池在 32 线程的机器上有 36 个 worker，检测流程的 worker 也类似；
+如果同时碰上几张 1 亿像素的 PNG，每张完整解码就是数百 MB，瞬时峰值足以把进程挤爆。
+这里所有解码路径（缩略图任务、/get_thumbnail 现场生成、检测流程、导入融合分析）共享同一个预算：
+  - 估算只读文件头（utils/exif.image_dimensions；RAW 读内嵌预览的帧头），不解码；
+    照片库已提取过元数据（utils/metadata.py）时直接用库里的尺寸，连文件头也不读；
+  - 小文件的估算值远小于预算，照常满并行；
+  - 大文件排队等待在途的解码释放；单个文件超过整个预算时，等到没有其他在途解码再独占执行，不会死锁。
+"""
+
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from .env import env_int
+from .exif import HEADER_BYTES, image_dimensions
+from .raw import find_raw_preview, is_raw
+
+# 同时在途的解码内存预算（MB）
+DECODE_BUDGET_MB: int = env_int("MEDIA_TOOLBOX_DECODE_BUDGET_MB", 2048, minimum=0)
+
+# 每像素估算字节数：BGR 原图 3 字节，另加 HSV / 灰度转换与金字塔层级的临时数组
+_BYTES_PER_PIXEL: int = 5
+# 读不到尺寸（TIFF / RAW / 损坏的文件头）时，按压缩后大小的倍数粗估
+_UNKNOWN_EXPANSION: int = 12
+# JPEG DCT 缩放解码的倍数（与 thumbnails._REDUCED_FLAGS 一致）
+_REDUCED_FACTORS = (8, 4, 2)
+
+# 已知的主图尺寸 {路径: (宽, 高)}，由检测流程从照片库的 imageWidth / imageHeight 载入
+_dimension_hints: Dict[str, Tuple[int, int]] = {}
+
+
+def set_dimension_hints(hints: Dict[str, Tuple[int, int]]) -> None:
+    """整体替换已知尺寸表（RAW 不使用：库里记的是预览尺寸，压缩字节数仍要读文件）。"""
+    global _dimension_hints
+    _dimension_hints = dict(hints)
+
+
+def estimate_decode_bytes(file_path: str, max_px: Optional[int] = None) -> int:
+    """
+    估算解码 file_path 的内存占用（字节）。
+
+    max_px 给出时按缩略图快速路径估算：JPEG 以不小于 max_px 的最大 DCT 缩放倍数解码，其他格式仍需完整解码。
+    文件不可读时返回 0（后续的真实读取会自行报错）。
+    """
+    hinted = None if is_raw(file_path) else _dimension_hints.get(file_path)
+    try:
+        if hinted is not None:
+            size = os.path.getsize(file_path)
+            head = b""
+        elif is_raw(file_path):
+            # RAW 只解码内嵌的 JPEG 预览：按预览的帧头与字节数估算
+            preview = find_raw_preview(file_path)
+            if preview is None:
+                return 0
+            size = preview.length
+            with open(file_path, "rb") as f:
+                f.seek(preview.offset)
+                head = f.read(min(preview.length, HEADER_BYTES))
+        else:
+            size = os.path.getsize(file_path)
+            with open(file_path, "rb") as f:
+                head = f.read(HEADER_BYTES)
+    except OSError:
+        return 0
+
+    dims = hinted or image_dimensions(head)
+    if dims is None:
+        return size * _UNKNOWN_EXPANSION
+    width, height = dims
+    is_jpeg = file_path.lower().endswith((".jpg", ".jpeg")) if hinted else head[:2] == b"\xff\xd8"
+    if max_px is not None and is_jpeg:
+        for factor in _REDUCED_FACTORS:
+            if -(-max(width, height) // factor) >= max_px:
+                width, height = -(-width // factor), -(-height // factor)
+                break
+    # 压缩数据本身也整块读进内存（np.fromfile）
+    return width * height * _BYTES_PER_PIXEL + size
+
+
+class MemoryAdmission:
+    """
+    按字节预算放行的计数闸门（线程安全）。
+
+    排队最久的请求会预留自己的额度：之后到达的小请求只能使用预算中扣除这份预留后的部分，
+    在途解码逐步释放后它一定能被放行，不会被源源不断的小文件饿死。
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._active = 0
+        self._waiters: Deque[Tuple[object, int]] = deque()
+        self.peak_bytes = 0
+        self.waits = 0
+
+    def acquire(self, cost: int) -> None:
+        with self._cond:
+            if not self._fits(cost, None):
+                ticket = object()
+                self._waiters.append((ticket, cost))
+                self.waits += 1
+                while not self._fits(cost, ticket):
+                    self._cond.wait()
+                self._waiters.remove((ticket, cost))
+                # 队首变化后其他等待者的预留条件随之改变
+                self._cond.notify_all()
+            self._in_flight += cost
+            self._active += 1
+            self.peak_bytes = max(self.peak_bytes, self._in_flight)
+
+    def release(self, cost: int) -> None:
+        with self._cond:
+            self._in_flight -= cost
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _fits(self, cost: int, ticket: Optional[object]) -> bool:
+        head = self._waiters[0] if self._waiters else None
+        is_head = head is not None and head[0] is ticket
+        # 没有在途任务时队首（或无人排队时的新请求）总是放行：超预算的文件独占执行，而不是永远等待
+        if self._active == 0 and (head is None or is_head):
+            return True
+        reserved = min(head[1], self.budget_bytes) if head is not None and not is_head else 0
+        return self._in_flight + cost + reserved <= self.budget_bytes
+
+    @contextmanager
+    def admit(self, cost: int) -> Iterator[None]:
+        self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "in_flight_bytes": self._in_flight,
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "peak_bytes": self.peak_bytes,
+                "waits": self.waits,
+            }
+
+
+# 进程内共享的解码预算
+decode_admission = MemoryAdmission(DECODE_BUDGET_MB * 1024 * 1024)
+
+
+@contextmanager
+def admit_decode(file_path: str, max_px: Optional[int] = None) -> Iterator[None]:
+    """在共享预算内解码 file_path（估算见 estimate_decode_bytes）。"""
+    with decode_admission.admit(estimate_decode_bytes(file_path, max_px)):
+        yield
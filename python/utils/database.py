@@ -1,6 +1,6 @@
 import os
 import sqlite3
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 
 import json
 import numpy as np
@@ -26,6 +26,69 @@ def _connect(db_path: str) -> sqlite3.Connection:
     return conn
 
 
+# Python 侧新增的 per-image 列。Electron 侧 initializeDatabase 也会补齐同名列，
+# 这里再兜底一次：旧版本前端创建的库、或脱离 Electron 单独运行检测时列可能尚不存在
+_EXTRA_COLUMNS: List[Tuple[str, str]] = [
+    ("sharpness", "REAL"),
+    # 64 位 dHash（utils/phash.py），按有符号 INTEGER 存储
+    ("dHash", "INTEGER"),
+    # 字节完全相同的孪生副本指向主副本的 filePath（utils/dedup.py），非重复为 NULL
+    ("duplicateOf", "TEXT"),
+    # EXIF DateTimeOriginal（utils/exif.py 只读文件头解析），按 UTC 换算的秒数，仅用于比较时间差
+    ("captureTime", "REAL"),
+    # 文件头元数据（utils/metadata.py）：主图尺寸（编码方向）、EXIF 方向、相机 / 镜头、内嵌 JPEG 缩略图位置
+    ("imageWidth", "INTEGER"),
+    ("imageHeight", "INTEGER"),
+    ("orientation", "INTEGER"),
+    ("cameraMake", "TEXT"),
+    ("cameraModel", "TEXT"),
+    ("lensModel", "TEXT"),
+    ("thumbOffset", "INTEGER"),
+    ("thumbLength", "INTEGER"),
+    # 曝光指标（utils/exposure.py 由已缓存直方图推导）
+    ("clipHighlights", "REAL"),
+    ("clipShadows", "REAL"),
+    ("meanBrightness", "REAL"),
+    ("saturationSpread", "REAL"),
+    # 人脸汇总（utils/ranking.py 由 faceData 汇总），排序时只读数值列
+    ("faceCount", "INTEGER"),
+    ("eyeOpenMin", "REAL"),
+    ("eyeOpenMean", "REAL"),
+    ("faceScore", "REAL"),
+    # 组内综合排序（utils/ranking.py）：加权分数与组内名次（0 = 最佳）
+    ("rankScore", "REAL"),
+    ("groupRank", "INTEGER"),
+]
+
+
+def dhash_to_db(value: int) -> int:
+    """无符号 64 位 dHash -> SQLite INTEGER（有符号 64 位）。"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def dhash_from_db(value: int) -> int:
+    """SQLite INTEGER -> 无符号 64 位 dHash。"""
+    return value + (1 << 64) if value < 0 else value
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """幂等补齐 present / previous 表中 Python 侧依赖的新增列（表不存在时跳过，由前端建表）。"""
+    for table in ("present", "previous"):
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if not existing:
+            continue
+        for name, decl in _EXTRA_COLUMNS:
+            if name in existing:
+                continue
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+            except sqlite3.OperationalError as e:
+                # Electron 侧可能同时在补列，duplicate column name 属预期可忽略
+                if "duplicate column name" not in str(e):
+                    raise
+    conn.commit()
+
+
 def load_cache_from_db(db_path: str, show_disabled_photos: bool):
     """
     Load all images and cached similarity/IQA/HSV histograms from the database.
@@ -42,14 +105,23 @@ def load_cache_from_db(db_path: str, show_disabled_photos: bool):
         Per-image centered HSV histograms, if already cached in DB.
     iqa_cache : Dict[str, float]
         Per-image IQA score, if already cached in DB.
+    face_cache : Dict[str, dict]
+        Per-image face detection result, if already cached in DB.
+    sharpness_cache : Dict[str, float]
+        Per-image cheap sharpness score (Laplacian variance), if already cached in DB.
+    dhash_cache : Dict[str, int]
+        Per-image unsigned 64-bit dHash, if already cached in DB.
+    capture_cache : Dict[str, float]
+        Per-image EXIF capture time in seconds, if already cached in DB.
     """
     conn = _connect(db_path)
+    ensure_schema(conn)
     cursor = conn.cursor()
 
     # 始终读取所有照片（启用/未启用），后续再根据 isEnabled 控制参与计算与否
     cursor.execute(
         """
-    SELECT filePath, simRefPath, similarity, IQA, isEnabled, histH, histS, histV, faceData
+    SELECT filePath, simRefPath, similarity, IQA, isEnabled, histH, histS, histV, faceData, sharpness, dHash, captureTime
         FROM present
         ORDER BY id ASC
         """
@@ -63,6 +135,9 @@ def load_cache_from_db(db_path: str, show_disabled_photos: bool):
     hist_cache: Dict[str, HSVHist] = {}
     iqa_cache: Dict[str, float] = {}
     face_cache: Dict[str, dict] = {}
+    sharpness_cache: Dict[str, float] = {}
+    dhash_cache: Dict[str, int] = {}
+    capture_cache: Dict[str, float] = {}
 
     for row in rows:
         (
@@ -75,6 +150,9 @@ def load_cache_from_db(db_path: str, show_disabled_photos: bool):
             hist_s,
             hist_v,
             face_data,
+            sharpness,
+            dhash,
+            capture_time,
         ) = row
 
         if file_path not in image_files:
@@ -91,6 +169,15 @@ def load_cache_from_db(db_path: str, show_disabled_photos: bool):
         if iqa_value is not None:
             iqa_cache[file_path] = float(iqa_value)
 
+        if sharpness is not None:
+            sharpness_cache[file_path] = float(sharpness)
+
+        if dhash is not None:
+            dhash_cache[file_path] = dhash_from_db(int(dhash))
+
+        if capture_time is not None:
+            capture_cache[file_path] = float(capture_time)
+
         # faceData JSON
         if face_data is not None:
             try:
@@ -110,7 +197,17 @@ def load_cache_from_db(db_path: str, show_disabled_photos: bool):
                 # 如果解码失败，则忽略，后续重新计算
                 pass
 
-    return cache_data, image_files, enabled_map, hist_cache, iqa_cache, face_cache
+    return (
+        cache_data,
+        image_files,
+        enabled_map,
+        hist_cache,
+        iqa_cache,
+        face_cache,
+        sharpness_cache,
+        dhash_cache,
+        capture_cache,
+    )
 
 
 def save_cache_to_db(
@@ -119,9 +216,11 @@ def save_cache_to_db(
     hist_cache: Dict[str, HSVHist],
     iqa_cache: Dict[str, float],
     face_cache: Dict[str, dict],
+    sharpness_cache: Optional[Dict[str, float]] = None,
+    dhash_cache: Optional[Dict[str, int]] = None,
 ) -> None:
     """
-    Persist per-image HSV histograms and IQA scores into the database.
+    Persist per-image HSV histograms, IQA / sharpness scores and face data into the database.
 
     Pair-level similarity / simRefPath are already written during computation
     (process_pair_batch 中已更新 present 表)，
@@ -131,7 +230,15 @@ def save_cache_to_db(
     cursor = conn.cursor()
 
     # 对所有有 histogram、IQA 或人脸数据的图片进行更新
-    all_files = set(hist_cache.keys()) | set(iqa_cache.keys()) | set(face_cache.keys())
+    sharpness_cache = sharpness_cache or {}
+    dhash_cache = dhash_cache or {}
+    all_files = (
+        set(hist_cache.keys())
+        | set(iqa_cache.keys())
+        | set(face_cache.keys())
+        | set(sharpness_cache.keys())
+        | set(dhash_cache.keys())
+    )
 
     for file_path in all_files:
         h_blob = s_blob = v_blob = None
@@ -222,6 +329,18 @@ def save_cache_to_db(
                     """,
                     (face_json, row_id),
                 )
+
+            # 清晰度 / dHash 与上面的组合互不影响，单独更新，避免再翻倍 UPDATE 分支
+            if file_path in sharpness_cache:
+                cursor.execute(
+                    "UPDATE present SET sharpness = ? WHERE id = ?",
+                    (float(sharpness_cache[file_path]), row_id),
+                )
+            if file_path in dhash_cache:
+                cursor.execute(
+                    "UPDATE present SET dHash = ? WHERE id = ?",
+                    (dhash_to_db(dhash_cache[file_path]), row_id),
+                )
         else:
             # 该 file_path 目前在 present 中不存在，插入一条最小信息记录
             cursor.execute(
@@ -240,9 +359,11 @@ def save_cache_to_db(
                     histH,
                     histS,
                     histV,
-                    faceData
+                    faceData,
+                    sharpness,
+                    dHash
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     os.path.basename(file_path),
@@ -259,6 +380,8 @@ def save_cache_to_db(
                     s_blob,
                     v_blob,
                     face_json,
+                    sharpness_cache.get(file_path),
+                    dhash_to_db(dhash_cache[file_path]) if file_path in dhash_cache else None,
                 ),
             )
 
@@ -0,0 +1,130 @@
+"""
+字节级完全重复检测：在任何解码之前找出同一文件的多份拷贝（重复导入同一张卡、导入重叠文件夹）。
+
+三级筛选，越往后越贵、候选越少：
+  1. 文件大小：大小不同的文件不可能相同，只 stat 不读内容；
+  2. 部分哈希：大小相同的文件只读首尾各 64 KB；
+  3. 全量哈希：部分哈希也相同的候选才完整读一遍（文件本身不超过 128 KB 时部分哈希即全量）。
+同一组完全相同的文件以导入顺序中的第一张为主副本，其余为孪生副本：特征只为主副本计算，再直接拷贝。
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+PARTIAL_BYTES: int = 64 * 1024
+_CHUNK_BYTES: int = 1024 * 1024
+# 哈希以 IO 为主（hashlib 处理大块数据时释放 GIL），少量线程即可吃满磁盘
+_HASH_WORKERS: int = min(8, os.cpu_count() or 1)
+
+
+def _partial_hash(path: str, size: int) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size <= 2 * PARTIAL_BYTES:
+            h.update(f.read())
+        else:
+            h.update(f.read(PARTIAL_BYTES))
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+            h.update(f.read(PARTIAL_BYTES))
+    return h.digest()
+
+
+def _full_hash(path: str) -> bytes:
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def _safe(fn: Callable[[str], bytes]) -> Callable[[str], Optional[bytes]]:
+    # 读取失败（文件被移走、权限问题）的文件不参与去重，按普通照片处理
+    def wrapped(path: str) -> Optional[bytes]:
+        try:
+            return fn(path)
+        except OSError as e:
+            print(f"[DEDUP] skip {path}: {e}")
+            return None
+
+    return wrapped
+
+
+def _refine(
+    groups: List[List[str]],
+    key_fn: Callable[[str], bytes],
+) -> List[List[str]]:
+    """对每个候选组内的文件并行计算 key_fn，按结果再细分，只保留成员数 >= 2 的子组（保持原有顺序）。"""
+    flat = [p for g in groups for p in g]
+    if not flat:
+        return []
+    with ThreadPoolExecutor(max_workers=_HASH_WORKERS) as executor:
+        keys = list(executor.map(_safe(key_fn), flat))
+
+    refined: List[List[str]] = []
+    offset = 0
+    for group in groups:
+        buckets: Dict[bytes, List[str]] = {}
+        for path, key in zip(group, keys[offset : offset + len(group)]):
+            if key is not None:
+                buckets.setdefault(key, []).append(path)
+        offset += len(group)
+        refined.extend(b for b in buckets.values() if len(b) >= 2)
+    return refined
+
+
+def find_exact_duplicates(paths: Sequence[str]) -> Dict[str, str]:
+    """
+    返回 {孪生副本 filePath: 主副本 filePath}；主副本为 paths 顺序中第一次出现的那一份。
+    没有重复时返回空 dict。
+    """
+    by_size: Dict[int, List[str]] = {}
+    for path in dict.fromkeys(paths):
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            continue
+        by_size.setdefault(size, []).append(path)
+
+    candidates = [g for g in by_size.values() if len(g) >= 2]
+    if not candidates:
+        return {}
+
+    sizes: Dict[str, int] = {p: size for size, g in by_size.items() for p in g}
+    groups = _refine(candidates, lambda p: _partial_hash(p, sizes[p]))
+
+    # 部分哈希已覆盖整个文件的小文件无需再做全量哈希
+    small = [g for g in groups if sizes[g[0]] <= 2 * PARTIAL_BYTES]
+    large = [g for g in groups if sizes[g[0]] > 2 * PARTIAL_BYTES]
+    groups = small + _refine(large, _full_hash)
+
+    duplicate_of: Dict[str, str] = {}
+    for group in groups:
+        primary = group[0]
+        for twin in group[1:]:
+            duplicate_of[twin] = primary
+    return duplicate_of
+
+
+def twins_by_primary(duplicate_of: Dict[str, str]) -> Dict[str, List[str]]:
+    """{孪生: 主} -> {主: [孪生, ...]}。"""
+    out: Dict[str, List[str]] = {}
+    for twin, primary in duplicate_of.items():
+        out.setdefault(primary, []).append(twin)
+    return out
+
+
+def restrict_duplicates(duplicate_of: Dict[str, str], paths: Sequence[str]) -> Dict[str, str]:
+    """
+    把 {孪生: 主} 限制在 paths 之内：每组中第一个出现在 paths 里的成员成为新的主副本。
+
+    重复检查覆盖整个照片库，而特征只为启用的照片计算；主副本被禁用时由组内下一张启用的副本接替。
+    """
+    wanted = set(paths)
+    out: Dict[str, str] = {}
+    for primary, twins in twins_by_primary(duplicate_of).items():
+        members = [p for p in [primary, *twins] if p in wanted]
+        for twin in members[1:]:
+            out[twin] = members[0]
+    return out
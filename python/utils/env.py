@@ -0,0 +1,38 @@
+"""
+MEDIA_TOOLBOX_* 环境变量的数值解析。
+
+这些开关都在模块导入时读取；直接 int()/float() 时一个拼错的值（"64MB"、"0,5"）会让 import 抛异常，
+整个后端起不来，而且报错里看不出是哪个变量。这里解析失败只打印一行警告并使用默认值。
+"""
+
+import os
+from typing import Optional
+
+
+def _env_number(name: str, default, cast, minimum):
+    raw = os.environ.get(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        value = cast(raw.strip())
+    except ValueError:
+        print(f"[ENV] invalid {name}={raw!r}, using default {default}")
+        return default
+    if minimum is not None and value < minimum:
+        print(f"[ENV] {name}={raw!r} is below {minimum}, using {minimum}")
+        return minimum
+    return value
+
+
+def env_int(name: str, default: int, minimum: Optional[int] = None) -> int:
+    """读取整数环境变量；未设置或无法解析时返回 default，低于 minimum 时取 minimum。"""
+    return _env_number(name, default, int, minimum)
+
+
+def env_float(name: str, default: float, minimum: Optional[float] = None) -> float:
+    """读取浮点环境变量；未设置或无法解析（含 nan）时返回 default，低于 minimum 时取 minimum。"""
+    value = _env_number(name, default, float, minimum)
+    if value != value:
+        print(f"[ENV] invalid {name}=nan, using default {default}")
+        return default
+    return value
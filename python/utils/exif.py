@@ -0,0 +1,410 @@
+"""
+只读文件头的 EXIF 解析：拍摄时间、相机 / 镜头、方向、内嵌缩略图（不解码主图像素、不依赖第三方库）。
+
+分组阶段只需要 DateTimeOriginal 判断相邻照片的时间间隔：JPEG 的 APP1 段、WebP 的 EXIF 块、
+PNG 的 eXIf 块以及 TIFF 结构的 RAW（DNG / NEF / CR2 / ARW ...）都把它放在文件开头几十 KB 内，
+读一小段字节、走一遍 TIFF IFD 即可，比解码整张图快几个数量级，整库并行读取也只受磁盘 IO 限制。
+同一段文件头里还有 IFD1 内嵌的 JPEG 缩略图与 SOF 帧头尺寸，缩略图快速路径（utils/thumbnails.py）直接复用。
+"""
+
+import calendar
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Dict, NamedTuple, Optional, Sequence, Tuple
+
+# 文件开头读取的字节数：APP1（EXIF 最大 64 KB）通常紧随 SOI，少数相机前面还有 APP0 / JFIF
+HEADER_BYTES: int = 128 * 1024
+_READ_WORKERS: int = min(16, (os.cpu_count() or 1) * 2)
+# WebP 按 RIFF 块头逐个 seek 查找 EXIF 块时最多看的块数（VP8X / ICCP / ANIM / ANMF... 正常只有几个）
+_MAX_WEBP_CHUNKS: int = 64
+
+_TAG_EXIF_IFD = 0x8769
+_TAG_IMAGE_WIDTH = 0x0100
+_TAG_IMAGE_LENGTH = 0x0101
+_TAG_MAKE = 0x010F
+_TAG_MODEL = 0x0110
+_TAG_LENS_MODEL = 0xA434
+_TAG_DATETIME = 0x0132
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_DATETIME_DIGITIZED = 0x9004
+_TAG_SUBSEC_ORIGINAL = 0x9291
+_TAG_ORIENTATION = 0x0112
+_TAG_JPEG_OFFSET = 0x0201
+_TAG_JPEG_LENGTH = 0x0202
+
+# JPEG 帧头（SOFn）标记：C4 / C8 / CC 是 DHT / JPG / DAC，不是帧头
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _tiff_endian(tiff: bytes) -> Optional[str]:
+    """TIFF 头 -> struct 字节序前缀；不是合法 TIFF 时返回 None。"""
+    if len(tiff) < 8:
+        return None
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return None
+    if struct.unpack_from(endian + "H", tiff, 2)[0] != 42:
+        return None
+    return endian
+
+
+def _read_ifd(tiff: bytes, endian: str, offset: int) -> Tuple[Dict[int, bytes], int]:
+    """读取一个 IFD，返回 ({tag: 原始值字节}, 下一个 IFD 的偏移)；只取 ASCII 与单值 SHORT / LONG 标签。"""
+    entries: Dict[int, bytes] = {}
+    if offset <= 0 or offset + 2 > len(tiff):
+        return entries, 0
+    count = struct.unpack_from(endian + "H", tiff, offset)[0]
+    for i in range(count):
+        pos = offset + 2 + i * 12
+        if pos + 12 > len(tiff):
+            return entries, 0
+        tag, typ, n = struct.unpack_from(endian + "HHI", tiff, pos)
+        if typ == 2:  # ASCII
+            if n <= 4:
+                entries[tag] = tiff[pos + 8 : pos + 8 + n]
+            else:
+                value_offset = struct.unpack_from(endian + "I", tiff, pos + 8)[0]
+                entries[tag] = tiff[value_offset : value_offset + n]
+        elif typ == 3 and n == 1:  # SHORT
+            entries[tag] = tiff[pos + 8 : pos + 10]
+        elif typ in (4, 13) and n == 1:  # LONG / IFD
+            entries[tag] = tiff[pos + 8 : pos + 12]
+    next_pos = offset + 2 + count * 12
+    next_offset = struct.unpack_from(endian + "I", tiff, next_pos)[0] if next_pos + 4 <= len(tiff) else 0
+    return entries, next_offset
+
+
+def _int_value(raw: bytes, endian: str) -> int:
+    return struct.unpack(endian + ("H" if len(raw) == 2 else "I"), raw)[0]
+
+
+def _ascii_value(raw: Optional[bytes]) -> Optional[str]:
+    """ASCII 标签值 -> 去掉结尾 NUL 与空白的字符串；空值返回 None。"""
+    if not raw:
+        return None
+    text = raw.split(b"\x00", 1)[0].decode("utf-8", errors="replace").strip()
+    return text or None
+
+
+def _tiff_ifds(tiff: bytes, endian: str) -> Tuple[Dict[int, bytes], int, Dict[int, bytes]]:
+    """读取 IFD0 与 Exif 子 IFD，返回 (IFD0, IFD1 偏移, Exif IFD)。"""
+    ifd0, ifd1_offset = _read_ifd(tiff, endian, struct.unpack_from(endian + "I", tiff, 4)[0])
+    exif_ifd: Dict[int, bytes] = {}
+    if _TAG_EXIF_IFD in ifd0:
+        exif_ifd, _ = _read_ifd(tiff, endian, _int_value(ifd0[_TAG_EXIF_IFD], endian))
+    return ifd0, ifd1_offset, exif_ifd
+
+
+def _tiff_datetime(tiff: bytes) -> Optional[float]:
+    """解析 TIFF 结构（EXIF 载荷），返回拍摄时间（秒）；优先 DateTimeOriginal，依次回退。"""
+    endian = _tiff_endian(tiff)
+    if endian is None:
+        return None
+    ifd0, _, exif_ifd = _tiff_ifds(tiff, endian)
+    return _ifd_datetime(ifd0, exif_ifd)
+
+
+def _ifd_datetime(ifd0: Dict[int, bytes], exif_ifd: Dict[int, bytes]) -> Optional[float]:
+    """优先 Exif IFD 的 DateTimeOriginal，依次回退到 DateTimeDigitized、IFD0 的 DateTime。"""
+    for tag, ifd in (
+        (_TAG_DATETIME_ORIGINAL, exif_ifd),
+        (_TAG_DATETIME_DIGITIZED, exif_ifd),
+        (_TAG_DATETIME, ifd0),
+    ):
+        raw = ifd.get(tag)
+        if not raw:
+            continue
+        seconds = _parse_exif_datetime(raw)
+        if seconds is None:
+            continue
+        # 亚秒字段让同一秒内的连拍也能排出先后
+        subsec = exif_ifd.get(_TAG_SUBSEC_ORIGINAL) if tag == _TAG_DATETIME_ORIGINAL else None
+        if subsec:
+            digits = subsec.split(b"\x00", 1)[0].strip()
+            if digits.isdigit():
+                seconds += int(digits) / (10 ** len(digits))
+        return seconds
+    return None
+
+
+def _parse_exif_datetime(raw: bytes) -> Optional[float]:
+    """'YYYY:MM:DD HH:MM:SS' -> 秒。EXIF 不带时区，按 UTC 换算：只用于比较时间差，不受本地夏令时影响。"""
+    text = raw.split(b"\x00", 1)[0].decode("ascii", errors="ignore").strip()
+    try:
+        dt = datetime.strptime(text[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    return float(calendar.timegm(dt.timetuple()))
+
+
+def _find_exif_payload(head: bytes) -> Optional[bytes]:
+    """从文件头字节中定位 TIFF 结构的 EXIF 载荷。"""
+    span = _exif_payload_span(head)
+    return head[span[0] : span[1]] if span is not None else None
+
+
+def _exif_payload_span(head: bytes) -> Optional[Tuple[int, int]]:
+    """EXIF 载荷在文件头中的 [起始, 结束) 位置（载荷内的偏移加上起始即为文件内偏移）。"""
+    if head[:2] == b"\xff\xd8":
+        # JPEG：逐段跳过，直到 APP1 "Exif\0\0" 或图像数据开始（SOS）
+        pos = 2
+        while pos + 4 <= len(head):
+            if head[pos] != 0xFF:
+                return None
+            marker = head[pos + 1]
+            if marker == 0xFF:  # 填充字节
+                pos += 1
+                continue
+            if marker == 0xDA:  # SOS：之后是熵编码数据，不会再有 EXIF
+                return None
+            length = struct.unpack_from(">H", head, pos + 2)[0]
+            if marker == 0xE1 and head[pos + 4 : pos + 10] == b"Exif\x00\x00":
+                return pos + 10, pos + 2 + length
+            pos += 2 + length
+        return None
+
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        # TIFF / 大多数 RAW：整个文件就是 TIFF 结构
+        return 0, len(head)
+
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        pos = 12
+        while pos + 8 <= len(head):
+            fourcc = head[pos : pos + 4]
+            size = struct.unpack_from("<I", head, pos + 4)[0]
+            if fourcc == b"EXIF":
+                start = pos + 8
+                if head[start : start + 6] == b"Exif\x00\x00":
+                    return start + 6, pos + 8 + size
+                return start, pos + 8 + size
+            pos += 8 + size + (size & 1)
+        return None
+
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        pos = 8
+        while pos + 8 <= len(head):
+            size, ctype = struct.unpack_from(">I4s", head, pos)
+            if ctype == b"eXIf":
+                return pos + 8, pos + 8 + size
+            if ctype == b"IDAT":
+                return None
+            pos += 12 + size
+        return None
+
+    return None
+
+
+def _webp_exif_span(f: BinaryIO, head: bytes) -> Optional[Tuple[int, int]]:
+    """
+    WebP 的 EXIF 块在文件中的 [起始, 结束) 位置。
+
+    libwebp 把 EXIF 块写在图像数据之后，通常远超 HEADER_BYTES：块头在 head 内时直接读 head，
+    之外的块头 seek 过去只读 8 字节，跳过的图像数据本身一个字节也不读。
+    """
+    riff_end = 8 + struct.unpack_from("<I", head, 4)[0]
+    pos = 12
+    for _ in range(_MAX_WEBP_CHUNKS):
+        if pos + 8 > riff_end:
+            return None
+        if pos + 8 <= len(head):
+            chunk_header = head[pos : pos + 8]
+        else:
+            f.seek(pos)
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+        fourcc = chunk_header[:4]
+        size = struct.unpack_from("<I", chunk_header, 4)[0]
+        if fourcc == b"EXIF":
+            return pos + 8, pos + 8 + size
+        pos += 8 + size + (size & 1)
+    return None
+
+
+def read_exif_payload(f: BinaryIO, head: bytes) -> Optional[Tuple[int, bytes]]:
+    """
+    定位并读取 EXIF 载荷，返回 (载荷在文件中的偏移, TIFF 结构字节)；没有 EXIF 时返回 None。
+
+    head 是 f 开头的 HEADER_BYTES；JPEG / TIFF / PNG 的 EXIF 都在 head 内，WebP 按块头 seek 查找，
+    载荷最多读 HEADER_BYTES。
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) >= 12:
+        span = _webp_exif_span(f, head)
+        if span is None:
+            return None
+        start, end = span
+        if end <= len(head):
+            payload = head[start:end]
+        else:
+            f.seek(start)
+            payload = f.read(min(end - start, HEADER_BYTES))
+        if payload[:6] == b"Exif\x00\x00":
+            return start + 6, payload[6:]
+        return start, payload
+    span = _exif_payload_span(head)
+    return (span[0], head[span[0] : span[1]]) if span is not None else None
+
+
+def embedded_thumbnail(head: bytes) -> Optional[Tuple[bytes, int]]:
+    """
+    JPEG 文件头中 EXIF IFD1 内嵌的缩略图，返回 (JPEG 字节, IFD0 Orientation)。
+
+    内嵌缩略图是相机按传感器方向存的（通常 160x120），不会随 Orientation 旋转，由调用方按需转正。
+    """
+    if head[:2] != b"\xff\xd8":
+        return None
+    payload = _find_exif_payload(head)
+    endian = _tiff_endian(payload) if payload else None
+    if endian is None:
+        return None
+    try:
+        ifd0, ifd1_offset = _read_ifd(payload, endian, struct.unpack_from(endian + "I", payload, 4)[0])
+        ifd1, _ = _read_ifd(payload, endian, ifd1_offset)
+    except struct.error:
+        return None
+    if _TAG_JPEG_OFFSET not in ifd1 or _TAG_JPEG_LENGTH not in ifd1:
+        return None
+    start = _int_value(ifd1[_TAG_JPEG_OFFSET], endian)
+    length = _int_value(ifd1[_TAG_JPEG_LENGTH], endian)
+    data = payload[start : start + length]
+    if length <= 0 or len(data) != length or data[:2] != b"\xff\xd8":
+        return None
+    orientation = _int_value(ifd0[_TAG_ORIENTATION], endian) if _TAG_ORIENTATION in ifd0 else 1
+    return data, orientation
+
+
+def jpeg_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    """从 JPEG 文件头的 SOF 帧头读取主图 (宽, 高)（未应用 Orientation）；不是 JPEG 或帧头不在 head 内时返回 None。"""
+    if head[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 9 <= len(head):
+        if head[pos] != 0xFF:
+            return None
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack_from(">HH", head, pos + 5)
+            return (width, height) if width and height else None
+        if marker == 0xDA:
+            return None
+        pos += 2 + struct.unpack_from(">H", head, pos + 2)[0]
+    return None
+
+
+def image_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    """从文件头读取 JPEG / PNG / WebP 主图的 (宽, 高)（不解码像素）；其他格式或读不到时返回 None。"""
+    if head[:2] == b"\xff\xd8":
+        return jpeg_dimensions(head)
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR" and len(head) >= 24:
+        width, height = struct.unpack_from(">II", head, 16)
+        return (width, height) if width and height else None
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) >= 30:
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            # 有损：关键帧起始码 9D 01 2A 之后是 14 位宽高
+            width, height = struct.unpack_from("<HH", head, 26)
+            return (width & 0x3FFF, height & 0x3FFF)
+        if chunk == b"VP8L":
+            bits = struct.unpack_from("<I", head, 21)[0]
+            return (1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF))
+        if chunk == b"VP8X":
+            width = int.from_bytes(head[24:27], "little") + 1
+            height = int.from_bytes(head[27:30], "little") + 1
+            return (width, height)
+    return None
+
+
+class HeaderMetadata(NamedTuple):
+    """文件头能给出的全部信息；读不到的字段为 None。"""
+
+    # 主图像素尺寸（编码方向，未应用 Orientation）
+    width: Optional[int]
+    height: Optional[int]
+    orientation: Optional[int]
+    # 拍摄时间（秒，见 _parse_exif_datetime）
+    capture_time: Optional[float]
+    make: Optional[str]
+    model: Optional[str]
+    lens: Optional[str]
+    # 内嵌 JPEG 缩略图在文件中的偏移与长度（相对 head 起点）
+    thumb_offset: Optional[int]
+    thumb_length: Optional[int]
+
+
+def parse_header_metadata(head: bytes, exif: Optional[Tuple[int, bytes]] = None) -> HeaderMetadata:
+    """
+    从文件头字节解析尺寸、方向、拍摄时间、相机 / 镜头与内嵌缩略图位置（JPEG / TIFF / WebP / PNG）。
+
+    只走 SOF / IHDR / VP8 帧头与 EXIF 的 IFD0、Exif IFD、IFD1，不解码像素；损坏的结构只会让对应字段为 None。
+    exif 为 read_exif_payload 的结果（EXIF 不在 head 内的 WebP）；缺省时在 head 中查找。
+    """
+    dims = image_dimensions(head)
+    orientation = capture_time = make = model = lens = thumb_offset = thumb_length = None
+    if exif is None:
+        span = _exif_payload_span(head)
+        exif = (span[0], head[span[0] : span[1]]) if span is not None else None
+    if exif is not None:
+        start, payload = exif
+        endian = _tiff_endian(payload)
+        if endian is not None:
+            try:
+                ifd0, ifd1_offset, exif_ifd = _tiff_ifds(payload, endian)
+                ifd1, _ = _read_ifd(payload, endian, ifd1_offset)
+            except struct.error:
+                ifd0, ifd1, exif_ifd = {}, {}, {}
+            if _TAG_ORIENTATION in ifd0:
+                orientation = _int_value(ifd0[_TAG_ORIENTATION], endian)
+            capture_time = _ifd_datetime(ifd0, exif_ifd)
+            make = _ascii_value(ifd0.get(_TAG_MAKE))
+            model = _ascii_value(ifd0.get(_TAG_MODEL))
+            lens = _ascii_value(exif_ifd.get(_TAG_LENS_MODEL))
+            if _TAG_JPEG_OFFSET in ifd1 and _TAG_JPEG_LENGTH in ifd1:
+                thumb_offset = start + _int_value(ifd1[_TAG_JPEG_OFFSET], endian)
+                thumb_length = _int_value(ifd1[_TAG_JPEG_LENGTH], endian)
+            # TIFF 没有帧头，尺寸在 IFD0 里
+            if dims is None and start == 0 and _TAG_IMAGE_WIDTH in ifd0 and _TAG_IMAGE_LENGTH in ifd0:
+                dims = (_int_value(ifd0[_TAG_IMAGE_WIDTH], endian), _int_value(ifd0[_TAG_IMAGE_LENGTH], endian))
+    return HeaderMetadata(
+        dims[0] if dims else None,
+        dims[1] if dims else None,
+        orientation,
+        capture_time,
+        make,
+        model,
+        lens,
+        thumb_offset,
+        thumb_length,
+    )
+
+
+def read_header_metadata(f: BinaryIO) -> HeaderMetadata:
+    """从已打开的文件读取文件头并解析（WebP 的 EXIF 块按块头 seek 定位）。"""
+    head = f.read(HEADER_BYTES)
+    return parse_header_metadata(head, read_exif_payload(f, head))
+
+
+def read_capture_time(file_path: str) -> Optional[float]:
+    """读取单个文件的拍摄时间（秒，见 _parse_exif_datetime）；无 EXIF 或解析失败时返回 None。"""
+    try:
+        with open(file_path, "rb") as f:
+            exif = read_exif_payload(f, f.read(HEADER_BYTES))
+        return _tiff_datetime(exif[1]) if exif else None
+    except (OSError, struct.error, ValueError) as e:
+        print(f"[EXIF] failed to read {file_path}: {e}")
+        return None
+
+
+def read_capture_times(file_paths: Sequence[str]) -> Dict[str, Optional[float]]:
+    """并行读取多个文件的拍摄时间（纯 IO，线程数可以高于 CPU 核数）。"""
+    if not file_paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=_READ_WORKERS) as executor:
+        return dict(zip(file_paths, executor.map(read_capture_time, file_paths)))
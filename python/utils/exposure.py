@@ -0,0 +1,116 @@
+"""
+曝光指标：直接由数据库中已缓存的中心化 HSV 直方图推导，不再读取任何图片文件。
+
+present 表里每张照片都存有 histS / histV（归一化后减去均值 1/bins 的 float32 向量），
+加回 1/bins 即得到像素分布 p。整库一次性堆成 (N, bins) 矩阵，
+高光 / 暗部溢出比例、平均亮度、饱和度离散度都只是几次矩阵运算，10 万张照片也在毫秒级完成。
+结果写回 present 表的独立列，前端可直接按列筛选 / 排序。
+"""
+
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .database import BINS, HSVHist, _connect, ensure_schema
+
+# 直方图两端各取 2 个 bin 视为溢出：V 通道 128 bin 覆盖 [0,255]，约对应 <=3 与 >=252 的像素
+CLIP_BINS: int = 2
+
+# 写入 present 表的列名（顺序与 exposure_from_hists 的输出列一致）
+EXPOSURE_COLUMNS: Tuple[str, ...] = ("clipHighlights", "clipShadows", "meanBrightness", "saturationSpread")
+
+
+def _distribution(centered: np.ndarray, bins: int) -> np.ndarray:
+    """中心化直方图 (N, bins) -> 概率分布：加回均值 1/bins，裁掉浮点误差造成的负值后按行重新归一。"""
+    p = np.clip(centered.astype(np.float64) + 1.0 / bins, 0.0, None)
+    total = p.sum(axis=1, keepdims=True)
+    return p / np.where(total > 0.0, total, 1.0)
+
+
+def exposure_from_hists(hist_s: np.ndarray, hist_v: np.ndarray) -> np.ndarray:
+    """
+    批量计算曝光指标。
+
+    hist_s / hist_v: (N, bins) 的中心化 S / V 直方图。
+    返回 (N, 4) float64，列依次为 EXPOSURE_COLUMNS：
+      高光溢出比例、暗部溢出比例、平均亮度 [0,1]、饱和度标准差 [0,1]。
+    """
+    p_v = _distribution(hist_v, hist_v.shape[1])
+    p_s = _distribution(hist_s, hist_s.shape[1])
+
+    centers_v = (np.arange(p_v.shape[1]) + 0.5) / p_v.shape[1]
+    centers_s = (np.arange(p_s.shape[1]) + 0.5) / p_s.shape[1]
+
+    clip_highlights = p_v[:, -CLIP_BINS:].sum(axis=1)
+    clip_shadows = p_v[:, :CLIP_BINS].sum(axis=1)
+    mean_brightness = p_v @ centers_v
+
+    mean_s = p_s @ centers_s
+    saturation_spread = np.sqrt(np.clip(p_s @ (centers_s**2) - mean_s**2, 0.0, None))
+
+    return np.stack([clip_highlights, clip_shadows, mean_brightness, saturation_spread], axis=1)
+
+
+def compute_exposure_metrics(hist_cache: Dict[str, HSVHist]) -> Dict[str, Tuple[float, ...]]:
+    """对内存中的直方图缓存（filePath -> (h, s, v)）批量计算，返回 filePath -> 指标元组。"""
+    if not hist_cache:
+        return {}
+    paths = list(hist_cache.keys())
+    hist_s = np.stack([hist_cache[p][1] for p in paths])
+    hist_v = np.stack([hist_cache[p][2] for p in paths])
+    metrics = exposure_from_hists(hist_s, hist_v)
+    return {p: tuple(float(x) for x in row) for p, row in zip(paths, metrics)}
+
+
+def _load_hists_from_db(conn: sqlite3.Connection) -> Tuple[List[int], np.ndarray, np.ndarray]:
+    """读取 present 表全部有效的 S / V 直方图，直接拼接字节后一次 frombuffer，避免逐行建数组。"""
+    s_bytes = BINS[1] * 4
+    v_bytes = BINS[2] * 4
+    row_ids: List[int] = []
+    s_blobs: List[bytes] = []
+    v_blobs: List[bytes] = []
+    for row_id, hist_s, hist_v in conn.execute(
+        "SELECT id, histS, histV FROM present WHERE histS IS NOT NULL AND histV IS NOT NULL"
+    ):
+        # 长度不符的损坏 blob 直接跳过（检测流程会重新计算直方图）
+        if len(hist_s) != s_bytes or len(hist_v) != v_bytes:
+            continue
+        row_ids.append(row_id)
+        s_blobs.append(hist_s)
+        v_blobs.append(hist_v)
+
+    hist_s = np.frombuffer(b"".join(s_blobs), dtype=np.float32).reshape(-1, BINS[1])
+    hist_v = np.frombuffer(b"".join(v_blobs), dtype=np.float32).reshape(-1, BINS[2])
+    return row_ids, hist_s, hist_v
+
+
+def refresh_exposure_metrics(db_path: str, hist_cache: Optional[Dict[str, HSVHist]] = None) -> int:
+    """
+    计算并写回曝光指标，返回更新的行数。
+
+    hist_cache 为 None 时从数据库读取全部已缓存的直方图（整库刷新）；
+    检测流程结束时直接传入内存中的 hist_cache，省去一次读库。
+    """
+    conn = _connect(db_path)
+    try:
+        ensure_schema(conn)
+        set_clause = ", ".join(f"{col} = ?" for col in EXPOSURE_COLUMNS)
+
+        if hist_cache is None:
+            row_ids, hist_s, hist_v = _load_hists_from_db(conn)
+            if not row_ids:
+                return 0
+            metrics = exposure_from_hists(hist_s, hist_v)
+            params = [(*map(float, row), row_id) for row, row_id in zip(metrics, row_ids)]
+        else:
+            per_file = compute_exposure_metrics(hist_cache)
+            # filePath 没有索引，先一次性取出 id 映射，再按主键批量更新
+            id_map = dict(conn.execute("SELECT filePath, id FROM present").fetchall())
+            params = [(*values, id_map[file_path]) for file_path, values in per_file.items() if file_path in id_map]
+
+        conn.executemany(f"UPDATE present SET {set_clause} WHERE id = ?", params)
+        conn.commit()
+        return len(params)
+    finally:
+        conn.close()
@@ -0,0 +1,183 @@
+"""
+照片分组：相邻相似度切组（默认）与多邻居带状相似度 + 并查集（可选）。
+
+默认规则只比较每张启用照片与前一张：连拍中间一张闪光失败、有人走过的废片就会把一组切成两组。
+窗口模式把每张照片与前 k 张都比较一次——对堆叠后的直方图矩阵按对角带做向量化相关，
+代价 O(N·k·bins)，一千张照片只需几毫秒；相似度达到阈值的 (i, i-j) 连成边，
+用并查集求连通分量作为分组，废片两侧的照片仍通过跨越它的边连在同一组。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .env import env_float, env_int
+from .union_find import UnionFind
+
+HSVHist = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# 多邻居窗口大小：1 即传统的"只与前一张比较"；> 1 时启用带状相似度 + 并查集分组
+SIMILARITY_WINDOW: int = env_int("MEDIA_TOOLBOX_SIMILARITY_WINDOW", 1, minimum=1)
+
+# 拍摄时间间隔门限（秒）：相邻照片的 EXIF 拍摄时间相差超过它时直接开新组、不再计算这一对的相似度；
+# 0 表示关闭。缺少拍摄时间的照片沿用前一张已知的时间（见 fill_capture_times）
+GROUP_TIME_GAP: float = env_float("MEDIA_TOOLBOX_GROUP_TIME_GAP", 0.0)
+
+
+def fill_capture_times(capture_times: Sequence[Optional[float]]) -> List[Optional[float]]:
+    """
+    缺失的拍摄时间用前一张已知时间补齐（开头的缺失保持 None，不参与门限判断）。
+
+    否则窗口模式下一张没有 EXIF 的照片会同时与门限两侧的照片相连，把本该切开的两组又并到一起。
+    """
+    filled: List[Optional[float]] = []
+    last: Optional[float] = None
+    for t in capture_times:
+        if t is not None:
+            last = t
+        filled.append(last)
+    return filled
+
+
+def time_gap_breaks(capture_times: Sequence[Optional[float]], max_gap: float) -> List[bool]:
+    """breaks[i] 为 True 表示第 i 张与第 i-1 张的拍摄时间相差超过 max_gap（max_gap <= 0 时全为 False）。"""
+    breaks = [False] * len(capture_times)
+    if max_gap <= 0:
+        return breaks
+    times = fill_capture_times(capture_times)
+    for i in range(1, len(times)):
+        t0, t1 = times[i - 1], times[i]
+        if t0 is not None and t1 is not None and abs(t1 - t0) > max_gap:
+            breaks[i] = True
+    return breaks
+
+
+def adjacent_group_ids(
+    similarities: Sequence[float],
+    threshold: float,
+    breaks: Optional[Sequence[bool]] = None,
+) -> List[int]:
+    """
+    传统规则：similarities[i] 为第 i 张与第 i-1 张的相似度（第 0 张的值被忽略），
+    低于阈值（或 breaks[i] 为 True）即开启新组。返回每张照片的组号（从 0 递增）。
+    """
+    group_ids: List[int] = []
+    current = 0
+    for idx, similarity in enumerate(similarities):
+        if idx > 0 and (similarity < threshold or (breaks is not None and breaks[idx])):
+            current += 1
+        group_ids.append(current)
+    return group_ids
+
+
+def stack_hists(files: Sequence[str], hist_cache: Dict[str, HSVHist]) -> List[np.ndarray]:
+    """按 files 顺序把各通道直方图堆成 (N, bins) 矩阵；缺失直方图的行置零（与任何照片相似度为 0）。"""
+    if not files:
+        return []
+    sample = next((hist_cache[f] for f in files if f in hist_cache), None)
+    if sample is None:
+        return []
+    channels: List[np.ndarray] = []
+    for c, ref in enumerate(sample):
+        mat = np.zeros((len(files), ref.shape[0]), dtype=np.float32)
+        for i, f in enumerate(files):
+            hist = hist_cache.get(f)
+            if hist is not None:
+                mat[i] = hist[c]
+        channels.append(mat)
+    return channels
+
+
+def time_gap_mask(capture_times: Sequence[Optional[float]], max_gap: float, window: int) -> Optional[np.ndarray]:
+    """
+    与带状相似度矩阵同形的 (N, window) 布尔矩阵：[i, j-1] 为 True 表示第 i 张与第 i-j 张的拍摄时间相差超过 max_gap。
+
+    max_gap <= 0 时返回 None（不做门限）。缺少拍摄时间的一对（补齐后仍为 None）不截断。
+    """
+    if max_gap <= 0:
+        return None
+    times = np.array([np.nan if t is None else t for t in fill_capture_times(capture_times)], dtype=np.float64)
+    n = times.shape[0]
+    gated = np.zeros((n, window), dtype=bool)
+    for j in range(1, min(window, n - 1) + 1):
+        with np.errstate(invalid="ignore"):
+            gated[j:, j - 1] = np.abs(times[j:] - times[:-j]) > max_gap
+    return gated
+
+
+def banded_similarity(channels: Sequence[np.ndarray], window: int, gated: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    带状相似度矩阵：返回 (N, window)，[i, j-1] 为第 i 张与第 i-j 张的相似度（越界为 NaN）。
+
+    与 calculate_similarity_from_hist 逐对计算的结果一致（各通道相关系数取平均），
+    但每个偏移量 j 只做一次逐行点积，整体是 window 次 O(N·bins) 的向量运算。
+    gated（见 time_gap_mask）中为 True 的一对必然不相连：这些行不参与点积，结果保持 NaN。
+    """
+    n = channels[0].shape[0] if channels else 0
+    out = np.full((n, window), np.nan, dtype=np.float64)
+    if n < 2:
+        return out
+
+    norms = [np.einsum("nd,nd->n", ch, ch, dtype=np.float64) for ch in channels]
+    for j in range(1, min(window, n - 1) + 1):
+        if gated is None:
+            rows, targets = slice(None), slice(j, None)
+        else:
+            # 只取未被时间门限截断的行（[j:] 切片中的下标），不必要的点积一次也不做
+            rows = np.flatnonzero(~gated[j:, j - 1])
+            if rows.size == 0:
+                continue
+            targets = j + rows
+        acc = 0.0
+        for ch, nn in zip(channels, norms):
+            num = np.einsum("nd,nd->n", ch[j:][rows], ch[:-j][rows], dtype=np.float64)
+            acc = acc + num / (np.sqrt(nn[j:][rows] * nn[:-j][rows]) + 1e-6)
+        out[targets, j - 1] = acc / len(channels)
+    return out
+
+
+def window_group_ids(similarity: np.ndarray, threshold: float) -> List[int]:
+    """
+    由带状相似度矩阵分组：相似度 >= 阈值的 (i, i-j) 为边，连通分量即一组。
+    组号按组内第一张照片的顺序从 0 编号，与传统规则的编号方式一致。
+    """
+    n = similarity.shape[0]
+    uf = UnionFind(n)
+    with np.errstate(invalid="ignore"):
+        rows, cols = np.nonzero(similarity >= threshold)
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        uf.union(i, i - (j + 1))
+
+    group_ids: List[int] = []
+    root_to_gid: Dict[int, int] = {}
+    for i in range(n):
+        root = uf.find(i)
+        if root not in root_to_gid:
+            root_to_gid[root] = len(root_to_gid)
+        group_ids.append(root_to_gid[root])
+    return group_ids
+
+
+def group_enabled_files(
+    enabled_files: Sequence[str],
+    adjacent_similarities: Sequence[float],
+    hist_cache: Dict[str, HSVHist],
+    threshold: float,
+    window: Optional[int] = None,
+    capture_times: Optional[Sequence[Optional[float]]] = None,
+    max_time_gap: float = 0.0,
+) -> List[int]:
+    """
+    按窗口大小选择分组规则，返回与 enabled_files 对齐的组号列表。
+    传入 capture_times 且 max_time_gap > 0 时，拍摄时间间隔过大的照片之间一律不相连。
+    """
+    window = SIMILARITY_WINDOW if window is None else max(1, int(window))
+    use_gap = capture_times is not None and max_time_gap > 0
+    breaks = time_gap_breaks(capture_times, max_time_gap) if use_gap else None
+    if window <= 1 or len(enabled_files) < 3:
+        return adjacent_group_ids(adjacent_similarities, threshold, breaks)
+    channels = stack_hists(enabled_files, hist_cache)
+    if not channels:
+        return adjacent_group_ids(adjacent_similarities, threshold, breaks)
+    gated = time_gap_mask(capture_times, max_time_gap, window) if use_gap else None
+    return window_group_ids(banded_similarity(channels, window, gated), threshold)
@@ -1,7 +1,9 @@
+import heapq
 import json
 import sqlite3
 import threading
 import time
+from contextlib import nullcontext
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Tuple, Callable, Optional, Any
 
@@ -9,15 +11,41 @@ import cv2
 import numpy as np
 import os
 
+from utils.admission import admit_decode, set_dimension_hints
 from utils.database import (
     load_cache_from_db,
     save_cache_to_db,
+    dhash_to_db,
     _connect,
 )
-from utils.inference_onnx import infer_iqa_from_bgr, detect_faces_from_bgr
+from utils.dedup import find_exact_duplicates, restrict_duplicates, twins_by_primary
+from utils.env import env_float, env_int
+from utils.exposure import refresh_exposure_metrics
+from utils.grouping import GROUP_TIME_GAP, group_enabled_files, time_gap_breaks
+from utils.inference_onnx import infer_iqa_from_pyramid, detect_faces_from_pyramid
+from utils.metadata import extract_library_metadata, load_dimensions
+from utils.phash import compute_dhash
+from utils.ranking import rank_library, refresh_face_summary
+from utils.pyramid import ImagePyramid
+from utils.raw import is_raw, raw_jpeg_pairs, read_raw_preview
 
 HSVHist = Tuple[np.ndarray, np.ndarray, np.ndarray]
 BINS: List[int] = [90, 128, 128]
+# HSV 直方图在原图的隔点抽样视图上统计（长边不小于 1280）：归一化后的分布与全图统计几乎一致
+# （与数据库中已缓存的全图直方图可以直接比较），像素量只有 2400 万像素原图的 1/16 左右
+HIST_LEVEL: int = 1280
+# 清晰度（拉普拉斯方差）在 640 长边层级上计算：人脸检测已缓存 1280 层级时由它再缩一次，几乎零成本
+SHARPNESS_LEVEL: int = 640
+
+# 画质评估模式：
+#   "full"   —— 每张启用照片都跑完整 LAR-IQA（默认，与旧行为一致）；
+#   "tiered" —— 先给所有照片算廉价清晰度并完成分组，只对每组清晰度前 K 张
+#               （以及清晰度不低于 IQA_TIER_BLUR_FLOOR 的照片）跑完整模型，其余照片只保留清晰度。
+IQA_MODES: Tuple[str, ...] = ("full", "tiered")
+IQA_MODE: str = os.environ.get("MEDIA_TOOLBOX_IQA_MODE", "full").strip().lower()
+IQA_TIER_TOP_K: int = env_int("MEDIA_TOOLBOX_IQA_TIER_TOP_K", 3)
+# 拉普拉斯方差的绝对值随场景纹理变化很大，合适的下限需按图库调整；默认 0 表示只按组内前 K 张筛选
+IQA_TIER_BLUR_FLOOR: float = env_float("MEDIA_TOOLBOX_IQA_TIER_BLUR_FLOOR", 0.0)
 
 
 # ---------------------------------------------------------------------------
@@ -136,6 +164,52 @@ class DBManager:
                 self._conn.rollback()
                 raise
 
+    def update_dhash(self, file_path: str, dhash: int) -> None:
+        """实时更新 dHash 到数据库。"""
+        with self._lock:
+            if not self._conn:
+                return
+            cursor = self._conn.cursor()
+            try:
+                self._ensure_cache_initialized(cursor)
+                row_id = self._get_row_id_safe(cursor, file_path)
+                if row_id:
+                    cursor.execute(
+                        """
+                        UPDATE present
+                        SET dHash = ?
+                        WHERE id = ?
+                        """,
+                        (dhash_to_db(dhash), row_id),
+                    )
+                    self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def update_sharpness(self, file_path: str, sharpness: float) -> None:
+        """实时更新清晰度数据到数据库。"""
+        with self._lock:
+            if not self._conn:
+                return
+            cursor = self._conn.cursor()
+            try:
+                self._ensure_cache_initialized(cursor)
+                row_id = self._get_row_id_safe(cursor, file_path)
+                if row_id:
+                    cursor.execute(
+                        """
+                        UPDATE present
+                        SET sharpness = ?
+                        WHERE id = ?
+                        """,
+                        (float(sharpness), row_id),
+                    )
+                    self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
     def update_face(self, file_path: str, face_info: dict) -> None:
         """实时更新人脸检测数据到数据库。"""
         try:
@@ -189,6 +263,25 @@ class DBManager:
                 self._conn.rollback()
                 raise
 
+    def update_duplicate_of(self, duplicate_of: Dict[str, Optional[str]]) -> None:
+        """批量写入 duplicateOf（孪生副本指向主副本 filePath，非重复照片写 NULL 以清除旧标记）。"""
+        with self._lock:
+            if not self._conn:
+                return
+            cursor = self._conn.cursor()
+            try:
+                self._ensure_cache_initialized(cursor)
+                params = [
+                    (primary, self._file_id_cache[file_path])
+                    for file_path, primary in duplicate_of.items()
+                    if file_path in self._file_id_cache
+                ]
+                cursor.executemany("UPDATE present SET duplicateOf = ? WHERE id = ?", params)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
     def update_group_id(self, file_path: str, group_id: int) -> None:
         """更新照片分组 ID（取代 update_group_id_in_db，复用持久连接）。"""
         with self._lock:
@@ -221,8 +314,64 @@ _db_manager: Optional[DBManager] = None
 # ---------------------------------------------------------------------------
 
 
+def apply_orientation(img: np.ndarray, orientation: int) -> np.ndarray:
+    """按 EXIF Orientation（1-8）把图像转正（imdecode 对主图会自动处理，内嵌缩略图 / RAW 预览需要手动转）。"""
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def decode_raw_preview(file_path: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """解码 RAW 文件内嵌的 JPEG 预览并转正（不去马赛克，见 utils/raw.py）；flags 可用 IMREAD_REDUCED_COLOR_*。"""
+    found = read_raw_preview(file_path)
+    if found is None:
+        raise RuntimeError(f"No embedded JPEG preview in RAW file: {file_path}")
+    data, orientation = found
+    if orientation:
+        # 预览按传感器方向存储，方向以 RAW 的 IFD0 为准
+        flags |= cv2.IMREAD_IGNORE_ORIENTATION
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if img is None:
+        raise RuntimeError(f"Failed to decode RAW preview: {file_path}")
+    return apply_orientation(img, orientation)
+
+
+def raw_display_jpeg(file_path: str) -> bytes:
+    """
+    供前端大图查看的 RAW 预览 JPEG 字节。
+
+    方向为 1（或预览自带 EXIF）时原样返回内嵌预览，不解码；否则解码、转正后重新编码（浏览器不会按 RAW 的 IFD0 旋转）。
+    """
+    found = read_raw_preview(file_path)
+    if found is None:
+        raise RuntimeError(f"No embedded JPEG preview in RAW file: {file_path}")
+    data, orientation = found
+    if orientation in (0, 1):
+        return data
+    with admit_decode(file_path):
+        img = decode_raw_preview(file_path)
+    success, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    if not success:
+        raise RuntimeError("Failed to encode image to JPEG format")
+    return buffer.tobytes()
+
+
 def cv_imread(file_path: str) -> np.ndarray:
-    """支持中文路径的 cv2 读取."""
+    """支持中文路径的 cv2 读取（RAW 读取内嵌 JPEG 预览）."""
+    if is_raw(file_path):
+        return decode_raw_preview(file_path)
     data = np.fromfile(file_path, dtype=np.uint8)
     img = cv2.imdecode(data, cv2.IMREAD_COLOR)
     if img is None:
@@ -230,6 +379,27 @@ def cv_imread(file_path: str) -> np.ndarray:
     return img
 
 
+def _decode_pyramid(
+    file_path: str,
+    need_hist: bool,
+    need_iqa: bool,
+    need_face: bool,
+    need_sharpness: bool = False,
+) -> ImagePyramid:
+    """解码一次并构建共享金字塔；登记仍需原图的阶段，全部完成后原图即被释放。"""
+    stages = [
+        name
+        for name, needed in (
+            ("hist", need_hist),
+            ("iqa", need_iqa),
+            ("face", need_face),
+            ("sharpness", need_sharpness),
+        )
+        if needed
+    ]
+    return ImagePyramid(cv_imread(file_path), full_res_stages=stages)
+
+
 # ---------------------------------------------------------------------------
 # HSV 直方图（NumPy + OpenCV，CPU）
 # ---------------------------------------------------------------------------
@@ -294,49 +464,103 @@ def calculate_similarity_from_hist(
 def ensure_hist_cached(
     file_path: str,
     hist_cache: Dict[str, HSVHist],
-    img_bgr: Optional[np.ndarray] = None,
+    pyramid: Optional[ImagePyramid] = None,
+    dhash_cache: Optional[Dict[str, int]] = None,
 ) -> None:
     """
-    确保某张图的 HSV 直方图已缓存，并实时写入数据库。
-    img_bgr:
-        可选的预加载 BGR 图像（用于和 IQA 复用 IO）。
+    确保某张图的 HSV 直方图（以及传入 dhash_cache 时的 dHash）已缓存，并实时写入数据库。
+    pyramid:
+        可选的共享图像金字塔（用于和 IQA / 人脸检测复用同一次解码）。
+    dhash_cache:
+        可选的 dHash 缓存；与直方图共用同一个隔点抽样视图计算。
     """
     global _db_manager
 
-    if file_path in hist_cache:
+    need_hist = file_path not in hist_cache
+    need_dhash = dhash_cache is not None and file_path not in dhash_cache
+    if not (need_hist or need_dhash):
+        return
+
+    # 单独解码（相邻对中的参考图）时占用计入共享内存预算；传入金字塔时由调用方负责
+    with admit_decode(file_path) if pyramid is None else nullcontext():
+        if pyramid is None:
+            pyramid = ImagePyramid(cv_imread(file_path))
+        sampled = pyramid.sampled(HIST_LEVEL)
+
+        if need_hist:
+            hist = compute_centered_hsv_histogram(sampled, BINS)
+            hist_cache[file_path] = hist
+            # 实时写入数据库
+            if _db_manager is not None:
+                _db_manager.update_hist(file_path, hist)
+
+        if need_dhash:
+            dhash = compute_dhash(sampled)
+            dhash_cache[file_path] = dhash
+            if _db_manager is not None:
+                _db_manager.update_dhash(file_path, dhash)
+
+        pyramid.release_full("hist")
+
+
+# ---------------------------------------------------------------------------
+# 廉价清晰度（分级 IQA 的第一级）
+# ---------------------------------------------------------------------------
+
+
+def compute_sharpness(img_bgr: np.ndarray) -> float:
+    """灰度图拉普拉斯响应的方差：失焦 / 抖动模糊时高频能量骤降，数值越大越清晰。"""
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    lap = cv2.Laplacian(gray, cv2.CV_32F, ksize=3)
+    _, std = cv2.meanStdDev(lap)
+    return float(std[0, 0]) ** 2
+
+
+def ensure_sharpness_cached(
+    file_path: str,
+    sharpness_cache: Dict[str, float],
+    pyramid: Optional[ImagePyramid] = None,
+) -> None:
+    """确保某张图的清晰度已缓存，并实时写入数据库。"""
+    global _db_manager
+
+    if file_path in sharpness_cache:
         return
 
-    if img_bgr is None:
-        img_bgr = cv_imread(file_path)
-    hist = compute_centered_hsv_histogram(img_bgr, BINS)
-    hist_cache[file_path] = hist
+    if pyramid is None:
+        pyramid = ImagePyramid(cv_imread(file_path))
+
+    sharpness = compute_sharpness(pyramid.level(SHARPNESS_LEVEL))
+    pyramid.release_full("sharpness")
+    sharpness_cache[file_path] = sharpness
 
     # 实时写入数据库
     if _db_manager is not None:
-        _db_manager.update_hist(file_path, hist)
+        _db_manager.update_sharpness(file_path, sharpness)
 
 
 # ---------------------------------------------------------------------------
 def ensure_iqa_cached(
     file_path: str,
     iqa_cache: Dict[str, float],
-    img_bgr: Optional[np.ndarray] = None,
+    pyramid: Optional[ImagePyramid] = None,
 ) -> None:
     """
     确保某张图的 IQA 已缓存，并实时写入数据库。
-    img_bgr:
-        可选的预加载 BGR 图像（用于和 HSV 复用 IO）。
+    pyramid:
+        可选的共享图像金字塔（用于和 HSV / 人脸检测复用同一次解码）。
     """
     global _db_manager
 
     if file_path in iqa_cache:
         return
 
-    if img_bgr is None:
-        img_bgr = cv_imread(file_path)
+    if pyramid is None:
+        pyramid = ImagePyramid(cv_imread(file_path))
 
-    # 交给独立 IQA 模块进行预处理与推理
-    iqa_value = infer_iqa_from_bgr(img_bgr, color_space="RGB")
+    # 交给独立 IQA 模块进行预处理与推理；synthetic 分支用完原图后即释放 "iqa" 对原图的占用
+    iqa_value = infer_iqa_from_pyramid(pyramid, color_space="RGB")
+    pyramid.release_full("iqa")
     iqa_cache[file_path] = float(iqa_value)
 
     # 实时写入数据库
@@ -347,7 +571,7 @@ def ensure_iqa_cached(
 def ensure_face_cached(
     file_path: str,
     face_cache: Dict[str, dict],
-    img_bgr: Optional[np.ndarray] = None,
+    pyramid: Optional[ImagePyramid] = None,
 ) -> None:
     """确保某张图的人脸检测结果已缓存，并实时写入数据库。"""
     global _db_manager
@@ -355,10 +579,11 @@ def ensure_face_cached(
     if file_path in face_cache:
         return
 
-    if img_bgr is None:
-        img_bgr = cv_imread(file_path)
+    if pyramid is None:
+        pyramid = ImagePyramid(cv_imread(file_path))
 
-    face_info = detect_faces_from_bgr(img_bgr, score_thresh=0.6)
+    face_info = detect_faces_from_pyramid(pyramid, score_thresh=0.6)
+    pyramid.release_full("face")
     face_cache[file_path] = face_info
 
     # 实时写入数据库
@@ -371,55 +596,96 @@ def ensure_face_cached(
 # ---------------------------------------------------------------------------
 
 
+def _needs_features(
+    file_path: str,
+    hist_cache: Dict[str, HSVHist],
+    iqa_cache: Dict[str, float],
+    face_cache: Dict[str, dict],
+    sharpness_cache: Dict[str, float],
+    dhash_cache: Dict[str, int],
+    compute_iqa: bool = True,
+) -> bool:
+    """单图特征是否有缺失（如旧库没有清晰度 / dHash 列、分级模式下曾被跳过的 IQA）。"""
+    return (
+        file_path not in hist_cache
+        or file_path not in face_cache
+        or file_path not in sharpness_cache
+        or file_path not in dhash_cache
+        or (compute_iqa and file_path not in iqa_cache)
+    )
+
+
+def ensure_image_features(
+    file_path: str,
+    hist_cache: Dict[str, HSVHist],
+    iqa_cache: Dict[str, float],
+    face_cache: Dict[str, dict],
+    sharpness_cache: Dict[str, float],
+    dhash_cache: Dict[str, int],
+    compute_iqa: bool = True,
+) -> None:
+    """
+    补齐单图的直方图与 dHash / 人脸 / 清晰度 /（可选）IQA。
+
+    为减少 IO：缺失的特征共用一次 cv_imread 构建的金字塔。
+    人脸检测先缓存 1280 层级，清晰度的 640 层级与 IQA 的 384 层级再由它逐级缩小；
+    compute_iqa=False（分级模式第一遍）时跳过 IQA，留给分组后的第二遍按需计算。
+    """
+    need_hist = file_path not in hist_cache or file_path not in dhash_cache
+    need_iqa = compute_iqa and file_path not in iqa_cache
+    need_face = file_path not in face_cache
+    need_sharpness = file_path not in sharpness_cache
+    if not (need_hist or need_iqa or need_face or need_sharpness):
+        return
+
+    # 从解码到所有阶段释放原图，整段占用计入共享内存预算（utils/admission.py）
+    with admit_decode(file_path):
+        pyramid = _decode_pyramid(file_path, need_hist, need_iqa, need_face, need_sharpness)
+        if need_hist:
+            ensure_hist_cached(file_path, hist_cache, pyramid, dhash_cache)
+        if need_face:
+            ensure_face_cached(file_path, face_cache, pyramid)
+        if need_sharpness:
+            ensure_sharpness_cached(file_path, sharpness_cache, pyramid)
+        if need_iqa:
+            ensure_iqa_cached(file_path, iqa_cache, pyramid)
+
+
 def compute_similarity_and_IQA(
     file_path: str,
     ref_path: str,
     hist_cache: Dict[str, HSVHist],
     iqa_cache: Dict[str, float],
     face_cache: Dict[str, dict],
+    sharpness_cache: Dict[str, float],
+    dhash_cache: Dict[str, int],
+    compute_iqa: bool = True,
 ) -> Tuple[float, float]:
     """
     计算 (file_path, ref_path) 这对图片的相似度 + file_path 的 IQA。
 
-    为减少 IO：
-      - 对于未在缓存中的图片，仅调用一次 cv_imread，
-        同时用于 HSV 直方图与 IQA 预处理。
+    compute_iqa=False 时 file_path 暂无 IQA，返回值中的 IQA 记为 0.0，数据库中保持 NULL。
     """
     # --- 参考图：只需要 HSV 直方图 ---
-    if ref_path in hist_cache:
-        img_ref: Optional[np.ndarray] = None
-    else:
-        img_ref = cv_imread(ref_path)
-        ensure_hist_cached(ref_path, hist_cache, img_ref)
-
-    # --- 当前图：可能需要直方图，也可能需要 IQA，可能都需要 ---
-    img_curr: Optional[np.ndarray] = None
-    need_hist = file_path not in hist_cache
-    need_iqa = file_path not in iqa_cache
-    need_face = file_path not in face_cache
+    if ref_path not in hist_cache:
+        ensure_hist_cached(ref_path, hist_cache, dhash_cache=dhash_cache)
 
-    if need_hist or need_iqa or need_face:
-        img_curr = cv_imread(file_path)
-
-    if need_hist:
-        ensure_hist_cached(file_path, hist_cache, img_curr)
-    if need_iqa:
-        ensure_iqa_cached(file_path, iqa_cache, img_curr)
-    if need_face:
-        ensure_face_cached(file_path, face_cache, img_curr)
+    # --- 当前图：补齐缺失的单图特征 ---
+    ensure_image_features(file_path, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, compute_iqa)
 
     similarity = calculate_similarity_from_hist(
         hist_cache[file_path],
         hist_cache[ref_path],
     )
-    iqa_value = iqa_cache[file_path]
+    iqa_value = iqa_cache.get(file_path)
 
     # 实时写入数据库
     if _db_manager is not None:
         _db_manager.update_similarity(file_path, ref_path, similarity, iqa_value)
 
-    print(f"[compute_similarity_and_IQA] pair=({file_path}, {ref_path}) similarity={similarity:.4f}, IQA={iqa_value:.4f}")
-    return similarity, iqa_value
+    iqa_text = f"{iqa_value:.4f}" if iqa_value is not None else "-"
+    print(f"[compute_similarity_and_IQA] pair=({file_path}, {ref_path}) similarity={similarity:.4f}, IQA={iqa_text}")
+    return similarity, iqa_value if iqa_value is not None else 0.0
 
 
 # ---------------------------------------------------------------------------
@@ -434,35 +700,38 @@ def process_pair_batch(
     hist_cache: Dict[str, HSVHist],
     iqa_cache: Dict[str, float],
     face_cache: Dict[str, dict],
+    sharpness_cache: Dict[str, float],
+    dhash_cache: Dict[str, int],
     update_progress: Callable[[str, int, int, int], Any],
     include_first_self_pair: bool = False,
     first_enabled_file: Optional[str] = None,
+    compute_iqa: bool = True,
+    gated_pairs: Optional[set] = None,
 ) -> None:
     """
     Worker：处理一段 (file, ref_file) pair。
 
     只负责：
       - 对还未在 cache_data 中的 pair 计算 similarity + IQA；
+      - 相似度已缓存、或被拍摄时间门限截断（gated_pairs）的 pair 只补齐 file 缺失的单图特征；
       - 结果写回 cache_data 和 DB；
       - 不负责分组。
     若 include_first_self_pair=True，则额外确保首个启用图片 first_enabled_file
-    的 IQA 一定被计算。
+    的单图特征一定被计算。
     """
     total_pairs = len(pairs)
     if total_pairs == 0 and not include_first_self_pair:
         return
 
-    # 若是“第一段”，且首个启用图片还未计算 IQA，则先补算一次
+    # 若是“第一段”，且首个启用图片还有特征未计算，则先补算一次
     if include_first_self_pair and first_enabled_file is not None:
-        if first_enabled_file not in iqa_cache:
-            print(f"[process_pair_batch] worker {worker_id} pre-computing IQA for first enabled: {first_enabled_file}")
-            img_first = cv_imread(first_enabled_file)
-            ensure_hist_cached(first_enabled_file, hist_cache, img_first)
-            ensure_iqa_cached(first_enabled_file, iqa_cache, img_first)
-            ensure_face_cached(first_enabled_file, face_cache, img_first)
+        if _needs_features(first_enabled_file, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, compute_iqa):
+            print(f"[process_pair_batch] worker {worker_id} pre-computing features for first enabled: {first_enabled_file}")
+            ensure_image_features(first_enabled_file, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, compute_iqa)
 
     for idx, (file_path, ref_path) in enumerate(pairs):
-        if (file_path, ref_path) in cache_data:
+        if (file_path, ref_path) in cache_data or (gated_pairs and (file_path, ref_path) in gated_pairs):
+            ensure_image_features(file_path, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, compute_iqa)
             update_progress("多线程分析中", worker_id, idx + 1, total_pairs)
             continue
 
@@ -472,6 +741,9 @@ def process_pair_batch(
             hist_cache,
             iqa_cache,
             face_cache,
+            sharpness_cache,
+            dhash_cache,
+            compute_iqa,
         )
 
         cache_data[(file_path, ref_path)] = (similarity, iqa_value)
@@ -479,16 +751,196 @@ def process_pair_batch(
         update_progress("多线程分析中", worker_id, idx + 1, total_pairs)
 
 
+def copy_features_to_twins(
+    twins: Dict[str, List[str]],
+    hist_cache: Dict[str, HSVHist],
+    iqa_cache: Dict[str, float],
+    face_cache: Dict[str, dict],
+    sharpness_cache: Dict[str, float],
+    dhash_cache: Dict[str, int],
+) -> int:
+    """
+    把主副本已有的单图特征拷贝给字节完全相同的孪生副本（只补孪生缺失的项），返回拷贝的特征数。
+
+    内容相同则解码结果、直方图、IQA、人脸一律相同，无需再解码；同时实时写入数据库。
+    """
+    copied = 0
+    for primary, twin_list in twins.items():
+        for twin in twin_list:
+            if primary in hist_cache and twin not in hist_cache:
+                hist_cache[twin] = hist_cache[primary]
+                if _db_manager is not None:
+                    _db_manager.update_hist(twin, hist_cache[twin])
+                copied += 1
+            if primary in dhash_cache and twin not in dhash_cache:
+                dhash_cache[twin] = dhash_cache[primary]
+                if _db_manager is not None:
+                    _db_manager.update_dhash(twin, dhash_cache[twin])
+                copied += 1
+            if primary in face_cache and twin not in face_cache:
+                face_cache[twin] = face_cache[primary]
+                if _db_manager is not None:
+                    _db_manager.update_face(twin, face_cache[twin])
+                copied += 1
+            if primary in sharpness_cache and twin not in sharpness_cache:
+                sharpness_cache[twin] = sharpness_cache[primary]
+                if _db_manager is not None:
+                    _db_manager.update_sharpness(twin, sharpness_cache[twin])
+                copied += 1
+            if primary in iqa_cache and twin not in iqa_cache:
+                iqa_cache[twin] = iqa_cache[primary]
+                if _db_manager is not None:
+                    _db_manager.update_iqa(twin, iqa_cache[twin])
+                copied += 1
+    return copied
+
+
+def process_feature_batch(
+    worker_id: int,
+    files: List[str],
+    hist_cache: Dict[str, HSVHist],
+    iqa_cache: Dict[str, float],
+    face_cache: Dict[str, dict],
+    sharpness_cache: Dict[str, float],
+    dhash_cache: Dict[str, int],
+    update_progress: Callable[[str, int, int, int], Any],
+    compute_iqa: bool = True,
+) -> None:
+    """Worker：为有孪生副本的主副本预先补齐单图特征（之后直接拷贝给孪生副本）。"""
+    total = len(files)
+    for idx, file_path in enumerate(files):
+        ensure_image_features(file_path, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, compute_iqa)
+        update_progress("重复照片分析中", worker_id, idx + 1, total)
+
+
+def balanced_batches(
+    files: List[str],
+    num_batches: int,
+    dimensions: Dict[str, Tuple[int, int]],
+) -> List[List[str]]:
+    """
+    按像素数把需要完整解码的照片分给 num_batches 个 worker（最长处理时间优先：从大到小放进当前最轻的一组）。
+
+    顺序切块时，一个 worker 可能连着拿到整段 1 亿像素的照片，其他 worker 早早空闲；
+    尺寸来自照片库的文件头元数据（utils/metadata.py），没有记录的照片按已知尺寸的中位数计。
+    """
+    num_batches = max(1, min(num_batches, len(files)))
+    pixels = {f: dimensions[f][0] * dimensions[f][1] for f in files if f in dimensions}
+    known = sorted(pixels.values())
+    default = known[len(known) // 2] if known else 1
+    batches: List[List[str]] = [[] for _ in range(num_batches)]
+    loads = [(0, i) for i in range(num_batches)]
+    for f in sorted(files, key=lambda f: pixels.get(f, default), reverse=True):
+        load, i = heapq.heappop(loads)
+        batches[i].append(f)
+        heapq.heappush(loads, (load + pixels.get(f, default), i))
+    return [batch for batch in batches if batch]
+
+
+def select_tiered_iqa_targets(
+    enabled_files: List[str],
+    group_ids: List[int],
+    sharpness_cache: Dict[str, float],
+    top_k: Optional[int] = None,
+    blur_floor: Optional[float] = None,
+) -> List[str]:
+    """
+    分级模式：按正式分组的组号（与 enabled_files 对齐）返回需要跑完整 IQA 的照片。
+
+    每组按清晰度降序取前 top_k 张；blur_floor > 0 时清晰度不低于它的照片也一并入选
+    （两者缺省时取模块级 IQA_TIER_TOP_K / IQA_TIER_BLUR_FLOOR）。
+    连拍中明显失焦的帧既不会被选为保留照片，也就不值得再跑一次完整模型。
+    """
+    top_k = IQA_TIER_TOP_K if top_k is None else top_k
+    blur_floor = IQA_TIER_BLUR_FLOOR if blur_floor is None else blur_floor
+
+    members: Dict[int, List[str]] = {}
+    for file_path, gid in zip(enabled_files, group_ids):
+        members.setdefault(gid, []).append(file_path)
+
+    targets: List[str] = []
+    for group in members.values():
+        ranked = sorted(group, key=lambda f: sharpness_cache.get(f, 0.0), reverse=True)
+        for rank, f in enumerate(ranked):
+            if rank < top_k or (blur_floor > 0 and sharpness_cache.get(f, 0.0) >= blur_floor):
+                targets.append(f)
+    return targets
+
+
+def estimate_tiered_iqa(
+    enabled_files: List[str],
+    group_ids: List[int],
+    targets: List[str],
+    iqa_cache: Dict[str, float],
+    sharpness_cache: Dict[str, float],
+) -> Dict[str, float]:
+    """
+    分级模式下未跑完整模型的照片的 IQA 估计值：{filePath: 估计分数}，只用于返回给前端的分组结果。
+
+    以组内跑过完整 IQA 的照片为参照，估计值 = 参照中最低的 IQA × (清晰度 / 参照中最低的清晰度)，上限为 1 倍。
+    未入选的帧清晰度不高于同组入选帧，估计值因此落在同一量纲、且排在入选帧之后；组内没有参照时不估计。
+    估计值不写入 IQA 列：列为 NULL 才能让之后的完整模式 / 调整 K 后的分级模式照常补算。
+    """
+    target_set = set(targets)
+    members: Dict[int, List[str]] = {}
+    for file_path, gid in zip(enabled_files, group_ids):
+        members.setdefault(gid, []).append(file_path)
+
+    estimates: Dict[str, float] = {}
+    for group in members.values():
+        scored = [f for f in group if f in target_set and f in iqa_cache]
+        if not scored:
+            continue
+        ref_iqa = min(iqa_cache[f] for f in scored)
+        ref_sharpness = min(sharpness_cache.get(f, 0.0) for f in scored)
+        for f in group:
+            if f in iqa_cache:
+                continue
+            ratio = min(1.0, sharpness_cache.get(f, 0.0) / ref_sharpness) if ref_sharpness > 0 else 1.0
+            estimates[f] = ref_iqa * ratio
+    return estimates
+
+
+def process_iqa_batch(
+    worker_id: int,
+    files: List[str],
+    iqa_cache: Dict[str, float],
+    update_progress: Callable[[str, int, int, int], Any],
+) -> None:
+    """Worker：分级模式第二遍，只为选中的照片解码并跑完整 IQA。"""
+    total = len(files)
+    for idx, file_path in enumerate(files):
+        if file_path not in iqa_cache:
+            with admit_decode(file_path):
+                ensure_iqa_cached(file_path, iqa_cache, _decode_pyramid(file_path, False, True, False))
+        update_progress("精细画质评估中", worker_id, idx + 1, total)
+
+
 def process_and_group_images(
     db_path: str,
     similarity_threshold: float,
     update_progress: Callable[[str, int, int, int], Any],
     show_disabled_photos: bool,
+    iqa_mode: Optional[str] = None,
+    similarity_window: Optional[int] = None,
+    time_gap_seconds: Optional[float] = None,
 ):
     """
     主流程：读取 DB、计算相似度 & IQA、完成分组并写回 groupId。
+
+    iqa_mode 为 None 时使用全局 IQA_MODE（见模块顶部 "full" / "tiered" 说明）。
+    similarity_window 为 None 时使用 utils.grouping.SIMILARITY_WINDOW（1 = 只与前一张比较）。
+    time_gap_seconds 为 None 时使用 utils.grouping.GROUP_TIME_GAP；> 0 时相邻两张拍摄时间相差超过它
+    即直接开新组，这一对的相似度不再计算（0 = 关闭）。
     """
     global _db_manager
+
+    iqa_mode = (iqa_mode or IQA_MODE).strip().lower()
+    if iqa_mode not in IQA_MODES:
+        print(f"[process_and_group_images] unknown iqa_mode={iqa_mode!r}, falling back to 'full'")
+        iqa_mode = "full"
+    tiered = iqa_mode == "tiered"
+
     _db_manager = DBManager(db_path)
 
     start_time = time.time()
@@ -500,30 +952,99 @@ def process_and_group_images(
         hist_cache,
         iqa_cache,
         face_cache,
+        sharpness_cache,
+        dhash_cache,
+        capture_cache,
     ) = load_cache_from_db(db_path, show_disabled_photos)
 
     total_images = len(image_files)
 
+    # 文件头元数据只读文件头、不解码，库中已有的不再重复读取；没有 EXIF 的照片拍摄时间保持 NULL。
+    # 尺寸用于解码内存估算（不必再读文件头）与下面按像素数分配 worker
+    update_progress("元数据读取中", 0, 0, 1)
+    fresh_metadata = extract_library_metadata(db_path, image_files)
+    capture_cache.update({f: m.capture_time for f, m in fresh_metadata.items() if m.capture_time is not None})
+    dimensions = load_dimensions(db_path)
+    set_dimension_hints(dimensions)
+
     # 启用图片列表
     enabled_files: List[str] = [f for f in image_files if enabled_map.get(f, True)]
     total_enabled = len(enabled_files)
+    num_threads = max(1, os.cpu_count() // 2 or 1)
+
+    # 字节级完全重复（重复导入同一张卡 / 重叠文件夹）：解码前按 大小 -> 部分哈希 -> 全量哈希 筛出，
+    # 特征只为主副本计算一次，再拷贝给孪生副本；孪生副本在 DB 中以 duplicateOf 标记
+    update_progress("重复文件检查中", 0, 0, 1)
+    # duplicateOf 对整个照片库刷新（禁用的照片也标记，没有重复的写 NULL 清除旧标记）；特征复用只在启用的照片之间
+    library_duplicates = find_exact_duplicates(image_files)
+    _db_manager.update_duplicate_of({f: library_duplicates.get(f) for f in image_files})
+    duplicate_of = restrict_duplicates(library_duplicates, enabled_files)
+    # RAW+JPEG 同名配对是同一次曝光：RAW 的单图特征直接取自 JPEG（不写 duplicateOf，两者并非字节相同）
+    feature_source = dict(duplicate_of)
+    for raw_path, jpeg_path in raw_jpeg_pairs(enabled_files).items():
+        if raw_path not in feature_source:
+            feature_source[raw_path] = duplicate_of.get(jpeg_path, jpeg_path)
+    twins = twins_by_primary(feature_source)
+    if twins:
+        print(f"[process_and_group_images] feature twins: {len(feature_source)} copies of {len(twins)} files")
+        primaries = [
+            p
+            for p in twins
+            if _needs_features(p, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, not tiered)
+        ]
+        if primaries:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = [
+                    executor.submit(
+                        process_feature_batch,
+                        worker_id,
+                        batch,
+                        hist_cache,
+                        iqa_cache,
+                        face_cache,
+                        sharpness_cache,
+                        dhash_cache,
+                        update_progress,
+                        not tiered,
+                    )
+                    for worker_id, batch in enumerate(balanced_batches(primaries, num_threads, dimensions))
+                ]
+                for future in as_completed(futures):
+                    future.result()
+        copy_features_to_twins(twins, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache)
+
+    time_gap = GROUP_TIME_GAP if time_gap_seconds is None else max(0.0, float(time_gap_seconds))
+    capture_times: List[Optional[float]] = [capture_cache.get(f) for f in enabled_files]
 
-    # 构造 “当前启用图 vs 前一张启用图” 的 pair（如果不在 cache_data 中才计算）
+    # 构造 “当前启用图 vs 前一张启用图” 的 pair（不在 cache_data 中、或当前图缺少单图特征时才计算）；
+    # 拍摄时间相差超过门限的 pair 必然切组，只记入 gated_pairs 补齐单图特征，不算相似度
     pairs_to_compute: List[Tuple[str, str]] = []
+    gated_pairs = set()
+    breaks = time_gap_breaks(capture_times, time_gap)
     prev_enabled: Optional[str] = None
-    for file_path in enabled_files:
+    for file_path, gated in zip(enabled_files, breaks):
         if prev_enabled is None:
             prev_enabled = file_path
             continue
 
         key = (file_path, prev_enabled)
-        if key not in cache_data:
+        if gated:
+            gated_pairs.add(key)
+            if _needs_features(
+                file_path, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, not tiered
+            ):
+                pairs_to_compute.append(key)
+        elif key not in cache_data or _needs_features(
+            file_path, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, not tiered
+        ):
             pairs_to_compute.append(key)
 
         prev_enabled = file_path
 
-    # 多线程计算相似度 & IQA
-    num_threads = max(1, os.cpu_count() // 2 or 1)
+    if gated_pairs:
+        print(f"[process_and_group_images] time gap > {time_gap}s: {len(gated_pairs)} pairs skipped")
+
+    # 多线程计算相似度 & IQA（孪生副本的特征已拷贝齐全，这里只剩相似度，不会再解码）
     total_pairs = len(pairs_to_compute)
 
     if total_pairs > 0:
@@ -552,61 +1073,96 @@ def process_and_group_images(
                         hist_cache,
                         iqa_cache,
                         face_cache,
+                        sharpness_cache,
+                        dhash_cache,
                         update_progress,
                         include_head,
                         first_enabled_file,
+                        not tiered,
+                        gated_pairs,
                     )
                 )
 
             for future in as_completed(futures):
                 future.result()
 
-    # 兜底：确保首个启用图片一定有 IQA 和人脸数据
+    # 兜底：确保首个启用图片一定有单图特征（分级模式下 IQA 留到第二遍）
     if enabled_files:
         first_enabled = enabled_files[0]
-        if first_enabled not in iqa_cache:
-            print(f"[process_and_group_images] fallback IQA/face computation for first enabled: {first_enabled}")
-            img_first = cv_imread(first_enabled)
-            ensure_hist_cached(first_enabled, hist_cache, img_first)
-            ensure_iqa_cached(first_enabled, iqa_cache, img_first)
-            ensure_face_cached(first_enabled, face_cache, img_first)
-
-    # 将 per-image 直方图 & IQA & 人脸数据 写回 DB
+        if _needs_features(first_enabled, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, not tiered):
+            print(f"[process_and_group_images] fallback feature computation for first enabled: {first_enabled}")
+            ensure_image_features(first_enabled, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache, not tiered)
+
+    # 分组只依赖直方图与相邻相似度，先于（分级模式的）IQA 第二遍确定
+    adjacent_similarities: List[float] = [1.0] + [
+        cache_data.get((enabled_files[i], enabled_files[i - 1]), (0.0, 0.0))[0] for i in range(1, total_enabled)
+    ]
+    group_ids = group_enabled_files(
+        enabled_files,
+        adjacent_similarities,
+        hist_cache,
+        similarity_threshold,
+        similarity_window,
+        capture_times,
+        time_gap,
+    )
+
+    # 分级模式第二遍：分组已确定，只对各组清晰度靠前的照片跑完整 IQA
+    iqa_estimates: Dict[str, float] = {}
+    if tiered:
+        targets = select_tiered_iqa_targets(enabled_files, group_ids, sharpness_cache)
+        # 孪生副本换成主副本计算，算完再拷贝回去
+        iqa_todo = list(dict.fromkeys(duplicate_of.get(f, f) for f in targets if f not in iqa_cache))
+        print(
+            f"[process_and_group_images] tiered IQA: {len(targets)}/{total_enabled} selected, "
+            f"{len(iqa_todo)} to compute"
+        )
+        if iqa_todo:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = [
+                    executor.submit(
+                        process_iqa_batch,
+                        worker_id,
+                        batch,
+                        iqa_cache,
+                        update_progress,
+                    )
+                    for worker_id, batch in enumerate(balanced_batches(iqa_todo, num_threads, dimensions))
+                ]
+                for future in as_completed(futures):
+                    future.result()
+        copy_features_to_twins(twins, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache)
+        # 未入选的帧在返回的分组里用清晰度换算的估计值，而不是显示为 0
+        iqa_estimates = estimate_tiered_iqa(enabled_files, group_ids, targets, iqa_cache, sharpness_cache)
+
+    # 将 per-image 直方图 & IQA & 人脸数据 & 清晰度 & dHash 写回 DB
     update_progress("保存缓存数据中", 0, 0, 1)
-    save_cache_to_db(db_path, cache_data, hist_cache, iqa_cache, face_cache)
+    save_cache_to_db(db_path, cache_data, hist_cache, iqa_cache, face_cache, sharpness_cache, dhash_cache)
+    # 曝光指标只依赖直方图，整库一次矩阵运算即可刷新，不再读取图片
+    refresh_exposure_metrics(db_path, hist_cache)
+    # 人脸 JSON 汇总成数值列，供 utils/ranking.py 排序
+    refresh_face_summary(db_path, face_cache)
 
     # ====== 对启用图片进行分组 ======
-    groups: List[List[Tuple[str, float, float]]] = []
-    current_group: List[Tuple[str, float, float]] = []
-    current_group_id = 0
+    # 组号由 group_enabled_files 给出：默认相邻相似度低于阈值即开新组，窗口模式为并查集连通分量；
+    # 两种规则的组号都按组内第一张照片的顺序从 0 编号，groups 的下标即组号
+    groups: List[List[Tuple[str, float, float]]] = [[] for _ in range(max(group_ids, default=-1) + 1)]
 
     for idx, file_path in enumerate(enabled_files):
+        # 第一张启用图片没有前驱，相似度视为 1.0
+        similarity = adjacent_similarities[idx]
         if idx == 0:
-            # 第一张启用图片没有前驱，相似度视为 1.0
-            similarity = 1.0
-            iqa_value = iqa_cache.get(file_path, 0.0)
+            iqa_value = iqa_cache.get(file_path, iqa_estimates.get(file_path, 0.0))
         else:
-            prev_file = enabled_files[idx - 1]
-            similarity, iqa_value = cache_data.get(
-                (file_path, prev_file),
-                (0.0, iqa_cache.get(file_path, 0.0)),
-            )
-
-            # 相似度低于阈值 -> 开启新组
-            if similarity < similarity_threshold:
-                if current_group:
-                    groups.append(sorted(current_group, key=lambda x: x[2], reverse=True))
-                current_group = []
-                current_group_id += 1
-
-        current_group.append((file_path, similarity, iqa_value))
+            pair_iqa = cache_data.get((file_path, enabled_files[idx - 1]), (0.0, 0.0))[1]
+            # 分级模式第二遍补算的 IQA 只写入了 iqa_cache；未入选的帧用估计值
+            iqa_value = iqa_cache.get(file_path, iqa_estimates.get(file_path, pair_iqa))
+
+        groups[group_ids[idx]].append((file_path, similarity, iqa_value))
         # 使用 DBManager.update_group_id 复用持久连接，取代每次新建连接的 update_group_id_in_db
-        _db_manager.update_group_id(file_path, current_group_id)
+        _db_manager.update_group_id(file_path, group_ids[idx])
         update_progress("单线程分组中", 0, idx + 1, max(total_enabled, 1))
 
-    if current_group:
-        groups.append(sorted(current_group, key=lambda x: x[2], reverse=True))
-
     # 建立启用图片 filePath -> groupId 映射
     file_to_group: Dict[str, int] = {}
     for gid, group in enumerate(groups):
@@ -668,8 +1224,17 @@ def process_and_group_images(
         else:
             groups = []
 
-    # 每个组内部按 IQA 降序
-    groups = [sorted(group, key=lambda x: x[2], reverse=True) for group in groups if group]
+    # groupId 已全部写回：整库综合排序并写回 rankScore / groupRank（默认权重，之后可经 /rank 接口换权重重排）
+    update_progress("综合排序中", 0, 0, 1)
+    rank_scores: Dict[str, float] = {
+        file_path: score for ranked in rank_library(db_path, top_k=0).values() for file_path, score in ranked
+    }
+
+    # 每个组内部按综合分数降序；未启用图片不参与排序，排在最后并按 IQA、清晰度排序
+    def rank_key(item: Tuple[str, float, float]) -> Tuple[float, float, float]:
+        return rank_scores.get(item[0], -1.0), item[2], sharpness_cache.get(item[0], 0.0)
+
+    groups = [sorted(group, key=rank_key, reverse=True) for group in groups if group]
 
     total_time = time.time() - start_time
     average_time_per_image = total_time / total_images if total_images > 0 else 0.0
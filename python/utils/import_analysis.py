@@ -0,0 +1,128 @@
+"""
+导入阶段的融合分析：生成缩略图时顺带计算检测流程需要的单图特征，同一次解码只做一次。
+
+常规流程里导入先调用 generate_thumbnails 解码每张照片，之后 /detect_images 又为直方图、IQA、
+人脸检测把每张照片完整解码一遍，I/O 与解码开销翻倍。启用融合分析（/generate_thumbnails 的 analysis 字段）后：
+  - 照片库中已有行、且缺少特征的照片改为一次完整解码，构建共享 ImagePyramid；
+  - 在金字塔上计算 HSV 直方图 + dHash、清晰度，以及可选的人脸检测与 IQA，经 DBManager 写入同一个 photos.db；
+  - 缩略图由同一金字塔逐级缩小得到，不再单独解码；
+  - 之后的 /detect_images 从 load_cache_from_db 读到这些特征，只剩相似度与分组。
+特征的计算方式与 image_compute.ensure_image_features 完全一致（同样的层级与抽样），两条路径的结果可以混用。
+特征已齐全、不在照片库中、或与同名 JPEG 配对的 RAW 仍走缩略图快速路径（不做完整解码）。
+"""
+
+import sqlite3
+import threading
+from typing import Dict, Set, Tuple
+
+from .database import _connect, ensure_schema
+from .image_compute import (
+    BINS,
+    HIST_LEVEL,
+    SHARPNESS_LEVEL,
+    DBManager,
+    compute_centered_hsv_histogram,
+    compute_sharpness,
+    cv_imread,
+)
+from .inference_onnx import detect_faces_from_pyramid, infer_iqa_from_pyramid
+from .phash import compute_dhash
+from .pyramid import ImagePyramid
+from .ranking import refresh_face_summary
+from .raw import raw_jpeg_pairs
+
+# 缩略图在金字塔上占用原图的阶段名（缩略图取完层级后释放）
+THUMBS_STAGE = "thumbs"
+
+
+def _path_key(file_path: str) -> str:
+    # 照片库中的 filePath 统一用 '/'（前端 normalizePath），generate_thumbnails 的 abspath 在 Windows 上是 '\\'
+    return file_path.replace("\\", "/")
+
+
+class ImportAnalyzer:
+    """
+    一次导入的融合分析器：按照片库当前状态决定哪些照片需要完整解码，并把特征写回照片库。
+
+    compute_faces / compute_iqa 默认关闭：两者需要加载 ONNX 模型、单张耗时远超解码，
+    只在导入后一定会跑检测的场景下开启。
+    """
+
+    def __init__(self, db_path: str, compute_faces: bool = False, compute_iqa: bool = False):
+        self.db_path = db_path
+        self.compute_faces = compute_faces
+        self.compute_iqa = compute_iqa
+        self.analyzed = 0
+        # analyze() 在 generate_thumbnails 的线程池里并发调用，+= 不是原子操作
+        self._analyzed_lock = threading.Lock()
+        self._missing = self._load_missing()
+        self._db = DBManager(db_path)
+
+    def _load_missing(self) -> Dict[str, Tuple[str, Set[str]]]:
+        """{归一化路径: (照片库中的 filePath, 缺失的特征名)}；特征齐全的照片不出现。"""
+        conn = _connect(self.db_path)
+        try:
+            ensure_schema(conn)
+            rows = conn.execute(
+                "SELECT filePath, histH IS NULL, dHash IS NULL, sharpness IS NULL, faceData IS NULL, IQA IS NULL "
+                "FROM present"
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[IMPORT] cannot read {self.db_path}: {e}")
+            return {}
+        finally:
+            conn.close()
+
+        # RAW+JPEG 配对只分析 JPEG，RAW 的特征在检测时由 copy_features_to_twins 直接拷贝
+        paired_raws = raw_jpeg_pairs([row[0] for row in rows])
+        missing: Dict[str, Tuple[str, Set[str]]] = {}
+        for file_path, no_hist, no_dhash, no_sharpness, no_face, no_iqa in rows:
+            if file_path in paired_raws:
+                continue
+            needed = {
+                name
+                for name, absent in (
+                    ("hist", no_hist or no_dhash),
+                    ("sharpness", no_sharpness),
+                    ("face", self.compute_faces and no_face),
+                    ("iqa", self.compute_iqa and no_iqa),
+                )
+                if absent
+            }
+            if needed:
+                missing[_path_key(file_path)] = (file_path, needed)
+        return missing
+
+    def wants(self, file_path: str) -> bool:
+        return _path_key(file_path) in self._missing
+
+    def decode(self, file_path: str) -> ImagePyramid:
+        """完整解码并登记仍需原图的阶段（含缩略图），各阶段用完后原图即被释放。"""
+        stages = [THUMBS_STAGE, *self._missing.get(_path_key(file_path), ("", ()))[1]]
+        return ImagePyramid(cv_imread(file_path), full_res_stages=stages)
+
+    def analyze(self, file_path: str, pyramid: ImagePyramid) -> None:
+        """计算缺失的特征并实时写入照片库（顺序与 ensure_image_features 相同：人脸的 1280 层级供清晰度复用）。"""
+        row_path, needed = self._missing.pop(_path_key(file_path), (file_path, set()))
+        if "hist" in needed:
+            sampled = pyramid.sampled(HIST_LEVEL)
+            self._db.update_hist(row_path, compute_centered_hsv_histogram(sampled, BINS))
+            self._db.update_dhash(row_path, compute_dhash(sampled))
+            pyramid.release_full("hist")
+        if "face" in needed:
+            self._db.update_face(row_path, detect_faces_from_pyramid(pyramid, score_thresh=0.6))
+            pyramid.release_full("face")
+        if "sharpness" in needed:
+            self._db.update_sharpness(row_path, compute_sharpness(pyramid.level(SHARPNESS_LEVEL)))
+            pyramid.release_full("sharpness")
+        if "iqa" in needed:
+            self._db.update_iqa(row_path, float(infer_iqa_from_pyramid(pyramid, color_space="RGB")))
+            pyramid.release_full("iqa")
+        with self._analyzed_lock:
+            self.analyzed += 1
+
+    def close(self) -> None:
+        self._db.close()
+        # 排序只读人脸汇总列，faceData 写入后补齐（只处理汇总列为空的行）
+        if self.compute_faces and self.analyzed:
+            refresh_face_summary(self.db_path)
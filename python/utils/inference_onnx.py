@@ -1,6 +1,11 @@
+import functools
+import hashlib
+import os
+import platform
 import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 
 import numpy as np
 import onnxruntime as ort
@@ -8,12 +13,24 @@ import cv2
 import sys
 import inspect
 
+from .env import env_int
 from .model_zoo.model_zoo import get_retinaface_model
+from .micro_batch import ClientTracker, MicroBatcher
+from .pyramid import ImagePyramid
+from .tensor_arena import get_arena, run_with_binding
 
 # 控制是否启用人脸检测的全局开关（数据库字段仍会保留）
 ENABLE_FACE_DETECTION: bool = True
 # 控制是否启用眨眼检测的全局开关
 ENABLE_BLINK_DETECTION: bool = True
+# 模型精度："fp32"（默认）或 "int8"。int8 时优先加载 checkpoint/int8/<name>.int8.onnx
+# （由 utils/quantize.py 离线生成），某个模型没有量化版本时该模型仍用 fp32
+MODEL_PRECISION: str = os.environ.get("MEDIA_TOOLBOX_MODEL_PRECISION", "fp32").strip().lower()
+_MODEL_PRECISIONS = ("fp32", "int8")
+if MODEL_PRECISION not in _MODEL_PRECISIONS:
+    # 拼错的取值（如 "INT-8"）不能静默当作 fp32 而让人误以为量化已生效
+    print(f"[MODEL] unknown MEDIA_TOOLBOX_MODEL_PRECISION={MODEL_PRECISION!r}, falling back to 'fp32'")
+    MODEL_PRECISION = "fp32"
 
 
 def _select_ort_providers() -> List[str]:
@@ -43,6 +60,23 @@ def get_resource_path(relative_path: str) -> Path:
     return base_path / relative_path
 
 
+def quantized_model_path(model_path: Path) -> Path:
+    """fp32 checkpoint 对应的 INT8 变体路径：checkpoint/int8/<stem>.int8.onnx。"""
+    return model_path.parent / "int8" / f"{model_path.stem}.int8.onnx"
+
+
+def _resolve_model_variant(model_path: Path, tag: str) -> Path:
+    """按 MODEL_PRECISION 选择实际加载的模型文件（INT8 变体缺失时回退 fp32）。"""
+    if MODEL_PRECISION != "int8":
+        return model_path
+    int8_path = quantized_model_path(model_path)
+    if int8_path.exists():
+        print(f"[{tag}] Using INT8 model {int8_path}")
+        return int8_path
+    print(f"[{tag}] INT8 model not found at {int8_path}, using float32 model.")
+    return model_path
+
+
 class _DummyIqaSession:
     """当 ONNX 模型不可用时的兜底 Session，避免程序直接崩溃。"""
 
@@ -96,17 +130,222 @@ _OCEC_INPUT_W: int = 48
 _OCEC_IS_DML = False
 _OCEC_MAX_BATCH: int = 16  # 眨眼检测最大 batch size
 
+# ============================================================================
+# 睁眼判定：跨图片微批 + 小人脸过滤
+# ============================================================================
+# 人脸框短边小于该像素数时眼睛只有几个像素，关键点 / OCEC 结果不可靠，直接标记为未评分
+EYE_STATE_MIN_FACE_PX: int = env_int("MEDIA_TOOLBOX_EYE_MIN_FACE_PX", 40, minimum=0)
+# 微批调度线程等待其他检测线程提交人脸的最长时间（毫秒）；只有一个线程在检测时不等待
+_EYE_BATCH_LINGER_MS: float = 10.0
+
 # ============================================================================
 # 🔧 新增：全局 DirectML 总锁（用于协调所有 DML Session）
 # ============================================================================
 _GLOBAL_DML_LOCK = threading.Lock()
 
+# ============================================================================
+# 模型加载状态 & 初始化锁（后台预热线程与检测工作线程可能同时触发懒加载）
+# ============================================================================
+# 状态取值：unloaded 未加载 / loading 预热加载中 / loaded 已加载未推理 /
+#          ready 已完成首次推理（ORT 内存 arena 已分配）/ unavailable 模型缺失或加载失败 / disabled 被全局开关关闭
+_MODEL_STATUS: Dict[str, str] = {"iqa": "unloaded", "face": "unloaded", "blink": "unloaded", "ocec": "unloaded"}
+_INIT_LOCK = threading.RLock()
+
+
+def _serialized_init(fn):
+    """串行化懒加载：避免预热线程与检测线程同时创建同一个 Session（重复占用内存与图优化时间）。"""
+
+    @functools.wraps(fn)
+    def wrapper() -> None:
+        with _INIT_LOCK:
+            fn()
+
+    return wrapper
+
+
+def _mark_loaded(name: str) -> None:
+    # 已 ready 的模型不回退状态（懒加载的快速返回路径不会走到这里，但重复初始化时需要保护）
+    if _MODEL_STATUS[name] != "ready":
+        _MODEL_STATUS[name] = "loaded"
+
+
+def _mark_ready(name: str) -> None:
+    if _MODEL_STATUS[name] != "ready":
+        _MODEL_STATUS[name] = "ready"
+
+
+def get_model_status() -> Dict[str, str]:
+    """各模型就绪状态快照（/status 接口展示用）。"""
+    return dict(_MODEL_STATUS)
+
 
+def set_model_precision(precision: str) -> None:
+    """切换模型精度（fp32 / int8）：卸载已加载的 Session，下次推理时按新精度懒加载。
+
+    只应在没有检测任务运行时调用（离线评测、设置变更后），否则进行中的任务会看到模型被卸载。
+    """
+    global MODEL_PRECISION
+    global _IQA_SESSION, _IQA_SESSION_CPU, _IQA_INPUT_NAMES, _IQA_IS_DML
+    global _FACE_DETECTOR, _FACE_DET_PROVIDERS, _FACE_DET_IS_DML
+    global _BLINK_SESSION, _BLINK_INPUT_NAME, _BLINK_IS_DML
+    global _OCEC_SESSION, _OCEC_INPUT_NAME, _OCEC_IS_DML
+
+    precision = precision.strip().lower()
+    if precision not in _MODEL_PRECISIONS:
+        raise ValueError(f"Unsupported model precision: {precision}. Expected one of {_MODEL_PRECISIONS}.")
+
+    with _INIT_LOCK:
+        if precision == MODEL_PRECISION:
+            return
+        MODEL_PRECISION = precision
+        _IQA_SESSION, _IQA_SESSION_CPU, _IQA_INPUT_NAMES, _IQA_IS_DML = None, None, [], False
+        _FACE_DETECTOR, _FACE_DET_PROVIDERS, _FACE_DET_IS_DML = None, [], False
+        _BLINK_SESSION, _BLINK_INPUT_NAME, _BLINK_IS_DML = None, "", False
+        _OCEC_SESSION, _OCEC_INPUT_NAME, _OCEC_IS_DML = None, "", False
+        for name in _MODEL_STATUS:
+            _MODEL_STATUS[name] = "unloaded"
+        print(f"[MODEL] Precision switched to {precision}, models will be reloaded lazily.")
+
+
+# ============================================================================
+# 优化模型缓存：ORT 图优化结果序列化到磁盘，后续启动直接加载已优化的图
+# ============================================================================
+# 环境变量可覆盖缓存目录（如便携版放到 exe 旁边）；目录不可写时自动退化为每次在线优化
+_ORT_CACHE_ENV = "MEDIA_TOOLBOX_ORT_CACHE"
+# 模型文件 hash 只在进程内计算一次（几十 MB 的模型读一遍约几十毫秒）
+_MODEL_HASH_CACHE: Dict[str, str] = {}
+
+
+def _ort_cache_dir() -> Optional[Path]:
+    """返回优化模型缓存目录，创建失败（只读安装目录、权限不足）时返回 None。"""
+    custom = os.environ.get(_ORT_CACHE_ENV)
+    if custom:
+        base = Path(custom)
+    elif sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA") or Path.home()) / "electron-media-toolbox" / "ort-cache"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches" / "electron-media-toolbox" / "ort-cache"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "electron-media-toolbox" / "ort-cache"
+    try:
+        base.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return base
+
+
+def _model_hash(model_path: Path) -> str:
+    """模型内容 hash（而非 mtime）：覆盖更新 checkpoint 后缓存自动失效。"""
+    key = str(model_path)
+    if key not in _MODEL_HASH_CACHE:
+        digest = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _MODEL_HASH_CACHE[key] = digest.hexdigest()[:16]
+    return _MODEL_HASH_CACHE[key]
+
+
+def _optimized_model_path(model_path: Path, providers: List[str]) -> Optional[Path]:
+    """缓存文件路径：按模型 hash + ORT 版本 + 首选 provider + CPU 架构区分。
+
+    ORT_ENABLE_ALL 的优化结果包含与硬件/版本相关的融合节点，
+    任何一项变化都必须视为不同的缓存条目，避免加载到不兼容的图。
+    """
+    cache_dir = _ort_cache_dir()
+    if cache_dir is None:
+        return None
+    try:
+        digest = _model_hash(model_path)
+    except OSError:
+        return None
+    provider = providers[0].replace("ExecutionProvider", "").lower() if providers else "cpu"
+    return cache_dir / f"{model_path.stem}-{digest}-ort{ort.__version__}-{provider}-{platform.machine().lower()}.onnx"
+
+
+def _make_session_options(providers: List[str]) -> ort.SessionOptions:
+    """四个模型共用的 SessionOptions 规则。"""
+    so = ort.SessionOptions()
+    if "DmlExecutionProvider" in providers:
+        # DirectML 不支持 mem pattern + 并行执行，需要串行执行模式
+        so.enable_mem_pattern = False
+        so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 关闭图优化以避免 DmlFusedNode 等 fuse 导致崩溃
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    else:
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return so
+
+
+def _resolve_session_source(model_path: Path, providers: List[str], tag: str) -> Tuple[str, ort.SessionOptions, Optional[Path]]:
+    """决定本次从哪个文件加载模型，返回 (加载路径, SessionOptions, 待落盘的缓存路径)。
+
+    - 命中缓存：直接加载已优化模型，关闭在线图优化（优化已在首次启动时完成）；
+    - 未命中：加载原模型，并通过 optimized_model_filepath 让 ORT 把优化结果写到临时文件，
+      由调用方在 Session 创建成功后原子替换为正式缓存（避免半写入文件被下次启动加载）；
+    - DirectML 本就关闭图优化，没有可缓存的内容，直接加载原模型。
+    """
+    so = _make_session_options(providers)
+    if "DmlExecutionProvider" in providers:
+        return str(model_path), so, None
+
+    cache_file = _optimized_model_path(model_path, providers)
+    if cache_file is None:
+        return str(model_path), so, None
+
+    if cache_file.exists():
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        print(f"[{tag}] Using optimized model cache {cache_file}")
+        return str(cache_file), so, None
+
+    so.optimized_model_filepath = str(cache_file.with_name(f"{cache_file.stem}.{os.getpid()}.tmp"))
+    return str(model_path), so, cache_file
+
+
+def _commit_optimized_model(so: ort.SessionOptions, cache_file: Optional[Path]) -> None:
+    """Session 创建成功后把临时优化模型原子替换为正式缓存；失败只影响下次启动速度。"""
+    if cache_file is None:
+        return
+    try:
+        os.replace(so.optimized_model_filepath, cache_file)
+    except OSError as e:
+        print(f"[ORT] Failed to persist optimized model cache {cache_file} ({e}).")
+
+
+def _create_ort_session(
+    model_path: Path,
+    providers: List[str],
+    tag: str,
+    factory: Optional[Callable[[str, ort.SessionOptions], object]] = None,
+):
+    """创建 ORT Session，优先复用磁盘上的已优化模型。
+
+    缓存文件损坏（断电截断、ORT 升级后格式不兼容但 key 未变）时删除缓存并回退到原模型，
+    保证缓存永远不会让模型变得不可用。
+    factory(加载路径, SessionOptions) 用于包装 Session 的模型（如 RetinaFace），缺省直接创建 InferenceSession。
+    """
+    if factory is None:
+        factory = lambda path, so: ort.InferenceSession(path, sess_options=so, providers=providers)  # noqa: E731
+    load_path, so, cache_file = _resolve_session_source(model_path, providers, tag)
+    try:
+        session = factory(load_path, so)
+    except Exception as e:  # noqa: BLE001
+        if load_path == str(model_path):
+            raise
+        print(f"[{tag}] Optimized model cache unusable ({e}), rebuilding from {model_path}.")
+        Path(load_path).unlink(missing_ok=True)
+        load_path, so, cache_file = _resolve_session_source(model_path, providers, tag)
+        session = factory(load_path, so)
+    _commit_optimized_model(so, cache_file)
+    return session
+
+
+@_serialized_init
 def _init_iqa_sessions_if_needed() -> None:
-    """懒加载方式初始化 IQA ONNX Session。"""
+    """懒加载方式初始化 IQA ONNX Session（CPU 兜底 Session 推迟到主 Session 推理失败时再创建）。"""
     global _IQA_SESSION, _IQA_SESSION_CPU, _IQA_INPUT_NAMES, _IQA_IS_DML
 
-    if _IQA_SESSION is not None and _IQA_SESSION_CPU is not None and _IQA_INPUT_NAMES:
+    if _IQA_SESSION is not None and _IQA_INPUT_NAMES:
         return
 
     if not _IQA_CHECKPOINT_ONNX.exists():
@@ -115,40 +354,22 @@ def _init_iqa_sessions_if_needed() -> None:
         _IQA_SESSION_CPU = _IQA_SESSION
         _IQA_INPUT_NAMES = ["input_authentic", "input_synthetic"]
         _IQA_IS_DML = False
+        _MODEL_STATUS["iqa"] = "unavailable"
         return
 
     try:
         providers = _select_ort_providers()
-
-        # ---- GPU / DirectML Session Options ----
-        _session_options = ort.SessionOptions()
-        if "DmlExecutionProvider" in providers:
-            # DirectML 不支持 mem pattern + 并行执行，需要串行执行模式
-            _session_options.enable_mem_pattern = False
-            _session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-            # 关闭图优化以避免 DmlFusedNode 等 fuse 导致崩溃
-            _session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
-        else:
-            _session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-
-        _IQA_SESSION = ort.InferenceSession(
-            str(_IQA_CHECKPOINT_ONNX),
-            sess_options=_session_options,
-            providers=providers,
-        )
+        model_path = _resolve_model_variant(_IQA_CHECKPOINT_ONNX, "IQA")
+        _IQA_SESSION = _create_ort_session(model_path, providers, "IQA")
 
         _IQA_INPUT_NAMES = [inp.name for inp in _IQA_SESSION.get_inputs()]
         _IQA_IS_DML = "DmlExecutionProvider" in _IQA_SESSION.get_providers()
-        print(f"[IQA] Loaded ONNX model from {_IQA_CHECKPOINT_ONNX}, providers={_IQA_SESSION.get_providers()}, inputs={_IQA_INPUT_NAMES}")
-
-        # ---- CPU Fallback Session ----
-        _cpu_so = ort.SessionOptions()
-        _cpu_so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        _IQA_SESSION_CPU = ort.InferenceSession(
-            str(_IQA_CHECKPOINT_ONNX),
-            sess_options=_cpu_so,
-            providers=["CPUExecutionProvider"],
-        )
+        print(f"[IQA] Loaded ONNX model from {model_path}, providers={_IQA_SESSION.get_providers()}, inputs={_IQA_INPUT_NAMES}")
+
+        # 主 Session 本身就是纯 CPU 时，兜底 Session 与之等价，直接复用
+        if _IQA_SESSION.get_providers() == ["CPUExecutionProvider"]:
+            _IQA_SESSION_CPU = _IQA_SESSION
+        _mark_loaded("iqa")
 
     except Exception as e:  # noqa: BLE001
         print(f"[IQA] Failed to create ONNX Runtime session ({e}). Falling back to dummy session to avoid crash.")
@@ -156,8 +377,27 @@ def _init_iqa_sessions_if_needed() -> None:
         _IQA_SESSION_CPU = _IQA_SESSION
         _IQA_INPUT_NAMES = ["input_authentic", "input_synthetic"]
         _IQA_IS_DML = False
-
-
+        _MODEL_STATUS["iqa"] = "unavailable"
+
+
+def _get_iqa_cpu_session():
+    """GPU/DirectML 推理失败时才创建 CPU 兜底 Session，正常路径不再重复加载一份模型。"""
+    global _IQA_SESSION_CPU
+    if _IQA_SESSION_CPU is not None:
+        return _IQA_SESSION_CPU
+    # 多个线程可能同时推理失败：与其他懒加载共用初始化锁，只创建一份 Session，也不会并发写同一个优化模型缓存
+    with _INIT_LOCK:
+        if _IQA_SESSION_CPU is None:
+            try:
+                model_path = _resolve_model_variant(_IQA_CHECKPOINT_ONNX, "IQA")
+                _IQA_SESSION_CPU = _create_ort_session(model_path, ["CPUExecutionProvider"], "IQA")
+            except Exception as e:  # noqa: BLE001
+                print(f"[IQA] Failed to create CPU fallback session ({e}). Using dummy session.")
+                _IQA_SESSION_CPU = _DummyIqaSession()
+        return _IQA_SESSION_CPU
+
+
+@_serialized_init
 def _init_face_detector_if_needed() -> None:
     """懒加载人脸检测器 (SCRFD det_500m.onnx)。"""
     global _FACE_DETECTOR, _FACE_DET_PROVIDERS, _FACE_DET_IS_DML
@@ -170,23 +410,33 @@ def _init_face_detector_if_needed() -> None:
         _FACE_DETECTOR = None
         _FACE_DET_PROVIDERS = []
         _FACE_DET_IS_DML = False
+        _MODEL_STATUS["face"] = "unavailable"
         return
 
     try:
         providers = _select_ort_providers()
+        # RetinaFace.prepare(ctx_id=-1) 会把非 CUDA 的 Session 切回纯 CPU（set_providers 会整个重建 Session），
+        # 这里直接按最终生效的 provider 创建，避免图优化跑两遍，也让缓存 key 与实际 provider 一致
+        use_cuda = "CUDAExecutionProvider" in providers
+        if not use_cuda:
+            providers = ["CPUExecutionProvider"]
         _FACE_DET_PROVIDERS = providers
         _FACE_DET_IS_DML = "DmlExecutionProvider" in providers
         print(f"[FACE] providers={providers}, is_dml={_FACE_DET_IS_DML}")
 
-        # insightface 的 get_model 会创建 ORT Session，并使用传入 providers
-        _FACE_DETECTOR = get_retinaface_model(str(_FACE_DET_MODEL_PATH), providers=providers)
+        model_path = _resolve_model_variant(_FACE_DET_MODEL_PATH, "FACE")
+        _FACE_DETECTOR = _create_ort_session(
+            model_path,
+            providers,
+            "FACE",
+            lambda path, so: get_retinaface_model(path, providers=providers, sess_options=so),
+        )
 
         # 兼容不同版本 prepare 参数
         sig = inspect.signature(_FACE_DETECTOR.prepare)
         kw = {}
         if "ctx_id" in sig.parameters:
             # DirectML / CPU 用 -1，CUDA 用 0
-            use_cuda = "CUDAExecutionProvider" in providers
             kw["ctx_id"] = 0 if use_cuda else -1
         if "input_size" in sig.parameters:
             kw["input_size"] = _FACE_DET_SIZE
@@ -203,6 +453,7 @@ def _init_face_detector_if_needed() -> None:
         if hasattr(_FACE_DETECTOR, "det_thresh"):
             _FACE_DETECTOR.det_thresh = 0.5
 
+        _mark_loaded("face")
         print("[FACE] Face detector initialized successfully.")
 
     except Exception as e:  # noqa: BLE001
@@ -210,8 +461,10 @@ def _init_face_detector_if_needed() -> None:
         _FACE_DETECTOR = None
         _FACE_DET_PROVIDERS = []
         _FACE_DET_IS_DML = False
+        _MODEL_STATUS["face"] = "unavailable"
 
 
+@_serialized_init
 def _init_blink_session_if_needed() -> None:
     """懒加载眨眼检测模型 (2d106det_batch.onnx)。"""
     global _BLINK_SESSION, _BLINK_INPUT_NAME, _BLINK_IS_DML
@@ -219,25 +472,23 @@ def _init_blink_session_if_needed() -> None:
         return
     if not _BLINK_MODEL_PATH.exists():
         print(f"[BLINK] 2d106det_batch.onnx not found at {_BLINK_MODEL_PATH}, blink detection disabled.")
+        _MODEL_STATUS["blink"] = "unavailable"
         return
     try:
         providers = _select_ort_providers()
-        so = ort.SessionOptions()
-        if "DmlExecutionProvider" in providers:
-            so.enable_mem_pattern = False
-            so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
-        else:
-            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        _BLINK_SESSION = ort.InferenceSession(str(_BLINK_MODEL_PATH), sess_options=so, providers=providers)
+        model_path = _resolve_model_variant(_BLINK_MODEL_PATH, "BLINK")
+        _BLINK_SESSION = _create_ort_session(model_path, providers, "BLINK")
         _BLINK_INPUT_NAME = _BLINK_SESSION.get_inputs()[0].name
         _BLINK_IS_DML = "DmlExecutionProvider" in _BLINK_SESSION.get_providers()
-        print(f"[BLINK] Loaded model from {_BLINK_MODEL_PATH}, providers={_BLINK_SESSION.get_providers()}")
+        _mark_loaded("blink")
+        print(f"[BLINK] Loaded model from {model_path}, providers={_BLINK_SESSION.get_providers()}")
     except Exception as e:  # noqa: BLE001
         print(f"[BLINK] Failed to init session ({e}). Blink detection disabled.")
         _BLINK_SESSION = None
+        _MODEL_STATUS["blink"] = "unavailable"
 
 
+@_serialized_init
 def _init_ocec_session_if_needed() -> None:
     """懒加载 OCEC 眼睛开闭分类模型。"""
     global _OCEC_SESSION, _OCEC_INPUT_NAME, _OCEC_INPUT_H, _OCEC_INPUT_W, _OCEC_IS_DML
@@ -245,27 +496,24 @@ def _init_ocec_session_if_needed() -> None:
         return
     if not _OCEC_MODEL_PATH.exists():
         print(f"[OCEC] ocec_l.onnx not found at {_OCEC_MODEL_PATH}, OCEC disabled.")
+        _MODEL_STATUS["ocec"] = "unavailable"
         return
     try:
         providers = _select_ort_providers()
-        so = ort.SessionOptions()
-        if "DmlExecutionProvider" in providers:
-            so.enable_mem_pattern = False
-            so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
-        else:
-            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        _OCEC_SESSION = ort.InferenceSession(str(_OCEC_MODEL_PATH), sess_options=so, providers=providers)
+        model_path = _resolve_model_variant(_OCEC_MODEL_PATH, "OCEC")
+        _OCEC_SESSION = _create_ort_session(model_path, providers, "OCEC")
         inp = _OCEC_SESSION.get_inputs()[0]
         _OCEC_INPUT_NAME = inp.name
         shape = inp.shape
         _OCEC_INPUT_H = int(shape[2]) if shape[2] else 30
         _OCEC_INPUT_W = int(shape[3]) if shape[3] else 48
         _OCEC_IS_DML = "DmlExecutionProvider" in _OCEC_SESSION.get_providers()
-        print(f"[OCEC] Loaded model from {_OCEC_MODEL_PATH}, input=({_OCEC_INPUT_H},{_OCEC_INPUT_W}), providers={_OCEC_SESSION.get_providers()}")
+        _mark_loaded("ocec")
+        print(f"[OCEC] Loaded model from {model_path}, input=({_OCEC_INPUT_H},{_OCEC_INPUT_W}), providers={_OCEC_SESSION.get_providers()}")
     except Exception as e:  # noqa: BLE001
         print(f"[OCEC] Failed to init session ({e}). OCEC disabled.")
         _OCEC_SESSION = None
+        _MODEL_STATUS["ocec"] = "unavailable"
 
 
 def _eye_aspect_ratio(eye_pts: np.ndarray) -> float:
@@ -304,43 +552,104 @@ def _compute_eye_bbox(eye_pts: np.ndarray, img_shape: Tuple[int, ...], scale: fl
     return (ex1, ey1, ex2, ey2) if ex2 > ex1 and ey2 > ey1 else None
 
 
+def _bgr_to_chw_into(patch_bgr: np.ndarray, out_chw: np.ndarray, divisor: Optional[np.float32] = None) -> None:
+    """BGR uint8 HWC patch 直接写入 RGB float32 CHW 缓冲区（融合 BGR→RGB、HWC→CHW 与类型转换）。
+
+    divisor 非空时顺带做 x / divisor，与原先 astype(float32) / 255.0 的 float32 运算逐位一致。
+    """
+    for c in range(3):
+        # RGB 第 c 通道对应 BGR 第 2-c 通道
+        if divisor is None:
+            out_chw[c] = patch_bgr[:, :, 2 - c]
+        else:
+            np.divide(patch_bgr[:, :, 2 - c], divisor, out=out_chw[c])
+
+
+def _blink_infer_batch(batch: np.ndarray) -> np.ndarray:
+    """关键点模型推理（在微批调度线程中执行），返回 (k, 212)。"""
+    if _BLINK_SESSION is None:
+        raise RuntimeError("blink session is not loaded")
+    if _BLINK_IS_DML:
+        with _GLOBAL_DML_LOCK:
+            out = run_with_binding(_BLINK_SESSION, {_BLINK_INPUT_NAME: batch})[0]
+    else:
+        out = run_with_binding(_BLINK_SESSION, {_BLINK_INPUT_NAME: batch})[0]
+    _mark_ready("blink")
+    return out.reshape(batch.shape[0], -1)
+
+
+def _ocec_infer_batch(batch: np.ndarray) -> np.ndarray:
+    """OCEC 推理（在微批调度线程中执行），返回 (k, 1) 的睁眼概率。"""
+    if _OCEC_SESSION is None:
+        raise RuntimeError("OCEC session is not loaded")
+    if _OCEC_IS_DML:
+        with _GLOBAL_DML_LOCK:
+            out = run_with_binding(_OCEC_SESSION, {_OCEC_INPUT_NAME: batch})[0]
+    else:
+        out = run_with_binding(_OCEC_SESSION, {_OCEC_INPUT_NAME: batch})[0]
+    _mark_ready("ocec")
+    return out.reshape(batch.shape[0], -1)
+
+
+# 正在执行 detect_faces_from_bgr 的线程数：微批调度线程据此判断是否值得等待其他图片的人脸
+_EYE_CLIENTS = ClientTracker()
+_BLINK_BATCHER = MicroBatcher("blink", _blink_infer_batch, _BLINK_MAX_BATCH, _EYE_BATCH_LINGER_MS, _EYE_CLIENTS)
+_OCEC_BATCHER = MicroBatcher("ocec", _ocec_infer_batch, _OCEC_MAX_BATCH, _EYE_BATCH_LINGER_MS, _EYE_CLIENTS)
+
+
+def _mark_small_faces_unscored(faces: List[dict]) -> None:
+    """短边小于 EYE_STATE_MIN_FACE_PX 的人脸不做睁眼判定（不输出 eye_open，前端按睁眼处理）。"""
+    for f in faces:
+        x1, y1, x2, y2 = f["bbox"]
+        if min(x2 - x1, y2 - y1) < EYE_STATE_MIN_FACE_PX:
+            f["eye_unscored"] = True
+
+
+def _fuse_ear_only(faces: List[dict]) -> None:
+    """无 OCEC 结果时仅用 EAR 概率计算 eye_open（跳过未评分的小人脸）。"""
+    for f in faces:
+        pr = f.pop("_ear_prob_r", 0.5)
+        pl = f.pop("_ear_prob_l", 0.5)
+        f.pop("_eye_bbox_r", None)
+        f.pop("_eye_bbox_l", None)
+        if not f.get("eye_unscored"):
+            f["eye_open"] = float(np.sqrt((pr**2 + pl**2) / 2.0))
+
+
 def _run_blink_landmark(img_bgr: np.ndarray, faces: List[dict]) -> None:
-    """批量运行 2d106det 关键点检测，计算双眼 EAR 概率并保存眼部区域到 faces。"""
+    """运行 2d106det 关键点检测（与其他图片的人脸共用 batch），计算双眼 EAR 概率并保存眼部区域到 faces。"""
     if not ENABLE_BLINK_DETECTION or _BLINK_SESSION is None or not faces:
         return
 
     try:
-        n = len(faces)
-        patches: List[Optional[np.ndarray]] = []
-        metas: List[Tuple[int, int, int, int]] = []  # (ex1, ey1, w, h)
+        metas: List[Optional[Tuple[int, int, int, int]]] = []  # (ex1, ey1, w, h)，无效 bbox / 未评分人脸为 None
 
         for f in faces:
+            if f.get("eye_unscored"):
+                metas.append(None)
+                continue
             x1, y1, x2, y2 = f["bbox"]
             ex1, ey1, ex2, ey2 = _expand_bbox((x1, y1, x2, y2), img_bgr.shape, 1.2)
             if ex2 <= ex1 or ey2 <= ey1:
-                patches.append(None)
-                metas.append((0, 0, 0, 0))
+                metas.append(None)
                 continue
-            patch = cv2.resize(img_bgr[ey1:ey2, ex1:ex2], (192, 192))
-            patch = cv2.cvtColor(patch, cv2.COLOR_BGR2RGB).astype(np.float32).transpose(2, 0, 1)
-            patches.append(patch)
             metas.append((ex1, ey1, ex2 - ex1, ey2 - ey1))
 
-        # 分 batch 推理
-        for start in range(0, n, _BLINK_MAX_BATCH):
-            end = min(start + _BLINK_MAX_BATCH, n)
-            valid_idx = [i for i in range(start, end) if patches[i] is not None]
-            if not valid_idx:
-                continue
+        # 本图的 patch 写进本线程 arena 缓冲区后提交给微批调度线程；submit 阻塞期间缓冲区不会被改写
+        arena = get_arena()
+        batch_buf = arena.get("blink_batch", (_BLINK_MAX_BATCH, 3, 192, 192))
+        patch_buf = arena.get("blink_patch", (192, 192, 3), np.uint8)
 
-            batch = np.ascontiguousarray(np.stack([patches[i] for i in valid_idx], axis=0))
-            if _BLINK_IS_DML:
-                with _GLOBAL_DML_LOCK:
-                    out = _BLINK_SESSION.run(None, {_BLINK_INPUT_NAME: batch})[0]
-            else:
-                out = _BLINK_SESSION.run(None, {_BLINK_INPUT_NAME: batch})[0]
+        valid_all = [i for i in range(len(faces)) if metas[i] is not None]
+        for start in range(0, len(valid_all), _BLINK_MAX_BATCH):
+            valid_idx = valid_all[start : start + _BLINK_MAX_BATCH]
+
+            for k, idx in enumerate(valid_idx):
+                ex1, ey1, wf, hf = metas[idx]
+                patch = cv2.resize(img_bgr[ey1 : ey1 + hf, ex1 : ex1 + wf], (192, 192), dst=patch_buf)
+                _bgr_to_chw_into(patch, batch_buf[k])
 
-            out = out.reshape(len(valid_idx), 106, 2)
+            out = _BLINK_BATCHER.submit(batch_buf[: len(valid_idx)]).reshape(len(valid_idx), 106, 2)
             for j, idx in enumerate(valid_idx):
                 lm = (out[j] + 1.0) / 2.0  # [-1,1] -> [0,1]
                 ex1, ey1, wf, hf = metas[idx]
@@ -369,50 +678,37 @@ def _run_blink_landmark(img_bgr: np.ndarray, faces: List[dict]) -> None:
 
 
 def _run_ocec_batch(img_bgr: np.ndarray, faces: List[dict]) -> None:
-    """批量运行 OCEC 模型对眼部区域进行开闭眼分类，融合 EAR 概率得到最终 eye_open。"""
+    """运行 OCEC 对眼部区域做开闭眼分类（与其他图片的眼睛共用 batch），融合 EAR 概率得到最终 eye_open。"""
     if _OCEC_SESSION is None:
         # 无 OCEC 模型时直接使用 EAR 概率
-        for f in faces:
-            pr = f.pop("_ear_prob_r", 0.5)
-            pl = f.pop("_ear_prob_l", 0.5)
-            f.pop("_eye_bbox_r", None)
-            f.pop("_eye_bbox_l", None)
-            f["eye_open"] = float(np.sqrt((pr**2 + pl**2) / 2.0))
+        _fuse_ear_only(faces)
         return
 
     try:
-        # 收集所有需要推理的眼部 patch
-        eye_patches: List[Optional[np.ndarray]] = []  # 每个 face 有 [右眼, 左眼]
+        # 收集所有需要推理的眼部区域（每个 face 依次为 [右眼, 左眼]），空区域记为 None
+        eye_boxes: List[Optional[Tuple[int, int, int, int]]] = []
         for f in faces:
             for key in ("_eye_bbox_r", "_eye_bbox_l"):
                 bbox = f.get(key)
                 if bbox is None:
-                    eye_patches.append(None)
+                    eye_boxes.append(None)
                     continue
                 x1, y1, x2, y2 = bbox
-                crop = img_bgr[y1:y2, x1:x2]
-                if crop.size == 0:
-                    eye_patches.append(None)
-                    continue
-                resized = cv2.resize(crop, (_OCEC_INPUT_W, _OCEC_INPUT_H))
-                rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
-                eye_patches.append(rgb.transpose(2, 0, 1))
-
-        # OCEC 批量推理
-        ocec_probs = [None] * len(eye_patches)
-        total = len(eye_patches)
-        for start in range(0, total, _OCEC_MAX_BATCH):
-            end = min(start + _OCEC_MAX_BATCH, total)
-            valid_idx = [i for i in range(start, end) if eye_patches[i] is not None]
-            if not valid_idx:
-                continue
-            batch = np.ascontiguousarray(np.stack([eye_patches[i] for i in valid_idx], axis=0), dtype=np.float32)
-            if _OCEC_IS_DML:
-                with _GLOBAL_DML_LOCK:
-                    out = _OCEC_SESSION.run(None, {_OCEC_INPUT_NAME: batch})[0]
-            else:
-                out = _OCEC_SESSION.run(None, {_OCEC_INPUT_NAME: batch})[0]
-            out = np.clip(out.flatten(), 0.0, 1.0)
+                eye_boxes.append(bbox if img_bgr[y1:y2, x1:x2].size else None)
+
+        arena = get_arena()
+        batch_buf = arena.get("ocec_batch", (_OCEC_MAX_BATCH, 3, _OCEC_INPUT_H, _OCEC_INPUT_W))
+        patch_buf = arena.get("ocec_patch", (_OCEC_INPUT_H, _OCEC_INPUT_W, 3), np.uint8)
+
+        ocec_probs: List[Optional[float]] = [None] * len(eye_boxes)
+        valid_all = [i for i in range(len(eye_boxes)) if eye_boxes[i] is not None]
+        for start in range(0, len(valid_all), _OCEC_MAX_BATCH):
+            valid_idx = valid_all[start : start + _OCEC_MAX_BATCH]
+            for k, idx in enumerate(valid_idx):
+                x1, y1, x2, y2 = eye_boxes[idx]
+                patch = cv2.resize(img_bgr[y1:y2, x1:x2], (_OCEC_INPUT_W, _OCEC_INPUT_H), dst=patch_buf)
+                _bgr_to_chw_into(patch, batch_buf[k], divisor=np.float32(255.0))
+            out = np.clip(_OCEC_BATCHER.submit(batch_buf[: len(valid_idx)]).reshape(-1), 0.0, 1.0)
             for j, idx in enumerate(valid_idx):
                 ocec_probs[idx] = float(out[j])
 
@@ -422,6 +718,8 @@ def _run_ocec_batch(img_bgr: np.ndarray, faces: List[dict]) -> None:
             pl_ear = f.pop("_ear_prob_l", 0.5)
             f.pop("_eye_bbox_r", None)
             f.pop("_eye_bbox_l", None)
+            if f.get("eye_unscored"):
+                continue
 
             pr_ocec = ocec_probs[i * 2]
             pl_ocec = ocec_probs[i * 2 + 1]
@@ -436,12 +734,21 @@ def _run_ocec_batch(img_bgr: np.ndarray, faces: List[dict]) -> None:
     except Exception as e:
         print(f"[OCEC] Error during OCEC inference: {e}")
         # 降级到仅使用 EAR 概率
-        for f in faces:
-            pr = f.pop("_ear_prob_r", 0.5)
-            pl = f.pop("_ear_prob_l", 0.5)
-            f.pop("_eye_bbox_r", None)
-            f.pop("_eye_bbox_l", None)
-            f["eye_open"] = float(np.sqrt((pr**2 + pl**2) / 2.0))
+        _fuse_ear_only(faces)
+
+
+# (x / 255 - mean) / std 合并为 x * scale - offset：每通道一次乘法 + 一次原地减法完成归一化
+_IQA_SCALE = (1.0 / (255.0 * _IMAGENET_STD)).astype(np.float32)
+_IQA_OFFSET = (_IMAGENET_MEAN / _IMAGENET_STD).astype(np.float32)
+
+
+def _normalize_bgr_into(img_bgr: np.ndarray, out_nchw: np.ndarray) -> np.ndarray:
+    """BGR uint8 HWC 图像归一化后直接写入 [1, 3, H, W] 缓冲区（RGB 通道顺序）。"""
+    for c in range(3):
+        plane = out_nchw[0, c]
+        np.multiply(img_bgr[:, :, 2 - c], _IQA_SCALE[c], out=plane)
+        plane -= _IQA_OFFSET[c]
+    return out_nchw
 
 
 def preprocess_iqa_from_bgr(
@@ -449,32 +756,49 @@ def preprocess_iqa_from_bgr(
     color_space: str = "RGB",
 ) -> Tuple[np.ndarray, np.ndarray]:
     """根据 IQA 模型需求，对 BGR 图像做前处理，输出两个 NCHW Tensor。"""
-    # BGR -> RGB
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    return preprocess_iqa_from_pyramid(ImagePyramid(img_bgr), color_space=color_space)
 
-    if color_space == "RGB":
-        working = img_rgb
-    else:
+
+def preprocess_iqa_from_pyramid(
+    pyramid: ImagePyramid,
+    color_space: str = "RGB",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """IQA 前处理：authentic 分支取金字塔层级，synthetic 分支仍在原图上做原生分辨率裁剪。
+
+    两个输出都是当前线程 arena 中的复用缓冲区：resize 与裁剪都在 BGR 上完成
+    （逐通道插值与通道顺序无关），BGR→RGB、归一化和 HWC→NCHW 在写入缓冲区时一次完成，
+    不再产生 RGB 副本、float32 中间数组、转置副本和 astype 副本。
+    """
+    if color_space != "RGB":
         raise ValueError(
             f"Unsupported color_space: {color_space}. Only 'RGB' is supported in IQA pipeline.",
         )
 
-    # authentic 分支：Resize 到 384x384
+    arena = get_arena()
+
+    # authentic 分支：Resize 到 384x384（从宽高都不小于 384 的最小层级缩放，而不是从原图）
     authentic = cv2.resize(
-        working,
+        pyramid.level_covering(384, 384),
         (384, 384),
+        dst=arena.get("iqa_authentic_u8", (384, 384, 3), np.uint8),
         interpolation=cv2.INTER_AREA,
     )
 
     # synthetic 分支：CenterCrop 到 1280x1280（先对原图操作）
-    h, w, _ = working.shape
+    img_bgr = pyramid.full
+    h, w, _ = img_bgr.shape
     crop_size = 1280
     if h < crop_size or w < crop_size:
         # 先将短边缩放到 1280，再中心裁剪
         scale = crop_size / min(h, w)
         new_w = int(round(w * scale))
         new_h = int(round(h * scale))
-        resized = cv2.resize(working, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        resized = cv2.resize(
+            img_bgr,
+            (new_w, new_h),
+            dst=arena.get("iqa_upscaled_u8", (new_h, new_w, 3), np.uint8),
+            interpolation=cv2.INTER_AREA,
+        )
         h, w, _ = resized.shape
         y0 = max((h - crop_size) // 2, 0)
         x0 = max((w - crop_size) // 2, 0)
@@ -482,31 +806,28 @@ def preprocess_iqa_from_bgr(
     else:
         y0 = (h - crop_size) // 2
         x0 = (w - crop_size) // 2
-        synthetic = working[y0 : y0 + crop_size, x0 : x0 + crop_size]
-
-    def _to_nchw_normalized(img: np.ndarray) -> np.ndarray:
-        # HWC uint8 -> float32 [0,1]
-        arr = img.astype(np.float32) / 255.0
-        # Normalize
-        arr = (arr - _IMAGENET_MEAN) / _IMAGENET_STD
-        # HWC -> NCHW
-        arr = np.transpose(arr, (2, 0, 1))
-        # [1, C, H, W]
-        return arr[None, :, :, :].astype(np.float32)
-
-    image_authentic = _to_nchw_normalized(authentic)
-    image_synthetic = _to_nchw_normalized(synthetic)
+        # 原图足够大时直接在视图上归一化，不复制裁剪区域
+        synthetic = img_bgr[y0 : y0 + crop_size, x0 : x0 + crop_size]
+
+    image_authentic = _normalize_bgr_into(authentic, arena.get("iqa_authentic", (1, 3, 384, 384)))
+    sh, sw = synthetic.shape[:2]
+    image_synthetic = _normalize_bgr_into(synthetic, arena.get("iqa_synthetic", (1, 3, sh, sw)))
     return image_authentic, image_synthetic
 
 
 def infer_iqa_from_bgr(img_bgr: np.ndarray, color_space: str = "RGB") -> float:
     """直接从 BGR 图像计算 IQA 分数，返回标量评分（已 *20）。"""
+    return infer_iqa_from_pyramid(ImagePyramid(img_bgr), color_space=color_space)
+
+
+def infer_iqa_from_pyramid(pyramid: ImagePyramid, color_space: str = "RGB") -> float:
+    """从共享金字塔计算 IQA 分数，返回标量评分（已 *20）。"""
     _init_iqa_sessions_if_needed()
 
     if len(_IQA_INPUT_NAMES) != 2:
         raise RuntimeError(f"Expected IQA ONNX model with 2 inputs, got {_IQA_INPUT_NAMES}")
 
-    image_authentic, image_synthetic = preprocess_iqa_from_bgr(img_bgr, color_space=color_space)
+    image_authentic, image_synthetic = preprocess_iqa_from_pyramid(pyramid, color_space=color_space)
 
     inputs: Dict[str, np.ndarray] = {
         _IQA_INPUT_NAMES[0]: image_authentic,
@@ -517,25 +838,36 @@ def infer_iqa_from_bgr(img_bgr: np.ndarray, color_space: str = "RGB") -> float:
         # 🔧 使用全局 DML 锁
         if _IQA_IS_DML:
             with _GLOBAL_DML_LOCK:
-                outputs = _IQA_SESSION.run(None, inputs)
+                outputs = run_with_binding(_IQA_SESSION, inputs)
         else:
-            outputs = _IQA_SESSION.run(None, inputs)
+            outputs = run_with_binding(_IQA_SESSION, inputs)
     except Exception as e:  # noqa: BLE001
         print(f"[IQA] GPU/DirectML inference failed ({e}), falling back to CPUExecutionProvider.")
-        outputs = _IQA_SESSION_CPU.run(None, inputs)
+        outputs = _get_iqa_cpu_session().run(None, inputs)
 
+    if not isinstance(_IQA_SESSION, _DummyIqaSession):
+        _mark_ready("iqa")
     score_array = outputs[0]
     score = float(np.asarray(score_array).reshape(-1)[0])
     return float(score) * 20.0
 
 
 def detect_faces_from_bgr(img_bgr: np.ndarray, score_thresh: float = 0.6) -> dict:
-    """在 BGR 图像上做人脸检测 + 眨眼检测，返回易于前端消费的 JSON 结构。
+    """在 BGR 图像上做人脸检测 + 眨眼检测（结构见 detect_faces_from_pyramid）。"""
+    return detect_faces_from_pyramid(ImagePyramid(img_bgr), score_thresh=score_thresh)
+
+
+def detect_faces_from_pyramid(pyramid: ImagePyramid, score_thresh: float = 0.6) -> dict:
+    """在共享金字塔上做人脸检测 + 眨眼检测，返回易于前端消费的 JSON 结构。
+
+    检测在长边 1280 的层级上进行（检测器不再自己从原图缩放），bbox 映射回原图坐标；
+    关键点 / OCEC 的 patch 仍从原图裁剪，保证小人脸的眼部细节。
 
     返回示例：
     {
         "faces": [
             {"bbox": [x1, y1, x2, y2], "score": 0.93, "eye_open": 0.25},
+            {"bbox": [x1, y1, x2, y2], "score": 0.71, "eye_unscored": true},  # 人脸过小，未做睁眼判定
             ...
         ]
     }
@@ -550,58 +882,134 @@ def detect_faces_from_bgr(img_bgr: np.ndarray, score_thresh: float = 0.6) -> dic
     if _FACE_DETECTOR is None:
         return {"faces": []}
 
-    try:
-        # 🔧 使用全局 DML 锁保护整个人脸检测流程
-        sig = inspect.signature(_FACE_DETECTOR.detect)
-        kw = {}
-        if "input_size" in sig.parameters:
-            kw["input_size"] = _FACE_DET_SIZE
-        if "max_num" in sig.parameters:
-            kw["max_num"] = 0
-        if "metric" in sig.parameters:
-            kw["metric"] = "default"
+    # 检测期间计入活跃线程：关键点 / OCEC 微批调度据此等待其他图片的人脸凑 batch
+    with _EYE_CLIENTS:
+        try:
+            # 🔧 使用全局 DML 锁保护整个人脸检测流程
+            sig = inspect.signature(_FACE_DETECTOR.detect)
+            kw = {}
+            if "input_size" in sig.parameters:
+                kw["input_size"] = _FACE_DET_SIZE
+            if "max_num" in sig.parameters:
+                kw["max_num"] = 0
+            if "metric" in sig.parameters:
+                kw["metric"] = "default"
+
+            det_img = pyramid.level(max(_FACE_DET_SIZE))
+            # 使用全局锁保护所有 DirectML 操作
+            if _FACE_DET_IS_DML:
+                with _GLOBAL_DML_LOCK:
+                    bboxes, _kpss = _FACE_DETECTOR.detect(det_img, **kw)
+            else:
+                bboxes, _kpss = _FACE_DETECTOR.detect(det_img, **kw)
+            _mark_ready("face")
+            sx, sy = pyramid.scale_of(det_img)
+
+            faces: list[dict] = []
+            if bboxes is not None:
+                for bb in bboxes:
+                    x1, y1, x2, y2, score = bb.astype(np.float32).tolist()
+                    if score < score_thresh:
+                        continue
+                    x1, y1, x2, y2 = x1 / sx, y1 / sy, x2 / sx, y2 / sy
+                    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+                    faces.append({"bbox": [float(x1), float(y1), float(x2), float(y2)], "score": float(score), "cx": cx, "cy": cy})
+
+            # 按空间位置排序
+            if len(faces) >= 2:
+                pts = np.array([[f["cx"], f["cy"]] for f in faces])
+                mean = pts.mean(axis=0)
+                _, _, vh = np.linalg.svd(pts - mean, full_matrices=False)
+                direction = vh[0]
+                if direction[0] + direction[1] < 0:
+                    direction = -direction
+                projs = [(pts[i] - mean) @ direction for i in range(len(faces))]
+                faces = [faces[i] for i in np.argsort(projs)]
+
+            for f in faces:
+                f.pop("cx", None)
+                f.pop("cy", None)
+
+            # 过小的人脸不参与睁眼判定，省去关键点与 OCEC 推理
+            _mark_small_faces_unscored(faces)
+            img_bgr = pyramid.full
+            # 批量关键点检测 + EAR 计算 + 眼部区域提取
+            _run_blink_landmark(img_bgr, faces)
+            # 批量 OCEC 推理 + 融合概率得到最终 eye_open
+            _run_ocec_batch(img_bgr, faces)
+
+            return {"faces": faces}
+
+        except Exception as e:  # noqa: BLE001
+            print(f"[FACE] Face detection failed ({e}).")
+            import traceback
+
+            traceback.print_exc()  # 🔧 打印完整堆栈
+            return {"faces": []}
 
-        # 使用全局锁保护所有 DirectML 操作
-        if _FACE_DET_IS_DML:
-            with _GLOBAL_DML_LOCK:
-                bboxes, _kpss = _FACE_DETECTOR.detect(img_bgr, **kw)
-        else:
-            bboxes, _kpss = _FACE_DETECTOR.detect(img_bgr, **kw)
 
-        faces: list[dict] = []
-        if bboxes is not None:
-            for bb in bboxes:
-                x1, y1, x2, y2, score = bb.astype(np.float32).tolist()
-                if score < score_thresh:
-                    continue
-                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                faces.append({"bbox": [float(x1), float(y1), float(x2), float(y2)], "score": float(score), "cx": cx, "cy": cy})
-
-        # 按空间位置排序
-        if len(faces) >= 2:
-            pts = np.array([[f["cx"], f["cy"]] for f in faces])
-            mean = pts.mean(axis=0)
-            _, _, vh = np.linalg.svd(pts - mean, full_matrices=False)
-            direction = vh[0]
-            if direction[0] + direction[1] < 0:
-                direction = -direction
-            projs = [(pts[i] - mean) @ direction for i in range(len(faces))]
-            faces = [faces[i] for i in np.argsort(projs)]
+# ============================================================================
+# 后台预热：服务启动后提前加载模型并跑一次空输入推理
+# ============================================================================
+# 首次推理会触发 ORT 分配内存 arena、选择 kernel，耗时可达数秒；
+# 预热把这部分开销挪到服务空闲期，首个 detect_images 任务即可立刻上报进度。
+# 预热失败不影响懒加载路径：检测时仍会按原逻辑按需初始化。
 
-        for f in faces:
-            f.pop("cx", None)
-            f.pop("cy", None)
 
-        # 批量关键点检测 + EAR 计算 + 眼部区域提取
-        _run_blink_landmark(img_bgr, faces)
-        # 批量 OCEC 推理 + 融合概率得到最终 eye_open
-        _run_ocec_batch(img_bgr, faces)
+def _warmup_iqa() -> None:
+    _init_iqa_sessions_if_needed()
+    if isinstance(_IQA_SESSION, _DummyIqaSession):
+        return
+    # 1280x1280 全零图：authentic/synthetic 两个分支都走一遍真实形状
+    infer_iqa_from_bgr(np.zeros((_FACE_DET_SIZE[1], _FACE_DET_SIZE[0], 3), dtype=np.uint8))
 
-        return {"faces": faces}
 
-    except Exception as e:  # noqa: BLE001
-        print(f"[FACE] Face detection failed ({e}).")
-        import traceback
+def _warmup_face() -> None:
+    _init_face_detector_if_needed()
+    if _FACE_DETECTOR is None:
+        return
+    # 全零图不会检出人脸，因此只预热检测器本身，关键点/OCEC 由各自的预热步骤负责
+    detect_faces_from_bgr(np.zeros((_FACE_DET_SIZE[1], _FACE_DET_SIZE[0], 3), dtype=np.uint8))
 
-        traceback.print_exc()  # 🔧 打印完整堆栈
-        return {"faces": []}
+
+def _warmup_blink() -> None:
+    _init_blink_session_if_needed()
+    if _BLINK_SESSION is None:
+        return
+    # 走检测时同一个批推理入口：只在 DML 下取全局锁（CPU 预热不阻塞 IQA / 人脸），预热的也正是 IO binding 路径
+    _blink_infer_batch(np.zeros((1, 3, 192, 192), dtype=np.float32))
+
+
+def _warmup_ocec() -> None:
+    _init_ocec_session_if_needed()
+    if _OCEC_SESSION is None:
+        return
+    _ocec_infer_batch(np.zeros((1, 3, _OCEC_INPUT_H, _OCEC_INPUT_W), dtype=np.float32))
+
+
+def warmup_models() -> None:
+    """按全局开关预加载并预热模型，逐个更新 _MODEL_STATUS（设计为在后台线程中调用）。"""
+    eye_enabled = ENABLE_FACE_DETECTION and ENABLE_BLINK_DETECTION
+    steps = [
+        ("iqa", True, _warmup_iqa),
+        ("face", ENABLE_FACE_DETECTION, _warmup_face),
+        ("blink", eye_enabled, _warmup_blink),
+        ("ocec", eye_enabled, _warmup_ocec),
+    ]
+    for name, enabled, warm_fn in steps:
+        if not enabled:
+            _MODEL_STATUS[name] = "disabled"
+            continue
+        # 检测任务可能已抢先完成懒加载 + 推理，或模型确定不可用，均无需再预热
+        if _MODEL_STATUS[name] in ("ready", "unavailable"):
+            continue
+        _MODEL_STATUS[name] = "loading"
+        start = time.time()
+        try:
+            warm_fn()
+        except Exception as e:  # noqa: BLE001
+            print(f"[WARMUP] {name} warm-up failed ({e}), will fall back to lazy loading.")
+        # 预热函数未能推进状态（如异常中断）时退回 unloaded，交给懒加载路径重试
+        if _MODEL_STATUS[name] == "loading":
+            _MODEL_STATUS[name] = "unloaded"
+        print(f"[WARMUP] {name}: {_MODEL_STATUS[name]} ({time.time() - start:.2f}s)")
@@ -0,0 +1,132 @@
+"""
+照片库的文件头元数据：尺寸、方向、拍摄时间、相机 / 镜头与内嵌缩略图位置，只读文件头、不解码像素。
+
+尺寸、方向与相机 / 镜头原先要等 Electron 侧逐张读 EXIF，拍摄时间也只在分组前单独读一遍。
+这里把文件头一次读全：
+  - I/O 线程池并行读取每张照片开头的 HEADER_BYTES（utils/exif.read_header_metadata），
+    RAW 另读内嵌预览的帧头，尺寸以实际会被解码的预览为准；
+  - 整批结果在一个事务里 executemany 写回 present 表的结构化列；
+    显示用的 date / info 仍由前端生成（本地化时间、"1/快门 镜头"），这里不写，避免两种格式互相覆盖；
+  - 之后的阶段（解码内存估算、检测的任务分配）直接用库里的尺寸，不必再打开文件。
+"""
+
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .database import _connect, ensure_schema
+from .env import env_int
+from .exif import HEADER_BYTES, HeaderMetadata, parse_header_metadata, read_header_metadata
+from .raw import find_raw_preview, is_raw
+
+# 读文件头是纯 I/O（机械盘 / 网络盘上主要在等寻道），线程数可以远高于 CPU 核数
+METADATA_WORKERS: int = env_int("MEDIA_TOOLBOX_METADATA_WORKERS", min(32, (os.cpu_count() or 1) * 4), minimum=1)
+
+# 写入 present 表的列（顺序与 HeaderMetadata 字段一致）
+METADATA_COLUMNS: Tuple[str, ...] = (
+    "imageWidth",
+    "imageHeight",
+    "orientation",
+    "captureTime",
+    "cameraMake",
+    "cameraModel",
+    "lensModel",
+    "thumbOffset",
+    "thumbLength",
+)
+
+
+def _merge_raw_preview(f, file_path: str, meta: HeaderMetadata) -> HeaderMetadata:
+    """RAW：尺寸与缩略图位置换成最大的内嵌 JPEG 预览；RAF 等 EXIF 只在预览里的格式由预览补齐其余字段。"""
+    preview = find_raw_preview(file_path)
+    if preview is None:
+        return meta
+    f.seek(preview.offset)
+    inner = parse_header_metadata(f.read(min(preview.length, HEADER_BYTES)))
+    return HeaderMetadata(
+        inner.width,
+        inner.height,
+        # RawPreview.orientation 为 0 表示方向以预览自带的 EXIF 为准
+        preview.orientation or inner.orientation,
+        meta.capture_time if meta.capture_time is not None else inner.capture_time,
+        meta.make or inner.make,
+        meta.model or inner.model,
+        meta.lens or inner.lens,
+        preview.offset,
+        preview.length,
+    )
+
+
+def read_metadata(file_path: str) -> Optional[HeaderMetadata]:
+    """读取单个文件的文件头元数据；文件不可读时返回 None。"""
+    try:
+        with open(file_path, "rb") as f:
+            meta = read_header_metadata(f)
+            if is_raw(file_path):
+                meta = _merge_raw_preview(f, file_path, meta)
+    except (OSError, struct.error, ValueError) as e:
+        print(f"[META] failed to read {file_path}: {e}")
+        return None
+    return meta
+
+
+def read_metadata_batch(file_paths: Sequence[str]) -> Dict[str, HeaderMetadata]:
+    """在 I/O 线程池上并行读取文件头，返回 {路径: 元数据}（不可读的文件不出现）。"""
+    if not file_paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=METADATA_WORKERS) as executor:
+        results = executor.map(read_metadata, file_paths)
+        return {path: meta for path, meta in zip(file_paths, results) if meta is not None}
+
+
+def write_metadata(db_path: str, metadata: Dict[str, HeaderMetadata]) -> int:
+    """把 {filePath: 元数据} 在一个事务里批量写回 present 表，返回更新的行数。"""
+    if not metadata:
+        return 0
+    conn = _connect(db_path)
+    try:
+        ensure_schema(conn)
+        set_clause = ", ".join(f"{col} = ?" for col in METADATA_COLUMNS)
+        # filePath 没有索引，先一次性取出 id 映射，再按主键批量更新
+        id_map = dict(conn.execute("SELECT filePath, id FROM present").fetchall())
+        params = [(*meta, id_map[file_path]) for file_path, meta in metadata.items() if file_path in id_map]
+        conn.executemany(f"UPDATE present SET {set_clause} WHERE id = ?", params)
+        conn.commit()
+        return len(params)
+    finally:
+        conn.close()
+
+
+def extract_library_metadata(db_path: str, file_paths: Optional[Sequence[str]] = None) -> Dict[str, HeaderMetadata]:
+    """
+    为照片库中尚未提取元数据（imageWidth 为空）的照片读取文件头并批量写回，返回新读到的 {filePath: 元数据}。
+
+    file_paths 给出时只处理其中的照片。读不出尺寸的文件（损坏 / 无预览的 RAW）下次仍会重试，只多一次文件头读取。
+    """
+    conn = _connect(db_path)
+    try:
+        ensure_schema(conn)
+        missing: List[str] = [row[0] for row in conn.execute("SELECT filePath FROM present WHERE imageWidth IS NULL")]
+    finally:
+        conn.close()
+    if file_paths is not None:
+        wanted = set(file_paths)
+        missing = [path for path in missing if path in wanted]
+    metadata = read_metadata_batch(missing)
+    updated = write_metadata(db_path, metadata)
+    print(f"[META] {len(missing)} to read, {updated} rows updated")
+    return metadata
+
+
+def load_dimensions(db_path: str) -> Dict[str, Tuple[int, int]]:
+    """照片库中已提取的主图尺寸 {filePath: (宽, 高)}（编码方向；RAW 为内嵌预览的尺寸）。"""
+    conn = _connect(db_path)
+    try:
+        ensure_schema(conn)
+        rows = conn.execute(
+            "SELECT filePath, imageWidth, imageHeight FROM present WHERE imageWidth IS NOT NULL AND imageHeight IS NOT NULL"
+        ).fetchall()
+    finally:
+        conn.close()
+    return {file_path: (width, height) for file_path, width, height in rows}
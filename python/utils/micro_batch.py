@@ -0,0 +1,143 @@
+"""
+跨图片推理微批（micro-batching）。
+
+检测工作线程各自处理一张图，单张图里往往只有一两张人脸：关键点模型以 batch=1、
+OCEC 以 batch=2 运行，固定开销（kernel 调度、DML 提交、Python 调用）占比很高。
+MicroBatcher 把多个线程同时提交的样本拼成一个 batch，由单独的调度线程统一推理，
+再把结果按提交顺序切回给各个调用方；调用方接口保持同步阻塞。
+
+调度线程只在"还有其他线程可能马上提交"时短暂等待（linger），单线程运行时不会引入额外延迟。
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .tensor_arena import get_arena
+
+
+class ClientTracker:
+    """统计当前可能提交样本的线程数（with 块内视为活跃），调度线程据此决定是否继续等待。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def __enter__(self) -> "ClientTracker":
+        with self._lock:
+            self._count += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        with self._lock:
+            self._count -= 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+
+class _Request:
+    __slots__ = ("inputs", "future")
+
+    def __init__(self, inputs: np.ndarray):
+        self.inputs = inputs
+        self.future: Future = Future()
+
+
+class MicroBatcher:
+    """把多个线程提交的 (k, ...) 样本拼成最多 max_batch 行的 batch，交给 run_batch 推理。
+
+    run_batch(batch) 在调度线程中执行，必须返回首维与 batch 相同的数组；
+    调用方在 submit 返回前一直阻塞，因此可以直接传入自己 arena 中的缓冲区（调度线程会先拷贝）。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[np.ndarray], np.ndarray],
+        max_batch: int,
+        linger_ms: float,
+        clients: ClientTracker,
+    ):
+        self.name = name
+        self._run_batch = run_batch
+        self._max_batch = max_batch
+        self._linger = linger_ms / 1000.0
+        self._clients = clients
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, inputs: np.ndarray) -> np.ndarray:
+        """提交 k 行样本（k <= max_batch），返回对应的 k 行输出（调用方独占的拷贝）。"""
+        if inputs.shape[0] > self._max_batch:
+            raise ValueError(f"[{self.name}] submit of {inputs.shape[0]} rows exceeds max_batch={self._max_batch}")
+        self._ensure_thread()
+        request = _Request(inputs)
+        self._queue.put(request)
+        return request.future.result()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"{self.name}-batcher", daemon=True)
+                self._thread.start()
+
+    def _loop(self) -> None:
+        carry: Optional[_Request] = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            items: List[_Request] = [first]
+            rows = first.inputs.shape[0]
+            deadline = time.monotonic() + self._linger
+
+            while rows < self._max_batch:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    # 队列已空：只有当还有其他活跃线程没交样本时才值得等待
+                    timeout = deadline - time.monotonic()
+                    if len(items) >= self._clients.count or timeout <= 0:
+                        break
+                    try:
+                        nxt = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                # 放不下（或样本形状不同，如切换模型后）的请求留到下一个 batch
+                if rows + nxt.inputs.shape[0] > self._max_batch or nxt.inputs.shape[1:] != first.inputs.shape[1:]:
+                    carry = nxt
+                    break
+                items.append(nxt)
+                rows += nxt.inputs.shape[0]
+
+            self._run(items, rows)
+
+    def _run(self, items: List[_Request], rows: int) -> None:
+        try:
+            sample_shape = items[0].inputs.shape[1:]
+            batch = get_arena().get(f"{self.name}_batch", (self._max_batch, *sample_shape), items[0].inputs.dtype)
+            offset = 0
+            for item in items:
+                k = item.inputs.shape[0]
+                batch[offset : offset + k] = item.inputs
+                offset += k
+            out = self._run_batch(batch[:rows])
+        except Exception as e:  # noqa: BLE001
+            for item in items:
+                item.future.set_exception(e)
+            return
+
+        offset = 0
+        for item in items:
+            k = item.inputs.shape[0]
+            # 输出可能是 IO binding 的复用缓冲区，必须拷贝后再交给调用方
+            item.future.set_result(np.array(out[offset : offset + k]))
+            offset += k
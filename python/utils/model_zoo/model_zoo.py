@@ -23,9 +23,9 @@ class PickableInferenceSession(onnxruntime.InferenceSession):
         self.__init__(values["model_path"])
 
 
-def get_retinaface_model(model_file, providers=None, provider_options=None):
+def get_retinaface_model(model_file, providers=None, provider_options=None, sess_options=None):
     """Factory function to create RetinaFace model from ONNX file."""
     providers = providers or DEFAULT_PROVIDERS
-    session = PickableInferenceSession(model_file, providers=providers, provider_options=provider_options)
+    session = PickableInferenceSession(model_file, sess_options=sess_options, providers=providers, provider_options=provider_options)
     print(f"Applied providers: {session._providers}, with options: {session._provider_options}")
     return RetinaFace(model_file=model_file, session=session)
@@ -9,6 +9,12 @@ import onnxruntime
 import os.path as osp
 import cv2
 
+from ..tensor_arena import get_arena, run_with_binding
+
+# 锚点中心只取决于特征图尺寸、stride 与每点锚框数，与具体 Session 无关：
+# 模块级共享，重建检测器（切换精度 / provider）后无需重新生成
+_ANCHOR_CENTER_CACHE = {}
+
 
 def distance2bbox(points, distance, max_shape=None):
     """Decode distance prediction to bounding box.
@@ -26,12 +32,12 @@ def distance2bbox(points, distance, max_shape=None):
     y1 = points[:, 1] - distance[:, 1]
     x2 = points[:, 0] + distance[:, 2]
     y2 = points[:, 1] + distance[:, 3]
+    bboxes = np.stack([x1, y1, x2, y2], axis=-1)
     if max_shape is not None:
-        x1 = x1.clamp(min=0, max=max_shape[1])
-        y1 = y1.clamp(min=0, max=max_shape[0])
-        x2 = x2.clamp(min=0, max=max_shape[1])
-        y2 = y2.clamp(min=0, max=max_shape[0])
-    return np.stack([x1, y1, x2, y2], axis=-1)
+        # 原 torch 版 .clamp 在 ndarray 上不可用，改为 np.clip（x 按宽、y 按高裁剪）
+        np.clip(bboxes[:, 0::2], 0, max_shape[1], out=bboxes[:, 0::2])
+        np.clip(bboxes[:, 1::2], 0, max_shape[0], out=bboxes[:, 1::2])
+    return bboxes
 
 def distance2kps(points, distance, max_shape=None):
     """Decode distance prediction to bounding box.
@@ -45,16 +51,14 @@ def distance2kps(points, distance, max_shape=None):
     Returns:
         Tensor: Decoded bboxes.
     """
-    preds = []
-    for i in range(0, distance.shape[1], 2):
-        px = points[:, i%2] + distance[:, i]
-        py = points[:, i%2+1] + distance[:, i+1]
-        if max_shape is not None:
-            px = px.clamp(min=0, max=max_shape[1])
-            py = py.clamp(min=0, max=max_shape[0])
-        preds.append(px)
-        preds.append(py)
-    return np.stack(preds, axis=-1)
+    # (n, K*2) -> (n, K, 2) 后整体加上锚点中心，一次完成所有关键点解码（列顺序仍为 x0, y0, x1, y1, ...）
+    n = distance.shape[0]
+    preds = distance.reshape(n, distance.shape[1] // 2, 2) + points[:, None, :]
+    if max_shape is not None:
+        np.clip(preds[..., 0], 0, max_shape[1], out=preds[..., 0])
+        np.clip(preds[..., 1], 0, max_shape[0], out=preds[..., 1])
+    return preds.reshape(n, distance.shape[1])
+
 
 class RetinaFace:
     def __init__(self, model_file=None, session=None):
@@ -65,7 +69,7 @@ class RetinaFace:
             assert self.model_file is not None
             assert osp.exists(self.model_file)
             self.session = onnxruntime.InferenceSession(self.model_file, None)
-        self.center_cache = {}
+        self.center_cache = _ANCHOR_CENTER_CACHE
         self.nms_thresh = 0.4
         self.det_thresh = 0.5
         self._init_vars()
@@ -114,7 +118,8 @@ class RetinaFace:
             self.use_kps = True
 
     def prepare(self, ctx_id, **kwargs):
-        if ctx_id<0:
+        # set_providers 会重建整个 Session（重新跑图优化），已是纯 CPU 时跳过
+        if ctx_id<0 and self.session.get_providers() != ['CPUExecutionProvider']:
             self.session.set_providers(['CPUExecutionProvider'])
         nms_thresh = kwargs.get('nms_thresh', None)
         if nms_thresh is not None:
@@ -133,22 +138,23 @@ class RetinaFace:
         scores_list = []
         bboxes_list = []
         kpss_list = []
-        input_size = tuple(img.shape[0:2][::-1])
-        blob = cv2.dnn.blobFromImage(img, 1.0/self.input_std, input_size, (self.input_mean, self.input_mean, self.input_mean), swapRB=True)
-        net_outs = self.session.run(self.output_names, {self.input_name : blob})
+        # 等价于 cv2.dnn.blobFromImage(img, 1/std, size, mean, swapRB=True)，
+        # 但直接写入线程复用的 NCHW 缓冲区：(x - mean) * (1/std)，通道按 BGR->RGB 交换
+        blob = get_arena().get('retinaface_blob', (1, 3, img.shape[0], img.shape[1]))
+        for c in range(3):
+            np.subtract(img[:, :, 2 - c], np.float32(self.input_mean), out=blob[0, c])
+            blob[0, c] *= np.float32(1.0 / self.input_std)
+        # 输出顺序与 session.get_outputs() 一致，即 self.output_names 的顺序
+        net_outs = run_with_binding(self.session, {self.input_name : blob})
 
         input_height = blob.shape[2]
         input_width = blob.shape[3]
         fmc = self.fmc
         for idx, stride in enumerate(self._feat_stride_fpn):
             scores = net_outs[idx]
-            bbox_preds = net_outs[idx+fmc]
-            bbox_preds = bbox_preds * stride
-            if self.use_kps:
-                kps_preds = net_outs[idx+fmc*2] * stride
             height = input_height // stride
             width = input_width // stride
-            key = (height, width, stride)
+            key = (height, width, stride, self._num_anchors)
             if key in self.center_cache:
                 anchor_centers = self.center_cache[key]
             else:
@@ -173,19 +179,21 @@ class RetinaFace:
                 if self._num_anchors>1:
                     anchor_centers = np.stack([anchor_centers]*self._num_anchors, axis=1).reshape( (-1,2) )
                 if len(self.center_cache)<100:
+                    # 共享缓存，设为只读防止某个调用方意外原地修改
+                    anchor_centers.setflags(write=False)
                     self.center_cache[key] = anchor_centers
 
+            # 只解码过阈值的锚点：逐元素运算与先全量解码再筛选结果完全一致，
+            # 但拥挤/低分场景下省去绝大多数锚点的乘法与 stack
             pos_inds = np.where(scores>=threshold)[0]
-            bboxes = distance2bbox(anchor_centers, bbox_preds)
+            pos_centers = anchor_centers[pos_inds]
             pos_scores = scores[pos_inds]
-            pos_bboxes = bboxes[pos_inds]
+            pos_bboxes = distance2bbox(pos_centers, net_outs[idx+fmc][pos_inds] * stride)
             scores_list.append(pos_scores)
             bboxes_list.append(pos_bboxes)
             if self.use_kps:
-                kpss = distance2kps(anchor_centers, kps_preds)
-                #kpss = kps_preds
-                kpss = kpss.reshape( (kpss.shape[0], -1, 2) )
-                pos_kpss = kpss[pos_inds]
+                pos_kpss = distance2kps(pos_centers, net_outs[idx+fmc*2][pos_inds] * stride)
+                pos_kpss = pos_kpss.reshape( (pos_kpss.shape[0], pos_kpss.shape[1] // 2, 2) )
                 kpss_list.append(pos_kpss)
         return scores_list, bboxes_list, kpss_list
 
@@ -202,9 +210,14 @@ class RetinaFace:
             new_width = input_size[0]
             new_height = int(new_width * im_ratio)
         det_scale = float(new_height) / img.shape[0]
-        resized_img = cv2.resize(img, (new_width, new_height))
-        det_img = np.zeros( (input_size[1], input_size[0], 3), dtype=np.uint8 )
-        det_img[:new_height, :new_width, :] = resized_img
+        # 复用线程内的检测画布：直接 resize 到左上角区域，仅清零其余 padding，省去每张图的 np.zeros
+        det_img = get_arena().get('retinaface_canvas', (input_size[1], input_size[0], 3), np.uint8)
+        region = det_img[:new_height, :new_width, :]
+        resized_img = cv2.resize(img, (new_width, new_height), dst=region)
+        if resized_img is not region:
+            region[...] = resized_img
+        det_img[new_height:, :, :] = 0
+        det_img[:new_height, new_width:, :] = 0
 
         scores_list, bboxes_list, kpss_list = self.forward(det_img, self.det_thresh)
 
@@ -245,6 +258,29 @@ class RetinaFace:
         return det, kpss
 
     def nms(self, dets):
+        """贪心 NMS，交给 cv2.dnn.NMSBoxes（C++ 实现）完成，结果与原 Python 循环一致。
+
+        两处对齐保证逐框一致：
+        - 框以 (x1, y1, x2-x1+1, y2-y1+1) 传入，OpenCV 的矩形交并比即等价于 insightface 的 +1 像素约定；
+        - 分数换成原实现 argsort 的名次（唯一值），同分候选的处理顺序与 numpy 排序完全相同。
+        宽高非正或含 NaN 的退化框 OpenCV 与原实现语义不同，此时回退到原循环。
+        """
+        n = dets.shape[0]
+        if n == 0:
+            return []
+        widths = dets[:, 2] - dets[:, 0] + 1
+        heights = dets[:, 3] - dets[:, 1] + 1
+        if not (np.all(widths > 0) and np.all(heights > 0)):
+            return self._nms_greedy(dets)
+
+        order = dets[:, 4].argsort()[::-1]
+        ranks = np.empty(n, dtype=np.float32)
+        ranks[order] = np.arange(n, 0, -1, dtype=np.float32)
+        rects = np.stack([dets[:, 0], dets[:, 1], widths, heights], axis=1).astype(np.float64)
+        keep = cv2.dnn.NMSBoxes(rects, ranks, 0.0, self.nms_thresh)
+        return [int(i) for i in np.asarray(keep).reshape(-1)]
+
+    def _nms_greedy(self, dets):
         thresh = self.nms_thresh
         x1 = dets[:, 0]
         y1 = dets[:, 1]
@@ -273,5 +309,3 @@ class RetinaFace:
             order = order[inds + 1]
 
         return keep
-
-
@@ -0,0 +1,170 @@
+"""
+64 位感知哈希（dHash）+ 分段汉明 LSH 索引，用于整库近重复照片检测。
+
+相似度原本只在相邻启用照片之间计算，重复导入、修图导出、双机位等不相邻的重复永远找不到；
+整库两两比较直方图又是 O(N²)。dHash 与 HSV 直方图在同一次解码中计算（同一个隔点抽样视图），
+只占 8 字节。查询"汉明距离 <= d 的所有照片"用鸽巢原理：把 64 位切成 d+1 段，
+距离 <= d 的两个哈希至少有一段完全相同，于是只需在各段的桶里取候选，再精确校验距离。
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .database import _connect, dhash_from_db, ensure_schema
+from .union_find import UnionFind
+
+# 近重复的默认汉明距离上限（64 位中不同的位数）：<= 6 基本只剩同一画面的缩放 / 轻度调色 / 重新压缩
+DUPLICATE_MAX_DISTANCE: int = 6
+
+
+def compute_dhash(img_bgr: np.ndarray) -> int:
+    """差值哈希：灰度缩到 9x8，逐行比较相邻像素明暗，得到 64 位无符号整数。"""
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if img_bgr.ndim == 3 else img_bgr
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits.reshape(-1)).tobytes(), "big")
+
+
+def _band_layout(num_bands: int) -> List[Tuple[int, int]]:
+    """把 64 位尽量均匀地切成 num_bands 段，返回 [(偏移, 位宽), ...]。"""
+    base, extra = divmod(64, num_bands)
+    layout: List[Tuple[int, int]] = []
+    offset = 0
+    for i in range(num_bands):
+        width = base + (1 if i < extra else 0)
+        layout.append((offset, width))
+        offset += width
+    return layout
+
+
+class HammingIndex:
+    """
+    分段汉明 LSH（multi-index hashing）：支持增量添加与"距离 <= d"查询（d <= max_distance 时结果精确）。
+
+    每段一个 dict（段值 -> 下标列表）；查询取各段桶的并集作为候选，再用 popcount 向量化校验。
+    """
+
+    def __init__(self, max_distance: int = DUPLICATE_MAX_DISTANCE):
+        if not 0 <= max_distance < 64:
+            raise ValueError(f"max_distance must be in [0, 63], got {max_distance}")
+        self.max_distance = max_distance
+        self._layout = _band_layout(max_distance + 1)
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._layout]
+        self._hashes: List[int] = []
+        self._keys: List[str] = []
+        self._array: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, key: str, value: int) -> None:
+        idx = len(self._hashes)
+        self._hashes.append(value)
+        self._keys.append(key)
+        self._array = None
+        for table, (offset, width) in zip(self._tables, self._layout):
+            table.setdefault((value >> offset) & ((1 << width) - 1), []).append(idx)
+
+    def add_many(self, items: Iterable[Tuple[str, int]]) -> None:
+        for key, value in items:
+            self.add(key, value)
+
+    def query(self, value: int, max_distance: Optional[int] = None) -> List[Tuple[str, int]]:
+        """返回 [(key, 距离), ...]，按距离升序。"""
+        d = self.max_distance if max_distance is None else max_distance
+        if d > self.max_distance:
+            raise ValueError(f"index was built for max_distance={self.max_distance}, got {d}")
+
+        candidates = set()
+        for table, (offset, width) in zip(self._tables, self._layout):
+            candidates.update(table.get((value >> offset) & ((1 << width) - 1), ()))
+        if not candidates:
+            return []
+
+        if self._array is None:
+            self._array = np.array(self._hashes, dtype=np.uint64)
+        idx = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        dist = np.bitwise_count(self._array[idx] ^ np.uint64(value))
+        keep = dist <= d
+        hits = sorted(zip(dist[keep].tolist(), idx[keep].tolist()))
+        return [(self._keys[i], int(dist_i)) for dist_i, i in hits]
+
+
+def cluster_hashes(hashes: np.ndarray, max_distance: int = DUPLICATE_MAX_DISTANCE) -> List[List[int]]:
+    """
+    整库近重复聚类：返回成员数 >= 2 的簇（元素为 hashes 的下标，簇按首个成员排序）。
+
+    与 HammingIndex 相同的分段原理，但一次性批量完成：先把完全相同的哈希折叠成一个节点
+    （重复导入 / 纯色图会产生大量相同哈希，逐对合并会退化成平方级 Python 循环），
+    再对每段按段值排序切出同值桶，只在桶内做向量化 popcount 校验，
+    距离 <= max_distance 的对用并查集合并（传递闭包）。
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n = hashes.shape[0]
+    if n < 2:
+        return []
+
+    uniq, inverse = np.unique(hashes, return_inverse=True)
+    u = uniq.shape[0]
+    uf = UnionFind(u)
+
+    for offset, width in _band_layout(max_distance + 1):
+        keys = (uniq >> np.uint64(offset)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # 同值桶的边界
+        bounds = np.flatnonzero(np.diff(sorted_keys)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [u]))
+        multi = ends - starts > 1
+        for start, end in zip(starts[multi], ends[multi]):
+            members = order[start:end]
+            bucket = uniq[members]
+            m = len(members)
+            # 桶内两两距离按行分块广播计算，单块不超过约 100 万个元素
+            rows = max(1, (1 << 20) // m)
+            for r0 in range(0, m - 1, rows):
+                hit = np.bitwise_count(bucket[r0 : r0 + rows, None] ^ bucket[None, :]) <= max_distance
+                # 每行都会命中自身（对角线）；没有其他命中时跳过，绝大多数桶在这里就结束
+                if np.count_nonzero(hit) == hit.shape[0]:
+                    continue
+                ii, jj = np.nonzero(hit)
+                ii += r0
+                upper = jj > ii
+                for i, j in zip(members[ii[upper]], members[jj[upper]]):
+                    uf.union(int(i), int(j))
+
+    # 展开回原始下标：按根节点分组，保留成员数 >= 2 的簇
+    roots = np.fromiter((uf.find(k) for k in range(u)), dtype=np.int64, count=u)
+    labels = roots[inverse.reshape(-1)]
+    grouped = np.flatnonzero(np.bincount(labels, minlength=u)[labels] >= 2)
+    order = grouped[np.argsort(labels[grouped], kind="stable")]
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    clusters = [c.tolist() for c in np.split(order, bounds)] if order.size else []
+    clusters.sort(key=lambda c: c[0])
+    return clusters
+
+
+def find_duplicate_clusters(
+    db_path: str,
+    max_distance: int = DUPLICATE_MAX_DISTANCE,
+    include_disabled: bool = True,
+) -> List[List[str]]:
+    """读取 present 表中已计算的 dHash，返回整库近重复簇（每簇为 filePath 列表，按导入顺序）。"""
+    sql = "SELECT filePath, dHash FROM present WHERE dHash IS NOT NULL"
+    if not include_disabled:
+        sql += " AND isEnabled = 1"
+    conn = _connect(db_path)
+    try:
+        ensure_schema(conn)
+        rows: List[Tuple[str, int]] = conn.execute(sql + " ORDER BY id ASC").fetchall()
+    finally:
+        conn.close()
+
+    if not rows:
+        return []
+    paths = [r[0] for r in rows]
+    hashes = np.array([dhash_from_db(r[1]) for r in rows], dtype=np.uint64)
+    return [[paths[i] for i in cluster] for cluster in cluster_hashes(hashes, max_distance)]
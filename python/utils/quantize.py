@@ -0,0 +1,406 @@
+"""
+INT8 量化模型构建 + 精度 / 速度对比报告（离线工具，不随后端打包）。
+
+用法（在 python 目录下执行）：
+    python -m utils.quantize build  --images D:/calib [--mode static|dynamic] [--models iqa,face,blink,ocec] [--limit 64] [--report]
+    python -m utils.quantize report --images D:/eval  [--limit 200] [--out checkpoint/int8/quantization_report.md]
+
+build 的产物写入 checkpoint/int8/<name>.int8.onnx，后端以 MEDIA_TOOLBOX_MODEL_PRECISION=int8 启动
+（或调用 inference_onnx.set_model_precision("int8")）后优先加载，缺失的模型自动回退 fp32。
+
+静态量化的校准输入不单独实现预处理，而是通过 tensor_arena 的采集钩子从真实 fp32 推理流程中截取：
+与线上预处理逐位一致，关键点 / OCEC 的输入也来自真实检测到的人脸。
+onnxruntime.quantization 依赖 onnx 包，仅构建机需要安装（pip install onnx）。
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import inference_onnx as ionnx
+from .image_compute import cv_imread
+from .tensor_arena import set_feed_recorder
+
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+_MODEL_NAMES = ("iqa", "face", "blink", "ocec")
+_MODEL_PATHS: Dict[str, Path] = {
+    "iqa": ionnx._IQA_CHECKPOINT_ONNX,
+    "face": ionnx._FACE_DET_MODEL_PATH,
+    "blink": ionnx._BLINK_MODEL_PATH,
+    "ocec": ionnx._OCEC_MODEL_PATH,
+}
+
+# 与前端 usePhotoFilterStore.ts 的 EYE_THRESHOLD_CLOSED / EYE_THRESHOLD_SUSPICIOUS 保持一致
+_EYE_THRESHOLD_CLOSED = 0.35
+_EYE_THRESHOLD_SUSPICIOUS = 0.6
+_FACE_MATCH_IOU = 0.5
+
+
+def _list_images(folder: str, limit: int = 0) -> List[Path]:
+    files = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in _IMAGE_EXTS)
+    return files[:limit] if limit > 0 else files
+
+
+def _read_image(path: Path) -> Optional[np.ndarray]:
+    try:
+        return cv_imread(str(path))
+    except Exception as e:  # noqa: BLE001
+        print(f"[QUANT] Skip unreadable image {path} ({e})")
+        return None
+
+
+# ============================================================================
+# 校准数据采集
+# ============================================================================
+
+
+def _model_of_session(session) -> Optional[str]:
+    """把推理钩子收到的 Session 对应回模型名（按当前已加载的全局 Session 比对）。"""
+    if session is ionnx._IQA_SESSION:
+        return "iqa"
+    if ionnx._FACE_DETECTOR is not None and session is ionnx._FACE_DETECTOR.session:
+        return "face"
+    if session is ionnx._BLINK_SESSION:
+        return "blink"
+    if session is ionnx._OCEC_SESSION:
+        return "ocec"
+    return None
+
+
+class _FeedRecorder:
+    """把每次推理的输入按模型落盘为 npz：人脸 / IQA 输入单个就有约 20MB，不能堆在内存里。"""
+
+    def __init__(self, out_dir: Path, models: List[str], limit: int):
+        self.out_dir = out_dir
+        self.limit = limit
+        self.counts: Dict[str, int] = {name: 0 for name in models}
+        for name in models:
+            (out_dir / name).mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, session, feeds: Dict[str, np.ndarray]) -> None:
+        name = _model_of_session(session)
+        if name not in self.counts or self.counts[name] >= self.limit:
+            return
+        # feeds 可能是 arena 缓冲区，savez 会立即把数据写盘，之后被覆盖也不影响
+        np.savez(self.out_dir / name / f"{self.counts[name]:05d}.npz", **feeds)
+        self.counts[name] += 1
+
+    def full(self) -> bool:
+        return all(c >= self.limit for c in self.counts.values())
+
+    def files(self, name: str) -> List[Path]:
+        return sorted((self.out_dir / name).glob("*.npz"))
+
+
+def _collect_calibration(image_paths: List[Path], recorder: _FeedRecorder) -> None:
+    """以 fp32 模型跑一遍完整检测流程，由钩子截取各模型的真实输入。"""
+    ionnx.set_model_precision("fp32")
+    set_feed_recorder(recorder)
+    try:
+        for path in image_paths:
+            if recorder.full():
+                break
+            img = _read_image(path)
+            if img is None:
+                continue
+            if "iqa" in recorder.counts:
+                ionnx.infer_iqa_from_bgr(img)
+            if recorder.counts.keys() & {"face", "blink", "ocec"}:
+                ionnx.detect_faces_from_bgr(img)
+    finally:
+        set_feed_recorder(None)
+    print(f"[QUANT] Calibration samples: {recorder.counts}")
+
+
+# ============================================================================
+# 量化
+# ============================================================================
+
+
+def _quantize_model(name: str, mode: str, calib_files: List[Path], work_dir: Path) -> Path:
+    """量化单个模型，写入 checkpoint/int8/<name>.int8.onnx（先写临时文件再替换，避免半成品被后端加载）。"""
+    try:
+        from onnxruntime.quantization import (
+            CalibrationDataReader,
+            CalibrationMethod,
+            QuantFormat,
+            QuantType,
+            quantize_dynamic,
+            quantize_static,
+        )
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError as e:
+        raise SystemExit(f"[QUANT] onnxruntime.quantization unavailable ({e}). Install it with: pip install onnx") from e
+
+    src = _MODEL_PATHS[name]
+    dst = ionnx.quantized_model_path(src)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+
+    # 量化前先做 shape 推断 + 图优化（官方推荐流程）；部分模型符号推断失败时直接用原模型
+    source = work_dir / f"{name}.pre.onnx"
+    try:
+        quant_pre_process(str(src), str(source))
+    except Exception as e:  # noqa: BLE001
+        print(f"[QUANT] {name}: pre-processing failed ({e}), quantizing the original graph.")
+        source = src
+
+    if mode == "static" and not calib_files:
+        # 例如校准集中没有检出人脸，关键点 / OCEC 拿不到样本
+        print(f"[QUANT] {name}: no calibration samples collected, falling back to dynamic quantization.")
+        mode = "dynamic"
+
+    tmp_dst = work_dir / f"{name}.int8.onnx"
+    if mode == "static":
+
+        class _NpzReader(CalibrationDataReader):
+            def __init__(self, files: List[Path]):
+                self._files = iter(files)
+
+            def get_next(self):
+                path = next(self._files, None)
+                if path is None:
+                    return None
+                with np.load(path) as data:
+                    return {k: data[k] for k in data.files}
+
+        # QDQ 格式：CPU / DirectML 都能直接执行；权重按通道对称量化，激活 uint8 非对称
+        quantize_static(
+            str(source),
+            str(tmp_dst),
+            _NpzReader(calib_files),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    else:
+        # 动态量化下卷积走 ConvInteger，CPU kernel 只支持 uint8 权重
+        quantize_dynamic(str(source), str(tmp_dst), weight_type=QuantType.QUInt8)
+
+    os.replace(tmp_dst, dst)
+    print(f"[QUANT] {name}: {mode} INT8 model written to {dst} ({src.stat().st_size / 1e6:.1f}MB -> {dst.stat().st_size / 1e6:.1f}MB)")
+    return dst
+
+
+def build_quantized_models(image_dir: str, mode: str = "static", models: Optional[List[str]] = None, limit: int = 64) -> Dict[str, Path]:
+    """生成 INT8 模型；static 模式以 image_dir 中的图片做校准（每个模型最多 limit 个样本）。"""
+    models = [m for m in (models or _MODEL_NAMES) if _MODEL_PATHS[m].exists()]
+    outputs: Dict[str, Path] = {}
+    with tempfile.TemporaryDirectory(prefix="media-toolbox-quant-") as tmp:
+        work_dir = Path(tmp)
+        recorder = _FeedRecorder(work_dir / "calib", models, limit)
+        if mode == "static":
+            _collect_calibration(_list_images(image_dir), recorder)
+        for name in models:
+            outputs[name] = _quantize_model(name, mode, recorder.files(name) if mode == "static" else [], work_dir)
+    return outputs
+
+
+# ============================================================================
+# 评估报告
+# ============================================================================
+
+
+def _run_pipeline(image_paths: List[Path]) -> Tuple[List[Optional[float]], List[Optional[List[dict]]], Dict[str, float]]:
+    """按当前精度跑 IQA + 人脸 / 睁眼全流程，返回逐图结果与各阶段累计耗时（不含模型加载）。"""
+    ionnx.warmup_models()
+    scores: List[Optional[float]] = []
+    faces: List[Optional[List[dict]]] = []
+    timings = {"iqa": 0.0, "face": 0.0, "images": 0}
+    for path in image_paths:
+        img = _read_image(path)
+        if img is None:
+            scores.append(None)
+            faces.append(None)
+            continue
+        t0 = time.perf_counter()
+        scores.append(ionnx.infer_iqa_from_bgr(img))
+        t1 = time.perf_counter()
+        faces.append(ionnx.detect_faces_from_bgr(img)["faces"])
+        t2 = time.perf_counter()
+        timings["iqa"] += t1 - t0
+        timings["face"] += t2 - t1
+        timings["images"] += 1
+    return scores, faces, timings
+
+
+def _rankdata(x: np.ndarray) -> np.ndarray:
+    """平均秩（同分取平均名次），等价于 scipy.stats.rankdata 的默认行为。"""
+    order = np.argsort(x, kind="mergesort")
+    ranks = np.empty(len(x), dtype=np.float64)
+    ranks[order] = np.arange(1, len(x) + 1)
+    _, inverse, counts = np.unique(x, return_inverse=True, return_counts=True)
+    return (np.bincount(inverse, weights=ranks) / counts)[inverse]
+
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    if len(a) < 2:
+        return float("nan")
+    ra, rb = _rankdata(a), _rankdata(b)
+    if ra.std() == 0 or rb.std() == 0:
+        return float("nan")
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def _iou(a: List[float], b: List[float]) -> float:
+    iw = min(a[2], b[2]) - max(a[0], b[0])
+    ih = min(a[3], b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _match_faces(ref: List[dict], test: List[dict]) -> List[Tuple[int, int]]:
+    """按 IoU 从高到低贪心一对一匹配，IoU < 0.5 视为未召回。"""
+    pairs = [(_iou(r["bbox"], t["bbox"]), i, j) for i, r in enumerate(ref) for j, t in enumerate(test)]
+    used_ref, used_test, matches = set(), set(), []
+    for iou, i, j in sorted(pairs, reverse=True):
+        if iou < _FACE_MATCH_IOU:
+            break
+        if i in used_ref or j in used_test:
+            continue
+        used_ref.add(i)
+        used_test.add(j)
+        matches.append((i, j))
+    return matches
+
+
+def _eye_state(eye_open: Optional[float]) -> str:
+    # 与前端 getEyeState 一致：缺失 eye_open 视为睁眼
+    v = 1.0 if eye_open is None else eye_open
+    if v < _EYE_THRESHOLD_CLOSED:
+        return "closed"
+    if v <= _EYE_THRESHOLD_SUSPICIOUS:
+        return "suspicious"
+    return "open"
+
+
+def _fmt(value: float, spec: str) -> str:
+    # 没有样本的指标（如评估集中没有人脸）显示为 "-"，而不是 nan
+    return "-" if np.isnan(value) else format(value, spec)
+
+
+def _throughput(timings: Dict[str, float], stage: str) -> float:
+    return timings["images"] / timings[stage] if timings[stage] > 0 else float("nan")
+
+
+def build_report(image_dir: str, limit: int = 0, out_path: Optional[str] = None) -> Dict[str, float]:
+    """分别以 fp32 / int8 跑同一批图片，对比 IQA 排序、人脸召回、睁眼判定与吞吐，输出 Markdown 报告。"""
+    image_paths = _list_images(image_dir, limit)
+    if not image_paths:
+        raise SystemExit(f"[QUANT] No images found under {image_dir}")
+
+    ionnx.set_model_precision("fp32")
+    fp_scores, fp_faces, fp_time = _run_pipeline(image_paths)
+    ionnx.set_model_precision("int8")
+    q_scores, q_faces, q_time = _run_pipeline(image_paths)
+    ionnx.set_model_precision("fp32")
+
+    pairs = [(a, b) for a, b in zip(fp_scores, q_scores) if a is not None and b is not None]
+    a = np.array([p[0] for p in pairs], dtype=np.float64)
+    b = np.array([p[1] for p in pairs], dtype=np.float64)
+
+    ref_total = recalled = extra = eye_total = eye_agree = 0
+    eye_diffs: List[float] = []
+    for ref, test in zip(fp_faces, q_faces):
+        if ref is None or test is None:
+            continue
+        matches = _match_faces(ref, test)
+        ref_total += len(ref)
+        recalled += len(matches)
+        extra += len(test) - len(matches)
+        for i, j in matches:
+            eye_total += 1
+            eye_agree += _eye_state(ref[i].get("eye_open")) == _eye_state(test[j].get("eye_open"))
+            if ref[i].get("eye_open") is not None and test[j].get("eye_open") is not None:
+                eye_diffs.append(abs(ref[i]["eye_open"] - test[j]["eye_open"]))
+
+    metrics = {
+        "images": float(len(pairs)),
+        "iqa_spearman": _spearman(a, b),
+        "iqa_mae": float(np.abs(a - b).mean()) if len(pairs) else float("nan"),
+        "face_recall": recalled / ref_total if ref_total else float("nan"),
+        "face_extra": float(extra),
+        "eye_state_agreement": eye_agree / eye_total if eye_total else float("nan"),
+        "eye_open_mae": float(np.mean(eye_diffs)) if eye_diffs else float("nan"),
+    }
+    for stage in ("iqa", "face"):
+        metrics[f"{stage}_fp32_ips"] = _throughput(fp_time, stage)
+        metrics[f"{stage}_int8_ips"] = _throughput(q_time, stage)
+        metrics[f"{stage}_speedup"] = metrics[f"{stage}_int8_ips"] / metrics[f"{stage}_fp32_ips"]
+
+    variants = {name: ionnx.quantized_model_path(path).exists() for name, path in _MODEL_PATHS.items()}
+    lines = [
+        "# INT8 量化评估报告",
+        "",
+        f"- 评估图片：{len(pairs)} 张（{image_dir}）",
+        f"- ONNX Runtime providers：{', '.join(ionnx._select_ort_providers())}",
+        "- INT8 模型：" + "，".join(f"{name} {'INT8' if ok else '缺失（回退 fp32）'}" for name, ok in variants.items()),
+        "",
+        "## 精度（以 fp32 结果为基准）",
+        "",
+        "| 指标 | 数值 |",
+        "| --- | --- |",
+        f"| IQA Spearman 秩相关 | {_fmt(metrics['iqa_spearman'], '.4f')} |",
+        f"| IQA 分数平均绝对差 | {_fmt(metrics['iqa_mae'], '.4f')} |",
+        f"| 人脸召回率（IoU ≥ {_FACE_MATCH_IOU}） | {_fmt(metrics['face_recall'], '.2%')}（{recalled}/{ref_total}） |",
+        f"| INT8 多检人脸 | {extra} |",
+        f"| eye_open 三档判定一致率 | {_fmt(metrics['eye_state_agreement'], '.2%')}（{eye_agree}/{eye_total}） |",
+        f"| eye_open 平均绝对差 | {_fmt(metrics['eye_open_mae'], '.4f')} |",
+        "",
+        "## 吞吐（张/秒，不含模型加载）",
+        "",
+        "| 阶段 | fp32 | int8 | 加速比 |",
+        "| --- | --- | --- | --- |",
+        f"| IQA | {_fmt(metrics['iqa_fp32_ips'], '.2f')} | {_fmt(metrics['iqa_int8_ips'], '.2f')} | {_fmt(metrics['iqa_speedup'], '.2f')}x |",
+        f"| 人脸检测 + 睁眼 | {_fmt(metrics['face_fp32_ips'], '.2f')} | {_fmt(metrics['face_int8_ips'], '.2f')} | {_fmt(metrics['face_speedup'], '.2f')}x |",
+        "",
+    ]
+    report = "\n".join(lines)
+    out = Path(out_path) if out_path else ionnx.quantized_model_path(_MODEL_PATHS["iqa"]).parent / "quantization_report.md"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(report, encoding="utf-8")
+    print(report)
+    print(f"[QUANT] Report written to {out}")
+    return metrics
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m utils.quantize", description="生成 INT8 量化模型并对比 fp32 的精度与速度")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="量化 checkpoint 下的模型到 checkpoint/int8/")
+    build.add_argument("--images", required=True, help="校准图片目录（递归查找 jpg/png/webp）")
+    build.add_argument("--mode", choices=("static", "dynamic"), default="static", help="static 需要校准图片；dynamic 只量化权重")
+    build.add_argument("--models", default=",".join(_MODEL_NAMES), help="逗号分隔的模型名：iqa,face,blink,ocec")
+    build.add_argument("--limit", type=int, default=64, help="每个模型最多使用的校准样本数")
+    build.add_argument("--report", action="store_true", help="构建完成后用同一目录生成评估报告")
+
+    report = sub.add_parser("report", help="对比 fp32 与 int8 模型的精度和吞吐")
+    report.add_argument("--images", required=True, help="评估图片目录（递归查找 jpg/png/webp）")
+    report.add_argument("--limit", type=int, default=0, help="最多评估的图片数，0 表示全部")
+    report.add_argument("--out", default=None, help="报告路径，默认 checkpoint/int8/quantization_report.md")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        models = [m.strip() for m in args.models.split(",") if m.strip()]
+        unknown = set(models) - set(_MODEL_NAMES)
+        if unknown:
+            parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+        build_quantized_models(args.images, mode=args.mode, models=models, limit=args.limit)
+        if args.report:
+            build_report(args.images)
+    else:
+        build_report(args.images, limit=args.limit, out_path=args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+组内最佳照片排序：把 IQA、人脸、清晰度、曝光等 per-image 列加权合成一个分数，整库一次 NumPy 计算。
+
+检测流程只负责把各项指标写进 present 表；排序完全基于这些列，调整权重后重新排序不需要
+任何推理或读图。人脸相关的 JSON（faceData）在检测结束时汇总成 faceCount / eyeOpenMin /
+eyeOpenMean / faceScore 数值列，排序时只读数值列，不再逐行解析 JSON。
+组内名次用 (groupId, -score) 的 lexsort 一次求出，写回 rankScore / groupRank。
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .database import _connect, ensure_schema
+
+# 人脸汇总列（顺序与 face_summary 的返回值一致）
+FACE_COLUMNS: Tuple[str, ...] = ("faceCount", "eyeOpenMin", "eyeOpenMean", "faceScore")
+
+# 默认权重：各项先归一化到 [0, 1] 再加权求和；权重为 0 的项不参与
+DEFAULT_RANK_WEIGHTS: Dict[str, float] = {
+    "iqa": 1.0,
+    "eyes": 0.6,
+    "face_score": 0.2,
+    "face_count": 0.0,
+    "sharpness": 0.3,
+    "exposure": 0.3,
+}
+
+# 睁眼程度按人脸聚合的方式："min" = 任何一人闭眼都算废片（合影），"mean" = 取平均
+EYE_MODES: Tuple[str, ...] = ("min", "mean")
+
+# 每组默认返回的前 K 名
+DEFAULT_TOP_K: int = 3
+
+_FEATURE_SQL = """
+    SELECT id, filePath, groupId, IQA, sharpness, clipHighlights, clipShadows, meanBrightness,
+           faceCount, eyeOpenMin, eyeOpenMean, faceScore
+    FROM present
+    WHERE groupId IS NOT NULL AND isEnabled = 1
+"""
+
+
+def face_summary(face_info: Optional[dict]) -> Tuple[int, Optional[float], Optional[float], Optional[float]]:
+    """
+    faceData -> (人脸数, 最小睁眼程度, 平均睁眼程度, 平均人脸置信度)。
+
+    过小未做睁眼判定的人脸（eye_unscored）与前端一致按睁眼处理；没有人脸时后三项为 None。
+    """
+    faces = (face_info or {}).get("faces") or []
+    if not faces:
+        return 0, None, None, None
+    eyes = [1.0 if f.get("eye_unscored") else float(f.get("eye_open", 1.0)) for f in faces]
+    scores = [float(f.get("score", 0.0)) for f in faces]
+    return len(faces), min(eyes), sum(eyes) / len(eyes), sum(scores) / len(scores)
+
+
+def refresh_face_summary(db_path: str, face_cache: Optional[Dict[str, dict]] = None) -> int:
+    """
+    写回人脸汇总列，返回更新的行数。
+
+    face_cache 为 None 时只补齐 faceData 已有而汇总列为空的行（旧库 / 外部写入），
+    检测流程结束时直接传入内存中的 face_cache，省去一次读库与 JSON 解析。
+    """
+    conn = _connect(db_path)
+    try:
+        ensure_schema(conn)
+        set_clause = ", ".join(f"{col} = ?" for col in FACE_COLUMNS)
+
+        if face_cache is None:
+            params = []
+            for row_id, face_json in conn.execute(
+                "SELECT id, faceData FROM present WHERE faceData IS NOT NULL AND faceCount IS NULL"
+            ):
+                try:
+                    face_info = json.loads(face_json)
+                except (TypeError, ValueError):
+                    continue
+                params.append((*face_summary(face_info), row_id))
+        else:
+            # filePath 没有索引，先一次性取出 id 映射，再按主键批量更新
+            id_map = dict(conn.execute("SELECT filePath, id FROM present").fetchall())
+            params = [
+                (*face_summary(face_info), id_map[file_path])
+                for file_path, face_info in face_cache.items()
+                if file_path in id_map
+            ]
+
+        conn.executemany(f"UPDATE present SET {set_clause} WHERE id = ?", params)
+        conn.commit()
+        return len(params)
+    finally:
+        conn.close()
+
+
+def resolve_weights(weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """在默认权重上覆盖调用方给出的项；未知键与无法转换为数字的值忽略，负权重按 0 处理。"""
+    resolved = dict(DEFAULT_RANK_WEIGHTS)
+    for key, value in (weights or {}).items():
+        if key not in resolved:
+            continue
+        try:
+            resolved[key] = max(0.0, float(value))
+        except (TypeError, ValueError):
+            continue
+    return resolved
+
+
+def _minmax(values: np.ndarray, fill: float = 0.0) -> np.ndarray:
+    """按整库最小 / 最大值归一化到 [0, 1]；缺失值（NaN）填 fill，全库取值相同时整列为 fill。"""
+    out = np.full(values.shape, fill, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return out
+    lo, hi = values[valid].min(), values[valid].max()
+    if hi > lo:
+        out[valid] = (values[valid] - lo) / (hi - lo)
+    return out
+
+
+def score_features(
+    features: np.ndarray,
+    weights: Dict[str, float],
+    eye_mode: str = "min",
+) -> np.ndarray:
+    """
+    features: (N, 9) float64，列依次为 IQA、清晰度、高光溢出、暗部溢出、平均亮度、
+    人脸数、最小睁眼、平均睁眼、人脸置信度（缺失为 NaN）。返回 (N,) 加权分数。
+
+    - iqa / sharpness：整库 min-max 归一化（清晰度先取 log1p，拉普拉斯方差跨度过大）；缺失记 0。
+    - eyes：睁眼程度本身在 [0, 1]；没有人脸的照片记 1，不因"没拍到人"被扣分。
+    - face_score：平均人脸置信度，没有人脸记 0。
+    - face_count：按整库最大人脸数归一化。
+    - exposure：1 - 溢出比例，再乘以平均亮度偏离 0.5 的惩罚；缺失记 0.5。
+    """
+    iqa, sharpness, clip_hi, clip_lo, brightness, face_count, eye_min, eye_mean, face_score = features.T
+
+    components = {
+        "iqa": _minmax(iqa),
+        "sharpness": _minmax(np.log1p(np.clip(sharpness, 0.0, None))),
+        "eyes": np.nan_to_num(eye_min if eye_mode == "min" else eye_mean, nan=1.0),
+        "face_score": np.nan_to_num(face_score, nan=0.0),
+        "face_count": _minmax(np.nan_to_num(face_count, nan=0.0)),
+        "exposure": np.nan_to_num(
+            (1.0 - np.clip(clip_hi + clip_lo, 0.0, 1.0)) * (1.0 - np.abs(brightness - 0.5)),
+            nan=0.5,
+        ),
+    }
+
+    score = np.zeros(features.shape[0], dtype=np.float64)
+    for key, weight in weights.items():
+        if weight > 0:
+            score += weight * components[key]
+    return score
+
+
+def group_ranks(group_ids: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """组内名次（0 = 最佳）：按 (groupId 升序, 分数降序) 一次 lexsort，名次 = 位置 - 所在组起点。"""
+    n = group_ids.shape[0]
+    ranks = np.empty(n, dtype=np.int64)
+    if n == 0:
+        return ranks
+    order = np.lexsort((-scores, group_ids))
+    sorted_groups = group_ids[order]
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    starts = np.maximum.accumulate(np.where(is_start, np.arange(n), 0))
+    ranks[order] = np.arange(n) - starts
+    return ranks
+
+
+def rank_library(
+    db_path: str,
+    weights: Optional[Dict[str, float]] = None,
+    eye_mode: str = "min",
+    top_k: int = DEFAULT_TOP_K,
+    persist: bool = True,
+) -> Dict[int, List[Tuple[str, float]]]:
+    """
+    对整库已分组的启用照片打分排序，返回 {groupId: [(filePath, 分数), ...]}（每组前 top_k 名，top_k <= 0 为全部）。
+
+    persist=True 时写回 rankScore / groupRank（未分组或未启用的照片清空为 NULL，不再保留旧名次）。
+    """
+    eye_mode = eye_mode if eye_mode in EYE_MODES else "min"
+    resolved = resolve_weights(weights)
+
+    conn = _connect(db_path)
+    try:
+        ensure_schema(conn)
+        rows = conn.execute(_FEATURE_SQL).fetchall()
+        if not rows:
+            if persist:
+                conn.execute("UPDATE present SET rankScore = NULL, groupRank = NULL")
+                conn.commit()
+            return {}
+
+        row_ids = [r[0] for r in rows]
+        paths = [r[1] for r in rows]
+        group_ids = np.array([r[2] for r in rows], dtype=np.int64)
+        # None -> NaN
+        features = np.array([r[3:] for r in rows], dtype=np.float64)
+
+        scores = score_features(features, resolved, eye_mode)
+        ranks = group_ranks(group_ids, scores)
+
+        if persist:
+            conn.execute(
+                "UPDATE present SET rankScore = NULL, groupRank = NULL "
+                "WHERE groupId IS NULL OR isEnabled IS NOT 1"
+            )
+            conn.executemany(
+                "UPDATE present SET rankScore = ?, groupRank = ? WHERE id = ?",
+                zip(scores.tolist(), ranks.tolist(), row_ids),
+            )
+            conn.commit()
+    finally:
+        conn.close()
+
+    keep = np.flatnonzero(ranks < top_k) if top_k > 0 else np.arange(len(paths))
+    keep = keep[np.lexsort((ranks[keep], group_ids[keep]))]
+    top: Dict[int, List[Tuple[str, float]]] = {}
+    for i in keep.tolist():
+        top.setdefault(int(group_ids[i]), []).append((paths[i], float(scores[i])))
+    return top
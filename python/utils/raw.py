@@ -0,0 +1,186 @@
+"""
+RAW 文件支持：只取相机内嵌的 JPEG 预览，从不做去马赛克。
+
+NEF / CR2 / ARW / DNG / ORF / RW2 / PEF 等都是 TIFF 结构：IFD0、IFD 链与 SubIFDs 中登记了若干张图，
+其中至少一张是相机生成的 JPEG 预览（NEF 的 JpgFromRaw、CR2 IFD0 的整幅预览、DNG 的预览 IFD ...），
+通常就是全尺寸或 1/2 尺寸。这里用纯 Python 走一遍 IFD（每个 IFD 只读几百字节），找出字节数最大的
+JPEG 预览，再一次读出这段字节交给现有的 JPEG 解码、缩略图与分析路径。RAF 的文件头直接给出预览的偏移。
+单个文件的开销是几次小读取加一次顺序读，毫秒级；预览不带方向信息时按 IFD0 的 Orientation 由调用方转正。
+"""
+
+import os
+import re
+import struct
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# 前端的同一份列表在 src/lib/image-extensions.ts，增删格式时两处一起改
+RAW_EXTENSIONS: Tuple[str, ...] = (
+    ".nef", ".nrw", ".cr2", ".arw", ".sr2", ".srf", ".dng", ".orf",
+    ".rw2", ".pef", ".srw", ".raf", ".rwl", ".3fr", ".erf", ".kdc",
+)
+# 可以导入的全部扩展名（普通图片 + RAW）
+IMAGE_EXTENSIONS: Tuple[str, ...] = (".jpg", ".jpeg", ".png", ".webp") + RAW_EXTENSIONS
+# RAW+JPEG 配对时视为"同一张照片"的 JPEG 扩展名
+_JPEG_EXTENSIONS: Tuple[str, ...] = (".jpg", ".jpeg")
+
+# TIFF 头的魔数：42 为标准 TIFF，0x4F52 / 0x5352 为奥林巴斯 ORF，0x55 为松下 RW2
+_TIFF_MAGICS = frozenset((42, 0x4F52, 0x5352, 0x55))
+_RAF_MAGIC = b"FUJIFILMCCD-RAW "
+
+_TAG_NEW_SUBFILE_TYPE = 0x00FE
+_TAG_COMPRESSION = 0x0103
+_TAG_PHOTOMETRIC = 0x0106
+_TAG_STRIP_OFFSETS = 0x0111
+_TAG_ORIENTATION = 0x0112
+_TAG_STRIP_BYTE_COUNTS = 0x0117
+_TAG_SUB_IFDS = 0x014A
+_TAG_JPEG_OFFSET = 0x0201
+_TAG_JPEG_LENGTH = 0x0202
+
+# 传感器数据的 PhotometricInterpretation（CFA / LinearRaw）：DNG 主图的无损 JPEG 不是可显示的预览
+_RAW_PHOTOMETRICS = frozenset((32803, 34892))
+# JPEG / 旧式 JPEG 压缩
+_JPEG_COMPRESSIONS = frozenset((6, 7))
+
+# 防御损坏文件：最多遍历的 IFD 数与单个 IFD 的条目数
+_MAX_IFDS = 32
+_MAX_ENTRIES = 512
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 7: 1, 9: 4, 13: 4, 16: 8, 18: 8}
+
+
+class RawPreview(NamedTuple):
+    offset: int
+    length: int
+    # IFD0 的 Orientation（1-8）；0 表示预览自带 EXIF（RAF），解码时让 imdecode 自行处理
+    orientation: int
+
+
+def is_raw(file_path: str) -> bool:
+    return file_path.lower().endswith(RAW_EXTENSIONS)
+
+
+def _read_at(f, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    return f.read(size)
+
+
+def _ifd_values(f, endian: str, entry: bytes) -> List[int]:
+    """IFD 条目（12 字节）-> 整数值列表；只处理 SHORT / LONG / IFD 类型。"""
+    tag, typ, count = struct.unpack(endian + "HHI", entry[:8])
+    if typ not in (3, 4, 13) or count == 0 or count > 4096:
+        return []
+    fmt = "H" if typ == 3 else "I"
+    size = _TYPE_SIZES[typ] * count
+    raw = entry[8 : 8 + size] if size <= 4 else _read_at(f, struct.unpack(endian + "I", entry[8:12])[0], size)
+    if len(raw) < size:
+        return []
+    return list(struct.unpack(endian + fmt * count, raw))
+
+
+def _walk_tiff(f, endian: str, first_ifd: int) -> Tuple[List[Tuple[int, int]], int]:
+    """遍历 IFD 链与 SubIFDs，返回 (JPEG 候选 [(偏移, 长度)], IFD0 Orientation)。"""
+    candidates: List[Tuple[int, int]] = []
+    orientation = 1
+    pending = [first_ifd]
+    seen = set()
+    while pending and len(seen) < _MAX_IFDS:
+        offset = pending.pop(0)
+        if offset <= 0 or offset in seen:
+            continue
+        seen.add(offset)
+        head = _read_at(f, offset, 2)
+        if len(head) < 2:
+            continue
+        count = min(struct.unpack(endian + "H", head)[0], _MAX_ENTRIES)
+        body = _read_at(f, offset + 2, count * 12 + 4)
+        if len(body) < count * 12:
+            continue
+
+        tags: Dict[int, List[int]] = {}
+        for i in range(count):
+            entry = body[i * 12 : i * 12 + 12]
+            tag = struct.unpack(endian + "H", entry[:2])[0]
+            if tag in (
+                _TAG_NEW_SUBFILE_TYPE, _TAG_COMPRESSION, _TAG_PHOTOMETRIC, _TAG_STRIP_OFFSETS,
+                _TAG_ORIENTATION, _TAG_STRIP_BYTE_COUNTS, _TAG_SUB_IFDS, _TAG_JPEG_OFFSET, _TAG_JPEG_LENGTH,
+            ):
+                tags[tag] = _ifd_values(f, endian, entry)
+
+        if len(seen) == 1 and tags.get(_TAG_ORIENTATION):
+            orientation = tags[_TAG_ORIENTATION][0]
+        if tags.get(_TAG_JPEG_OFFSET) and tags.get(_TAG_JPEG_LENGTH):
+            candidates.append((tags[_TAG_JPEG_OFFSET][0], tags[_TAG_JPEG_LENGTH][0]))
+        strips, counts = tags.get(_TAG_STRIP_OFFSETS), tags.get(_TAG_STRIP_BYTE_COUNTS)
+        if (
+            strips
+            and counts
+            and len(strips) == 1
+            and (tags.get(_TAG_COMPRESSION) or [0])[0] in _JPEG_COMPRESSIONS
+            and (tags.get(_TAG_PHOTOMETRIC) or [0])[0] not in _RAW_PHOTOMETRICS
+        ):
+            candidates.append((strips[0], counts[0]))
+        pending.extend(tags.get(_TAG_SUB_IFDS) or ())
+        if len(body) >= count * 12 + 4:
+            pending.append(struct.unpack(endian + "I", body[count * 12 : count * 12 + 4])[0])
+    return candidates, orientation
+
+
+def find_raw_preview(file_path: str) -> Optional[RawPreview]:
+    """定位 RAW 文件中最大的内嵌 JPEG 预览（不读预览本身）；不是支持的 RAW 或没有预览时返回 None。"""
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(96)
+            if header.startswith(_RAF_MAGIC) and len(header) >= 92:
+                offset, length = struct.unpack_from(">II", header, 84)
+                candidates, orientation = [(offset, length)], 0
+            elif header[:2] in (b"II", b"MM"):
+                endian = "<" if header[:2] == b"II" else ">"
+                if struct.unpack_from(endian + "H", header, 2)[0] not in _TIFF_MAGICS:
+                    return None
+                candidates, orientation = _walk_tiff(f, endian, struct.unpack_from(endian + "I", header, 4)[0])
+            else:
+                return None
+
+            size = os.fstat(f.fileno()).st_size
+            best: Optional[Tuple[int, int]] = None
+            for offset, length in candidates:
+                if length <= 2 or offset + length > size or (best is not None and length <= best[1]):
+                    continue
+                if _read_at(f, offset, 2) == b"\xff\xd8":
+                    best = (offset, length)
+    except (OSError, struct.error) as e:
+        print(f"[RAW] failed to parse {file_path}: {e}")
+        return None
+    if best is None:
+        return None
+    return RawPreview(best[0], best[1], orientation)
+
+
+def read_raw_preview(file_path: str) -> Optional[Tuple[bytes, int]]:
+    """读取最大的内嵌 JPEG 预览，返回 (JPEG 字节, Orientation)（Orientation 含义见 RawPreview）。"""
+    preview = find_raw_preview(file_path)
+    if preview is None:
+        return None
+    with open(file_path, "rb") as f:
+        data = _read_at(f, preview.offset, preview.length)
+    return data, preview.orientation
+
+
+def raw_jpeg_pairs(paths: Sequence[str]) -> Dict[str, str]:
+    """
+    同目录同名的 RAW+JPEG（相机"RAW+JPEG"拍摄模式），返回 {RAW 路径: JPEG 路径}。
+
+    两者是同一次曝光，单图特征只需为 JPEG 计算一次；比较时忽略大小写与路径分隔符差异。
+    """
+    jpegs: Dict[str, str] = {}
+    raws: List[Tuple[str, str]] = []
+    for path in paths:
+        stem, ext = os.path.splitext(path)
+        key = re.sub(r"[\\/]+", "/", stem).lower()
+        ext = ext.lower()
+        if ext in _JPEG_EXTENSIONS:
+            jpegs.setdefault(key, path)
+        elif ext in RAW_EXTENSIONS:
+            raws.append((key, path))
+    return {path: jpegs[key] for key, path in raws if key in jpegs}
@@ -0,0 +1,127 @@
+"""
+推理张量缓冲区复用（tensor arena）+ ONNX Runtime IO binding 封装。
+
+稳态推理时每张图的输入形状几乎不变（IQA 固定 384/1280、人脸检测固定 1280 画布、
+关键点/OCEC 固定 patch 尺寸），逐张 np.zeros / np.stack / astype 分配几十 MB 临时数组
+只会给分配器和缓存带来压力。这里按线程缓存"名字 + 形状 + dtype"对应的缓冲区，
+并为每个 (Session, 输入形状) 缓存一份 IOBinding，让输出也直接写入预分配内存。
+
+约定：从 arena / run_with_binding 拿到的数组会在同一线程下一次同名调用时被覆盖，
+调用方必须在下一次推理前消费完（转成标量、切片拷贝等），不能长期持有引用。
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 单线程最多缓存的缓冲区数量：不同宽高比的照片会产生不同形状的 resize 缓冲区，
+# 超过上限按 LRU 淘汰，防止长时间运行后缓冲区无限增长
+_MAX_BUFFERS_PER_THREAD = 32
+
+
+class TensorArena:
+    """单线程使用的缓冲区池，按 (name, shape, dtype) 复用 ndarray。"""
+
+    def __init__(self, max_buffers: int = _MAX_BUFFERS_PER_THREAD):
+        self._buffers: "OrderedDict[Tuple[str, Tuple[int, ...], str], np.ndarray]" = OrderedDict()
+        self._max_buffers = max_buffers
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+        """取出（或首次创建）指定形状的缓冲区；内容未初始化，调用方负责完整写入。"""
+        key = (name, tuple(int(d) for d in shape), np.dtype(dtype).str)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = np.empty(key[1], dtype=dtype)
+            self._buffers[key] = buf
+            if len(self._buffers) > self._max_buffers:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(key)
+        return buf
+
+
+_LOCAL = threading.local()
+
+
+def get_arena() -> TensorArena:
+    """当前线程的 arena（检测工作线程各自独立，无需加锁）。"""
+    arena = getattr(_LOCAL, "arena", None)
+    if arena is None:
+        arena = TensorArena()
+        _LOCAL.arena = arena
+    return arena
+
+
+# 推理输入采集钩子（utils/quantize.py 生成 INT8 静态量化校准集时设置）：
+# 非 None 时每次推理前以 (session, feeds) 回调；feeds 可能是 arena 缓冲区，回调方需自行拷贝
+_FEED_RECORDER: Optional[Callable[[object, Dict[str, np.ndarray]], None]] = None
+
+
+def set_feed_recorder(recorder: Optional[Callable[[object, Dict[str, np.ndarray]], None]]) -> None:
+    """设置 / 清除推理输入采集钩子（仅离线工具使用，正常推理路径保持 None）。"""
+    global _FEED_RECORDER
+    _FEED_RECORDER = recorder
+
+
+def _binding_cache() -> "weakref.WeakKeyDictionary":
+    # Session -> {输入形状签名: (IOBinding, 输出缓冲区列表)}；Session 被回收时条目自动失效
+    cache = getattr(_LOCAL, "bindings", None)
+    if cache is None:
+        cache = weakref.WeakKeyDictionary()
+        _LOCAL.bindings = cache
+    return cache
+
+
+def run_with_binding(session, feeds: Dict[str, np.ndarray]) -> List[np.ndarray]:
+    """以 IO binding 运行 Session，返回全部输出（顺序同 session.get_outputs()）。
+
+    首次遇到某个输入形状时先走普通 run() 探测输出形状，再为其分配输出缓冲区并建立绑定；
+    之后相同形状的调用只重新绑定输入指针，输出直接写入同一组缓冲区，不再分配内存。
+    不支持 io_binding 的 Session（如 _DummyIqaSession）或绑定失败时回退到 session.run。
+    """
+    if _FEED_RECORDER is not None:
+        _FEED_RECORDER(session, feeds)
+
+    if not hasattr(session, "io_binding"):
+        return session.run(None, feeds)
+
+    try:
+        per_session = _binding_cache().setdefault(session, {})
+    except TypeError:
+        # 不可弱引用的 Session 包装对象：放弃复用，行为与原实现一致
+        return session.run(None, feeds)
+
+    signature = tuple((name, arr.shape, arr.dtype.str) for name, arr in feeds.items())
+    if signature not in per_session:
+        outputs = session.run(None, feeds)
+        try:
+            binding = session.io_binding()
+            buffers = [np.empty_like(o) for o in outputs]
+            for meta, buf in zip(session.get_outputs(), buffers):
+                binding.bind_output(meta.name, "cpu", 0, buf.dtype, list(buf.shape), buf.ctypes.data)
+            per_session[signature] = (binding, buffers)
+        except Exception as e:  # noqa: BLE001
+            print(f"[ARENA] IO binding unavailable ({e}), using session.run.")
+            per_session[signature] = None
+        # 首次调用直接返回 run() 的结果（新分配的数组），语义与普通推理一致
+        return outputs
+
+    entry = per_session[signature]
+    if entry is None:
+        return session.run(None, feeds)
+    binding, buffers = entry
+
+    try:
+        for name, arr in feeds.items():
+            binding.bind_cpu_input(name, np.ascontiguousarray(arr))
+        session.run_with_iobinding(binding)
+        binding.synchronize_outputs()
+        return buffers
+    except Exception as e:  # noqa: BLE001
+        # 绑定执行失败（如 provider 不支持预分配输出）：弃用该绑定，后续同形状调用走普通 run
+        print(f"[ARENA] run_with_iobinding failed ({e}), falling back to session.run.")
+        per_session[signature] = None
+        return session.run(None, feeds)
@@ -0,0 +1,228 @@
+"""
+/get_thumbnail 的服务端缓存：按字节数限额的内存 LRU + 磁盘预生成缩略图 + ETag 校验。
+
+查找顺序：
+  1. ETag 只由源文件 stat（大小、mtime）、请求尺寸与 THUMBNAIL_VERSION 推出，不读任何图片；
+     与 If-None-Match 相同时路由直接回 304，滚动时反复请求同一张图只花一次 stat；
+  2. 内存 LRU（键为源路径 + ETag）：命中直接返回已编码的 WebP 字节；
+  3. 缩略图目录中清单登记为新鲜的 {crc32}.webp（或 thumbs.pack 中的条目）：读文件即可，不解码不编码；
+  4. 都没有时才调用 get_thumbnail_bgr 生成并编码，结果放入 LRU。
+"""
+
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+
+from .admission import admit_decode
+from .env import env_int
+from .thumb_manifest import MANIFEST_NAME, ThumbEntry, close_manifest_reader, open_manifest_reader, thumbnail_name
+from .thumb_pack import has_pack, open_pack, pack_key
+from .thumbnails import THUMBNAIL_VERSION, get_thumbnail_bgr
+
+# 内存缓存上限（MB）；128px WebP 每张只有几 KB，默认 64 MB 足以容纳上万张
+THUMB_CACHE_MB: int = env_int("MEDIA_TOOLBOX_THUMB_CACHE_MB", 64, minimum=0)
+
+# 批量接口的帧头：请求中的下标（uint32）、状态（uint8）、负载长度（uint32），小端
+BATCH_FRAME_HEADER = struct.Struct("<IBI")
+BATCH_OK = 0
+BATCH_ERROR = 1
+# 批量生成的并行度；同时在途的任务数为它的 2 倍，客户端断开后剩余的直接取消
+_BATCH_WORKERS: int = min(8, os.cpu_count() or 1)
+
+
+class ThumbnailCache:
+    """线程安全的字节数限额 LRU：{键: 编码后的字节}。"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        # 单个条目超过上限时不缓存（否则会清空整个缓存）
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache = ThumbnailCache(THUMB_CACHE_MB * 1024 * 1024)
+_counter_lock = threading.Lock()
+_counters: Dict[str, int] = {"not_modified": 0, "disk_hits": 0, "generated": 0}
+
+
+def _count(name: str) -> None:
+    with _counter_lock:
+        _counters[name] += 1
+
+
+def thumbnail_etag(photo_path: str, width: int, height: int) -> str:
+    """由源文件 stat 与请求参数推出的强 ETag（源文件不存在时抛 OSError）。"""
+    st = os.stat(photo_path)
+    name = thumbnail_name(photo_path)[:-5]
+    return f'"{name}-{st.st_size:x}-{st.st_mtime_ns:x}-{width}x{height}-v{THUMBNAIL_VERSION}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 可能是逗号分隔的列表、带 W/ 前缀，或 *。"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def note_not_modified() -> None:
+    _count("not_modified")
+
+
+def _read_pregenerated(photo_path: str, width: int, height: int, thumbs_path: Optional[str]) -> Optional[bytes]:
+    """
+    缩略图目录中清单登记为新鲜的 WebP；清单不存在、参数不符或文件缺失时返回 None。
+
+    请求的尺寸可能是生成时的主尺寸（无后缀），也可能是多尺寸生成的其他尺寸（带 _{w}x{h} 后缀），两者都查。
+    """
+    if not thumbs_path:
+        return None
+    if not os.path.isfile(os.path.join(thumbs_path, MANIFEST_NAME)):
+        # 缩略图目录被清空：放掉可能还指向旧文件的共享连接
+        close_manifest_reader(thumbs_path)
+        return None
+    packed = has_pack(thumbs_path)
+    st = os.stat(photo_path)
+    wanted = ThumbEntry(photo_path, st.st_size, st.st_mtime_ns, width, height, THUMBNAIL_VERSION)
+    manifest = open_manifest_reader(thumbs_path)
+    for size in (None, (width, height)):
+        name = pack_key(photo_path, size) if packed else thumbnail_name(photo_path, size)
+        if manifest.get(name) == wanted:
+            break
+    else:
+        return None
+    if packed:
+        return open_pack(thumbs_path).get(photo_path, size)
+    try:
+        with open(os.path.join(thumbs_path, name), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def serve_thumbnail(
+    photo_path: str,
+    width: int,
+    height: int,
+    thumbs_path: Optional[str] = None,
+) -> Tuple[str, bytes]:
+    """返回 (ETag, WebP 字节)：依次查内存 LRU、磁盘预生成缩略图，最后才生成。"""
+    etag = thumbnail_etag(photo_path, width, height)
+    # ETag 里只有路径的 CRC32，缓存键带上完整路径，排除哈希碰撞
+    key = f"{photo_path}\n{etag}"
+    data = _cache.get(key)
+    if data is not None:
+        return etag, data
+
+    data = _read_pregenerated(photo_path, width, height, thumbs_path)
+    if data is not None:
+        _count("disk_hits")
+    else:
+        with admit_decode(photo_path, max(width, height)):
+            image = get_thumbnail_bgr(photo_path, width, height)
+        success, buffer = cv2.imencode(".webp", image)
+        if not success:
+            raise RuntimeError("Failed to encode image to WEBP format")
+        data = buffer.tobytes()
+        _count("generated")
+
+    _cache.put(key, data)
+    return etag, data
+
+
+def _batch_item(photo_path: str, width: int, height: int, thumbs_path: Optional[str]) -> Tuple[int, bytes]:
+    try:
+        return BATCH_OK, serve_thumbnail(photo_path, width, height, thumbs_path)[1]
+    except Exception as e:
+        return BATCH_ERROR, f"{type(e).__name__}: {e}".encode("utf-8")
+
+
+def iter_thumbnail_batch(
+    photo_paths: List[str],
+    width: int,
+    height: int,
+    thumbs_path: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    并行生成一批缩略图，按完成顺序逐帧产出：帧头 BATCH_FRAME_HEADER + 负载。
+
+    负载为 WebP 字节（BATCH_OK）或 UTF-8 错误信息（BATCH_ERROR）；客户端用帧头中的下标对应请求顺序。
+    每张仍走 serve_thumbnail（LRU / 预生成文件 / 生成），所以批量与单张请求共享缓存。
+    """
+    executor = ThreadPoolExecutor(max_workers=_BATCH_WORKERS)
+    try:
+        pending = {}
+        items = iter(enumerate(photo_paths))
+        # 限制在途任务数：生成器被丢弃（客户端断开）时不会留下整批已提交的任务
+        for index, path in items:
+            pending[executor.submit(_batch_item, path, width, height, thumbs_path)] = index
+            if len(pending) >= 2 * _BATCH_WORKERS:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                status, payload = future.result()
+                yield BATCH_FRAME_HEADER.pack(index, status, len(payload)) + payload
+            for index, path in items:
+                pending[executor.submit(_batch_item, path, width, height, thumbs_path)] = index
+                if len(pending) >= 2 * _BATCH_WORKERS:
+                    break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def cache_stats() -> Dict[str, int]:
+    """内存 LRU 的命中 / 未命中 / 淘汰计数，加上 304、磁盘命中与实际生成次数。"""
+    with _counter_lock:
+        counters = dict(_counters)
+    return {**_cache.stats(), **counters}
@@ -0,0 +1,198 @@
+"""
+缩略图后台任务：带 ID、进度、取消与优先级的单线程任务队列。
+
+/generate_thumbnails 过去在 async 路由里同步跑完整个 generate_thumbnails，整个事件循环
+（包括 /status 轮询与 /get_thumbnail）都要等所有缩略图完成。现在路由只负责提交任务并立即返回 job_id，
+专用后台线程按优先级依次执行；generate_thumbnails 内部仍是线程池并行，所以同一时刻只跑一个任务。
+新的导入默认取代（supersede）所有未完成的任务：排队中的直接取消，运行中的在处理完手头几张后停止，
+已生成的缩略图照常登记到清单，下次导入不会重复生成。
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .import_analysis import ImportAnalyzer
+from .thumbnails import generate_thumbnails
+
+# 保留的已结束任务数（供前端查询结果），更早的按结束顺序丢弃
+FINISHED_JOBS_KEPT: int = 32
+
+JOB_STATES = ("queued", "running", "done", "cancelled", "failed")
+
+
+class ThumbnailJob:
+    def __init__(
+        self,
+        file_paths: List[str],
+        thumbs_path: str,
+        width: int,
+        height: int,
+        priority: int,
+        sizes: Optional[Sequence[Tuple[int, int]]] = None,
+        analysis: Optional[dict] = None,
+    ):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.file_paths = file_paths
+        self.thumbs_path = thumbs_path
+        self.width = width
+        self.height = height
+        self.sizes = sizes
+        # 融合分析参数：{"db_path": ..., "faces": bool, "iqa": bool}，None 表示只生成缩略图
+        self.analysis = analysis
+        self.priority = priority
+        self.state = "queued"
+        self.done = 0
+        self.total = len(file_paths)
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "priority": self.priority,
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ThumbnailJobManager:
+    """
+    优先级队列（priority 越大越先执行，同优先级先到先得）+ 单个后台工作线程。
+
+    progress_fn 与 generate_thumbnails 的进度回调签名一致，用于同步更新全局 /status。
+    """
+
+    def __init__(self, progress_fn: Callable[..., None], log_fn: Callable[[str], None] = print):
+        self._progress_fn = progress_fn
+        self._log = log_fn
+        self._cond = threading.Condition()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._jobs: Dict[str, ThumbnailJob] = {}
+        self._finished: List[str] = []
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(
+        self,
+        file_paths: List[str],
+        thumbs_path: str,
+        width: int,
+        height: int,
+        priority: int = 0,
+        supersede: bool = True,
+        sizes: Optional[Sequence[Tuple[int, int]]] = None,
+        analysis: Optional[dict] = None,
+    ) -> ThumbnailJob:
+        job = ThumbnailJob(file_paths, thumbs_path, width, height, priority, sizes, analysis)
+        with self._cond:
+            if supersede:
+                for other in list(self._jobs.values()):
+                    if other.state in ("queued", "running"):
+                        self._cancel_locked(other)
+            self._jobs[job.job_id] = job
+            heapq.heappush(self._heap, (-priority, next(self._seq), job.job_id))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="thumbnail-jobs", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务；任务不存在或已结束时返回 False。"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in ("queued", "running"):
+                return False
+            self._cancel_locked(job)
+            return True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self) -> List[dict]:
+        with self._cond:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def _cancel_locked(self, job: ThumbnailJob) -> None:
+        job.cancel_event.set()
+        if job.state == "queued":
+            # 仍留在堆里，出队时跳过
+            self._finish_locked(job, "cancelled")
+
+    def _finish_locked(self, job: ThumbnailJob, state: str) -> None:
+        job.state = state
+        job.finished_at = time.time()
+        self._finished.append(job.job_id)
+        while len(self._finished) > FINISHED_JOBS_KEPT:
+            self._jobs.pop(self._finished.pop(0), None)
+
+    def _next_job(self) -> ThumbnailJob:
+        with self._cond:
+            while True:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(job_id)
+                    if job is not None and job.state == "queued":
+                        job.state = "running"
+                        return job
+                self._cond.wait()
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            self._log(f"[thumbnail-jobs] start {job.job_id}: {job.total} files, priority={job.priority}")
+
+            def progress(status_text, worker_id=None, value=None, total=None):
+                if value is not None:
+                    job.done = value
+                if total is not None:
+                    job.total = total
+                self._progress_fn(status_text, worker_id=worker_id, value=value, total=total)
+
+            state = "done"
+            analyzer = None
+            try:
+                if job.analysis:
+                    analyzer = ImportAnalyzer(
+                        job.analysis["db_path"],
+                        compute_faces=bool(job.analysis.get("faces")),
+                        compute_iqa=bool(job.analysis.get("iqa")),
+                    )
+                generate_thumbnails(
+                    job.file_paths,
+                    job.thumbs_path,
+                    job.width,
+                    job.height,
+                    progress,
+                    cancel_event=job.cancel_event,
+                    sizes=job.sizes,
+                    analyzer=analyzer,
+                )
+                if job.cancel_event.is_set():
+                    state = "cancelled"
+            except Exception as e:
+                state = "failed"
+                job.error = str(e)
+                self._log(f"[thumbnail-jobs] {job.job_id} failed: {e}")
+                self._log(traceback.format_exc())
+            finally:
+                if analyzer is not None:
+                    analyzer.close()
+                    self._log(f"[thumbnail-jobs] {job.job_id} analyzed {analyzer.analyzed} files")
+
+            with self._cond:
+                self._finish_locked(job, state)
+            self._log(f"[thumbnail-jobs] {job.job_id} {state}: {job.done}/{job.total}")
@@ -0,0 +1,144 @@
+"""
+缩略图新鲜度清单：记录每个 {crc32}.webp 由哪个源文件、以什么参数生成，重复导入时跳过未变化的照片。
+
+清单是缩略图目录下的一个 SQLite 文件（与照片库 photos.db 分开，缩略图目录可以单独清空 / 迁移）。
+一条记录包含源文件路径、大小、mtime（纳秒）、请求的宽高与缩略图算法版本；
+五项都与当前一致、且缩略图文件仍在目录中时视为新鲜。判断只需要 stat 源文件，
+三万张照片的文件夹重新打开时不再解码 / 编码任何图片。
+"""
+
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+MANIFEST_NAME = "manifest.db"
+
+
+def thumbnail_name(image_file: str, size: Optional[Tuple[int, int]] = None) -> str:
+    """
+    缩略图文件名：归一化路径（小写 + '/'）的 CRC32，前端按同样规则查找。
+
+    size 为 None 时是主尺寸（generate_thumbnails 的 width/height）的 {crc32}.webp；
+    多尺寸生成的其他尺寸带后缀 {crc32}_{w}x{h}.webp。
+    """
+    normalized_path = image_file.replace("\\", "/").lower()
+    crc = zlib.crc32(normalized_path.encode("utf-8"))
+    if size is None:
+        return f"{crc:08x}.webp"
+    return f"{crc:08x}_{size[0]}x{size[1]}.webp"
+
+
+class ThumbEntry(NamedTuple):
+    source: str
+    size: int
+    mtime_ns: int
+    width: int
+    height: int
+    version: int
+
+
+class ThumbManifest:
+    """缩略图目录的清单（每次 generate_thumbnails 调用打开一次，用完关闭）。"""
+
+    def __init__(self, thumbs_path: str):
+        self.thumbs_path = thumbs_path
+        self._conn = sqlite3.connect(os.path.join(thumbs_path, MANIFEST_NAME), timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thumbs (
+                name TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                version INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def load(self) -> Dict[str, ThumbEntry]:
+        """读取全部记录：{缩略图文件名: ThumbEntry}。"""
+        rows = self._conn.execute("SELECT name, source, size, mtime_ns, width, height, version FROM thumbs")
+        return {name: ThumbEntry(*rest) for name, *rest in rows}
+
+    def get(self, name: str) -> Optional[ThumbEntry]:
+        row = self._conn.execute(
+            "SELECT source, size, mtime_ns, width, height, version FROM thumbs WHERE name = ?", (name,)
+        ).fetchone()
+        return ThumbEntry(*row) if row else None
+
+    def existing_files(self) -> Set[str]:
+        """缩略图目录中实际存在的文件名（一次 scandir，代替逐个 exists）。"""
+        with os.scandir(self.thumbs_path) as it:
+            return {entry.name for entry in it if entry.is_file()}
+
+    def record(self, entries: Iterable[tuple]) -> None:
+        """批量写入 (文件名, ThumbEntry)。"""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO thumbs (name, source, size, mtime_ns, width, height, version) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(name, *entry) for name, entry in entries],
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ManifestReader:
+    """
+    /get_thumbnail 查询清单用的只读连接（按目录共享，线程安全）。
+
+    ThumbManifest 每次打开都要设置 WAL、建表并提交；服务端 LRU 未命中时逐张打开一次代价太高，
+    只读连接不写任何东西，WAL 模式下也能读到其他连接已提交的记录。
+    """
+
+    def __init__(self, thumbs_path: str):
+        self.thumbs_path = thumbs_path
+        uri = Path(thumbs_path, MANIFEST_NAME).resolve().as_uri() + "?mode=ro"
+        self._conn = sqlite3.connect(uri, uri=True, timeout=10.0, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[ThumbEntry]:
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT source, size, mtime_ns, width, height, version FROM thumbs WHERE name = ?", (name,)
+                ).fetchone()
+            except sqlite3.OperationalError:
+                # 清单里还没有 thumbs 表（目录只被打包存储初始化过）
+                return None
+        return ThumbEntry(*row) if row else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_readers: Dict[str, ManifestReader] = {}
+_readers_lock = threading.Lock()
+
+
+def open_manifest_reader(thumbs_path: str) -> ManifestReader:
+    """按目录共享的只读清单连接（与 open_pack 一样，进程内每个目录只保留一个）。"""
+    key = os.path.abspath(thumbs_path)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is None:
+            reader = ManifestReader(key)
+            _readers[key] = reader
+        return reader
+
+
+def close_manifest_reader(thumbs_path: str) -> None:
+    """关闭并丢弃目录的共享只读连接；下次查询时重新打开（Windows 上打开的句柄会挡住文件替换 / 删除）。"""
+    with _readers_lock:
+        reader = _readers.pop(os.path.abspath(thumbs_path), None)
+    if reader is not None:
+        reader.close()
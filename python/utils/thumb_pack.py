@@ -0,0 +1,269 @@
+"""
+可选的单文件缩略图存储：追加写的数据文件 + SQLite 索引，读取走 mmap。
+
+几万个 {crc32}.webp 小文件在创建、列目录、同步盘与杀毒扫描时都很慢，而 32 位 CRC 在大库里也会碰撞
+（两张照片共用一个缩略图文件，互相覆盖）。打包模式（MEDIA_TOOLBOX_THUMB_STORE=pack）下：
+  - 所有缩略图依次追加到缩略图目录下的 thumbs.pack，只有一个文件；
+  - 索引表 pack_index 放在同目录的 manifest.db 中，键为归一化路径的 128 位 BLAKE2b，不会碰撞；
+  - 读取通过 mmap 切片，不需要每张 open / read / close；
+  - 重新生成的缩略图追加新版本，旧数据成为空洞，compact() 顺序重写存活数据回收空间
+    （新偏移先提交到 pack_compaction 表再替换文件，中途崩溃时打开目录会补完或撤销这次压缩）；
+  - export() 仍可导出为 {crc32}.webp 单文件，供依赖旧目录结构的工具（以及 Electron 的 thumbnail-resource 协议）使用。
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from .thumb_manifest import MANIFEST_NAME, close_manifest_reader, thumbnail_name
+
+PACK_NAME = "thumbs.pack"
+
+# 缩略图存储方式："files"（默认，每张一个 {crc32}.webp）或 "pack"（单文件打包）
+THUMB_STORE: str = os.environ.get("MEDIA_TOOLBOX_THUMB_STORE", "files").strip().lower()
+
+
+def pack_key(image_file: str, size: Optional[Tuple[int, int]] = None) -> str:
+    """打包存储的索引键：归一化路径（小写 + '/'）的 128 位 BLAKE2b；非主尺寸再拼上 "\n{w}x{h}"。"""
+    normalized_path = image_file.replace("\\", "/").lower()
+    if size is not None:
+        normalized_path += f"\n{size[0]}x{size[1]}"
+    return hashlib.blake2b(normalized_path.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ThumbPack:
+    """
+    单个缩略图目录的打包存储（线程安全）。
+
+    put() 只追加数据并暂存索引行，flush() 时一次事务写入索引；get() 只能读到已 flush 的条目。
+    """
+
+    def __init__(self, thumbs_path: str):
+        self.thumbs_path = thumbs_path
+        self.path = os.path.join(thumbs_path, PACK_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(thumbs_path, MANIFEST_NAME), timeout=10.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pack_index (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER
+            )
+            """
+        )
+        # 早期的索引表没有尺寸列（只存主尺寸），补列后旧记录的 width/height 为 NULL，即主尺寸
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pack_index)")}
+        for column in ("width", "height"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE pack_index ADD COLUMN {column} INTEGER")
+        # compact() 的新偏移：替换文件前提交，替换后再合并进 pack_index（见 _recover_compaction）
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pack_compaction (key TEXT PRIMARY KEY, offset INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+        self._recover_compaction()
+        self._file = open(self.path, "ab+")
+        self._mmap: Optional[mmap.mmap] = None
+        self._staged: List[tuple] = []
+
+    # ---------------------------- 写入 ----------------------------
+
+    def put(self, image_file: str, data: bytes, size: Optional[Tuple[int, int]] = None) -> None:
+        """追加一张缩略图；size 为 None 表示主尺寸，其他尺寸见 pack_key。"""
+        width, height = size if size is not None else (None, None)
+        with self._lock:
+            offset = self._file.seek(0, os.SEEK_END)
+            self._file.write(data)
+            self._staged.append((pack_key(image_file, size), image_file, offset, len(data), width, height))
+
+    def flush(self) -> None:
+        """把暂存的索引行写入 manifest.db（数据先落盘，再提交索引）。"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._staged:
+            return
+        self._file.flush()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO pack_index (key, source, offset, length, width, height) VALUES (?, ?, ?, ?, ?, ?)",
+            self._staged,
+        )
+        self._conn.commit()
+        self._staged = []
+
+    # ---------------------------- 读取 ----------------------------
+
+    def keys(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT key FROM pack_index")}
+
+    def get(self, image_file: str, size: Optional[Tuple[int, int]] = None) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT offset, length FROM pack_index WHERE key = ?", (pack_key(image_file, size),)
+            ).fetchone()
+            if row is None:
+                return None
+            offset, length = row
+            mm = self._map_locked(offset + length)
+            if mm is None:
+                return None
+            return mm[offset : offset + length]
+
+    def _map_locked(self, needed: int) -> Optional[mmap.mmap]:
+        """保证 mmap 覆盖到 needed 字节；文件追加后按需重新映射。"""
+        if self._mmap is not None and len(self._mmap) >= needed:
+            return self._mmap
+        self._file.flush()
+        size = os.fstat(self._file.fileno()).st_size
+        if size < needed or size == 0:
+            return None
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    # ---------------------------- 维护 ----------------------------
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, live = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM pack_index").fetchone()
+            self._file.flush()
+            size = os.fstat(self._file.fileno()).st_size
+        return {"entries": entries, "live_bytes": live, "file_bytes": size, "garbage_bytes": size - live}
+
+    def _recover_compaction(self) -> None:
+        """
+        收尾上次中断的 compact()：文件替换与索引更新不在同一个事务里，崩溃可能停在两者之间。
+
+        os.replace 是原子的，临时文件还在说明替换没有发生，旧文件与旧偏移仍然匹配，丢弃新偏移即可；
+        临时文件已不在而 pack_compaction 有记录，说明文件已替换、索引还没更新，补做更新。
+        """
+        tmp_path = self.path + ".tmp"
+        pending = self._conn.execute("SELECT COUNT(*) FROM pack_compaction").fetchone()[0]
+        if pending and not os.path.exists(tmp_path):
+            self._apply_compaction_locked()
+        elif pending:
+            self._conn.execute("DELETE FROM pack_compaction")
+            self._conn.commit()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def _apply_compaction_locked(self) -> None:
+        """把 pack_compaction 中的新偏移合并进 pack_index 并清空，一个事务完成。"""
+        self._conn.execute(
+            """
+            UPDATE pack_index
+            SET offset = (SELECT c.offset FROM pack_compaction c WHERE c.key = pack_index.key)
+            WHERE key IN (SELECT key FROM pack_compaction)
+            """
+        )
+        self._conn.execute("DELETE FROM pack_compaction")
+        self._conn.commit()
+
+    def compact(self) -> int:
+        """
+        按偏移顺序重写存活数据到新文件并原子替换，返回回收的字节数。
+
+        顺序：新文件落盘 -> 新偏移提交到 pack_compaction -> os.replace -> 合并进 pack_index。
+        任一步之后崩溃，下次打开时 _recover_compaction 都能让文件与索引重新一致。
+        """
+        # /get_thumbnail 的共享只读清单连接也要放掉，整理期间不留额外的句柄，之后按需重开
+        close_manifest_reader(self.thumbs_path)
+        with self._lock:
+            self._flush_locked()
+            rows = self._conn.execute("SELECT key, offset, length FROM pack_index ORDER BY offset").fetchall()
+            self._file.flush()
+            old_size = os.fstat(self._file.fileno()).st_size
+            mm = self._map_locked(old_size) if old_size else None
+
+            tmp_path = self.path + ".tmp"
+            new_rows = []
+            with open(tmp_path, "wb") as out:
+                for key, offset, length in rows:
+                    new_rows.append((out.tell(), key))
+                    out.write(mm[offset : offset + length])
+                out.flush()
+                os.fsync(out.fileno())
+                new_size = out.tell()
+
+            self._conn.execute("DELETE FROM pack_compaction")
+            self._conn.executemany("INSERT INTO pack_compaction (offset, key) VALUES (?, ?)", new_rows)
+            self._conn.commit()
+
+            # Windows 上被映射 / 打开的文件不能被替换，先全部关闭
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.close()
+            try:
+                os.replace(tmp_path, self.path)
+                _fsync_dir(self.thumbs_path)
+                self._apply_compaction_locked()
+            finally:
+                self._file = open(self.path, "ab+")
+            return old_size - new_size
+
+    def export(self, dest_dir: str) -> int:
+        """把打包的缩略图导出为 dest_dir/{crc32}.webp（其他尺寸为 {crc32}_{w}x{h}.webp）单文件，返回导出的数量。"""
+        os.makedirs(dest_dir, exist_ok=True)
+        close_manifest_reader(self.thumbs_path)
+        with self._lock:
+            self._flush_locked()
+            rows = self._conn.execute("SELECT source, offset, length, width, height FROM pack_index").fetchall()
+            self._file.flush()
+            mm = self._map_locked(os.fstat(self._file.fileno()).st_size) if rows else None
+            for source, offset, length, width, height in rows:
+                size = (width, height) if width is not None else None
+                with open(os.path.join(dest_dir, thumbnail_name(source, size)), "wb") as f:
+                    f.write(mm[offset : offset + length])
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.close()
+            self._conn.close()
+
+
+def _fsync_dir(path: str) -> None:
+    """让目录项的修改（os.replace）落盘后再提交索引；Windows 不支持打开目录，NTFS 的重命名本身有日志保护。"""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_packs: Dict[str, ThumbPack] = {}
+_packs_lock = threading.Lock()
+
+
+def open_pack(thumbs_path: str) -> ThumbPack:
+    """按目录共享的 ThumbPack 实例（进程内只保留一份 mmap 与索引连接）。"""
+    key = os.path.abspath(thumbs_path)
+    with _packs_lock:
+        pack = _packs.get(key)
+        if pack is None:
+            os.makedirs(key, exist_ok=True)
+            pack = ThumbPack(key)
+            _packs[key] = pack
+        return pack
+
+
+def has_pack(thumbs_path: str) -> bool:
+    return os.path.isfile(os.path.join(thumbs_path, PACK_NAME))
@@ -1,16 +1,32 @@
-from typing import List, Callable
+from typing import Dict, List, Callable, Optional, Sequence, Tuple
 import os
+import stat
 import sys
 import threading
 import struct
-import zlib
 import concurrent.futures
 import ctypes
 import time  # QuickLook 异步超时控制用
 import numpy as np
 import cv2
 
-from utils.image_compute import cv_imread
+from utils.admission import admit_decode
+from utils.env import env_int
+from utils.exif import HEADER_BYTES, embedded_thumbnail, jpeg_dimensions
+from utils.image_compute import apply_orientation, cv_imread
+from utils.pyramid import ImagePyramid
+from utils.raw import IMAGE_EXTENSIONS, is_raw, read_raw_preview
+from utils.thumb_manifest import ThumbEntry, ThumbManifest, thumbnail_name
+from utils.thumb_pack import THUMB_STORE, open_pack, pack_key
+from utils.import_analysis import THUMBS_STAGE, ImportAnalyzer
+
+# 缩略图算法版本：生成结果会变化的改动（缩放方式、编码参数、内嵌缩略图规则）需要 +1，
+# 清单中版本不同的缩略图在下次导入时重新生成
+THUMBNAIL_VERSION: int = 2
+
+# 多尺寸生成中额外尺寸（预览 / 大图）的 WebP 有损质量。OpenCV 默认是无损 WebP：
+# 128px 的主尺寸无所谓，1600px 的预览无损编码要 1 秒以上、体积超过 1 MB，远超解码本身
+PREVIEW_WEBP_QUALITY: int = env_int("MEDIA_TOOLBOX_PREVIEW_WEBP_QUALITY", 90, minimum=1)
 
 # 进度回调类型（可接受任意参数签名以兼容现有调用）
 ProgressFn = Callable[..., None]
@@ -22,23 +38,118 @@ def _cv_imread(file_path: str) -> np.ndarray:
     return cv_imread(file_path)
 
 
-def cv_imwrite(file_path: str, img: np.ndarray) -> bool:
-    """支持中文路径的 cv2 写入 WEBP."""
-    success, buffer = cv2.imencode('.webp', img)
+def encode_webp(img: np.ndarray, quality: Optional[int] = None) -> bytes:
+    """编码为 WEBP；quality 为 None 时沿用 OpenCV 默认（无损）。"""
+    params = [] if quality is None else [cv2.IMWRITE_WEBP_QUALITY, quality]
+    success, buffer = cv2.imencode('.webp', img, params)
     if not success:
-        raise RuntimeError(f"Failed to encode image: {file_path}")
+        raise RuntimeError("Failed to encode image to WEBP format")
+    return buffer.tobytes()
+
+
+def cv_imwrite(file_path: str, img: np.ndarray, quality: Optional[int] = None) -> bool:
+    """支持中文路径的 cv2 写入 WEBP."""
+    data = encode_webp(img, quality)
     with open(file_path, 'wb') as f:
-        f.write(buffer)
+        f.write(data)
     return True
 
 
+# ============================ 通用快速路径 ============================
+# Linux 的主路径、macOS 的兜底：不做全分辨率解码。
+# 1. EXIF 内嵌缩略图（只读文件头 128 KB）：长边够大、且宽高比与主图一致（没有黑边）时直接用；
+# 2. JPEG 按目标尺寸选 IMREAD_REDUCED_COLOR_2/4/8：libjpeg 在 DCT 域缩放，只做 1/2~1/8 的 IDCT，
+#    6000 万像素的照片解码到 128px 缩略图比完整解码快一个数量级，内存也只有 1/4~1/64；
+# 3. 其他格式（PNG / WebP）或读不到尺寸时完整解码。
+# RAW 先取内嵌的 JPEG 预览（utils/raw.py），再对预览做第 2 步。
+# 最后统一由 ImagePyramid 缩放到 max_px（与分析流程的层级缩放同一实现）。
+
+# (缩小倍数, 解码标志)，从大到小尝试
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# 内嵌缩略图与主图宽高比允许的相对误差；超过说明带黑边（常见于 3:2 主图配 4:3 的 160x120 缩略图）
+_EMBEDDED_ASPECT_TOLERANCE = 0.02
+
+
+def _embedded_thumbnail_bgr(head: bytes, max_px: int) -> Optional[np.ndarray]:
+    """可直接使用的 EXIF 内嵌缩略图（已转正）；不存在、尺寸不够或宽高比不符时返回 None。"""
+    found = embedded_thumbnail(head)
+    dims = jpeg_dimensions(head)
+    if found is None or dims is None:
+        return None
+    data, orientation = found
+    # 内嵌缩略图自身不带 EXIF，imdecode 不会再旋转
+    thumb = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if thumb is None or max(thumb.shape[:2]) < max_px:
+        return None
+    width, height = dims
+    th, tw = thumb.shape[:2]
+    if abs(tw / th - width / height) > _EMBEDDED_ASPECT_TOLERANCE * (width / height):
+        return None
+    return apply_orientation(thumb, orientation)
+
+
+def _reduced_flag(dims: Optional[Tuple[int, int]], max_px: int) -> Optional[int]:
+    """长边仍不小于 max_px 的最大 DCT 缩放倍数对应的解码标志；尺寸未知或无法缩小时返回 None。"""
+    if dims is None:
+        return None
+    long_side = max(dims)
+    for factor, flag in _REDUCED_FLAGS:
+        if -(-long_side // factor) >= max_px:
+            return flag
+    return None
+
+
+def _reduced_decode(file_path: str, head: bytes, max_px: int) -> np.ndarray:
+    """JPEG 按目标尺寸在 DCT 域缩小解码（长边仍不小于 max_px）；无法确定尺寸时完整解码。"""
+    flag = _reduced_flag(jpeg_dimensions(head), max_px)
+    if flag is not None:
+        img = cv2.imdecode(np.fromfile(file_path, dtype=np.uint8), flag)
+        if img is not None:
+            return img
+    return _cv_imread(file_path)
+
+
+def _raw_thumbnail_bgr(file_path: str, max_px: int) -> np.ndarray:
+    """RAW：只读内嵌 JPEG 预览，按目标尺寸 DCT 缩放解码后按 IFD0 Orientation 转正（见 utils/raw.py）。"""
+    found = read_raw_preview(file_path)
+    if found is None:
+        raise RuntimeError(f"No embedded JPEG preview in RAW file: {file_path}")
+    data, orientation = found
+    flag = _reduced_flag(jpeg_dimensions(data[:HEADER_BYTES]), max_px) or cv2.IMREAD_COLOR
+    if orientation:
+        flag |= cv2.IMREAD_IGNORE_ORIENTATION
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if img is None:
+        raise RuntimeError(f"Failed to decode RAW preview: {file_path}")
+    return ImagePyramid(apply_orientation(img, orientation)).level(max_px)
+
+
+def _fast_thumbnail_bgr(file_path: str, max_px: int) -> np.ndarray:
+    """通用快速路径：内嵌缩略图 -> DCT 缩放解码 -> 完整解码，返回长边不超过 max_px 的 BGR 图像。"""
+    if is_raw(file_path):
+        return _raw_thumbnail_bgr(file_path, max_px)
+    with open(file_path, "rb") as f:
+        head = f.read(HEADER_BYTES)
+    img = _embedded_thumbnail_bgr(head, max_px)
+    if img is None:
+        img = _reduced_decode(file_path, head, max_px)
+    return ImagePyramid(img).level(max_px)
+
+
 # ============================ 平台分支 ============================
 # Windows：使用 Shell API (IShellItemImageFactory) 获取系统缩略图，
 #           可利用 Windows 缩略图缓存（含 EXIF 内嵌缩略图），速度快。
 # macOS：使用 ImageIO（CGImageSourceCreateThumbnailAtIndex）+ QuickLook 三级降级，
 #           ImageIO 对 JPEG/PNG 比 OpenCV 快 1.5-2x（利用 EXIF 内嵌缩略图），
-#           QuickLook 对 WebP 快 15x（系统缓存），OpenCV 兜底。
-#           输出与 Windows 版相同的 BMP 编码字节（调用方用 np.frombuffer → cv2.imdecode 解码）。
+#           QuickLook 对 WebP 快 15x（系统缓存），上面的通用快速路径兜底。
+# Linux：没有 PyObjC，直接走通用快速路径。
+# get_thumbnail 返回 BMP 编码字节（Windows 原生接口的契约）；
+# get_thumbnail_bgr 直接返回像素，非 Windows 平台不再经过 BMP 编码 / 解码往返。
 
 if sys.platform == "win32":
     # ---- Windows-only 导入：ctypes.wintypes / comtypes 仅在 Windows 存在 ----
@@ -212,6 +323,17 @@ if sys.platform == "win32":
 
         return bmp_data
 
+    def get_thumbnail_bgr(file_path, width, height):
+        """Windows 实现：解码 Shell API 返回的 BMP 字节，返回 BGR ndarray。"""
+        # RAW 不依赖系统是否安装了对应的编解码器，直接取内嵌预览
+        if is_raw(file_path):
+            return _raw_thumbnail_bgr(file_path, max(width, height))
+        bmp_data = get_thumbnail(file_path, width, height)
+        img = cv2.imdecode(np.frombuffer(bmp_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise RuntimeError(f"Failed to decode thumbnail for {file_path}")
+        return img
+
 else:
     # ---- macOS 原生缩略图：ImageIO/QuickLook + OpenCV 三级降级 ----
     # 延迟导入 PyObjC：未安装时 _HAS_* 为 False，直接降级到 OpenCV，
@@ -263,17 +385,18 @@ else:
             raise RuntimeError("Failed to encode BMP")
         return bytearray(buffer.tobytes())
 
-    def get_thumbnail(file_path, width, height):
-        """macOS 实现：ImageIO/QuickLook 原生缩略图 + OpenCV 兜底，返回 BMP 字节。
+    def get_thumbnail_bgr(file_path, width, height):
+        """macOS / Linux 实现：ImageIO/QuickLook 原生缩略图 + 通用快速路径兜底，返回 BGR ndarray。
 
         三级降级链（与 inference_onnx.py 的 _DummyIqaSession 兜底模式一致）：
         1. WebP → QuickLook（系统缓存，29ms 固定；OpenCV/ImageIO 对 WebP 需 449ms）
         2. JPEG/PNG → ImageIO（EXIF 内嵌缩略图 + 下采样，比 OpenCV 快 1.5-2x）
-        3. 兜底 → OpenCV imread + resize（保证非 PyObjC 环境可用）
-
-        返回 BMP 编码字节，调用方用 np.frombuffer → cv2.imdecode 解码。
+        3. 兜底 → _fast_thumbnail_bgr（内嵌缩略图 / DCT 缩放解码，Linux 的主路径）
         """
         max_px = max(width, height)
+        if is_raw(file_path):
+            # RAW 直接取内嵌预览，不交给 ImageIO（可能走完整的 RAW 解码）
+            return _raw_thumbnail_bgr(file_path, max_px)
         ext = os.path.splitext(file_path)[1].lower()
 
         # --- 1. WebP 优先 QuickLook（OpenCV/ImageIO 的 WebP 解码器慢 15x）---
@@ -326,8 +449,7 @@ else:
                     if cg is None:
                         raise RuntimeError(f"QuickLook CGImage None: {file_path}")
                     img = _cgimage_to_bgr(cg)
-                # BMP 编码在 autorelease_pool 外执行（不涉及 Objective-C 对象）
-                return _bgr_to_bmp_bytes(img)
+                return img
             except Exception:
                 pass  # 降级到 ImageIO
 
@@ -352,20 +474,39 @@ else:
                     if cg is None:
                         raise RuntimeError(f"CGImageSourceCreateThumbnailAtIndex failed: {file_path}")
                     img = _cgimage_to_bgr(cg)
-                return _bgr_to_bmp_bytes(img)
+                return img
             except Exception:
-                pass  # 降级到 OpenCV
+                pass  # 降级到通用快速路径
 
-        # --- 3. 兜底：OpenCV imread + resize ---
+        # --- 3. 兜底：内嵌缩略图 / DCT 缩放解码 ---
         # 按 max_px 等比缩放（与 ImageIO/QuickLook 保持宽高比的行为一致，
         # 而非旧代码的 cv2.resize(img, (width, height)) 强制拉伸）
-        img = _cv_imread(file_path)
-        h, w = img.shape[:2]
-        scale = min(1.0, float(max_px) / float(max(h, w)))
-        if scale < 1.0:
-            img = cv2.resize(img, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
-                             interpolation=cv2.INTER_AREA)
-        return _bgr_to_bmp_bytes(img)
+        return _fast_thumbnail_bgr(file_path, max_px)
+
+    def get_thumbnail(file_path, width, height):
+        """返回 BMP 编码字节（与 Windows 版契约一致），调用方用 np.frombuffer → cv2.imdecode 解码。"""
+        return _bgr_to_bmp_bytes(get_thumbnail_bgr(file_path, width, height))
+
+
+def thumbnail_cascade(
+    file_path: str,
+    sizes: Sequence[Tuple[int, int]],
+    pyramid: Optional[ImagePyramid] = None,
+) -> List[np.ndarray]:
+    """
+    一次解码得到多个尺寸的缩略图，顺序与 sizes 一致。
+
+    只按最大尺寸调用一次 get_thumbnail_bgr（内嵌缩略图 / DCT 缩放解码 / 系统缩略图），
+    其余尺寸由 ImagePyramid 从大到小逐级缩小：每一级都从上一级（而不是原图）INTER_AREA 缩放，
+    三个尺寸的开销基本等于最大那一个。传入 pyramid（融合分析已完整解码）时直接在它上面取层级。
+    """
+    long_sides = [max(w, h) for w, h in sizes]
+    if pyramid is None:
+        largest = max(range(len(sizes)), key=lambda i: long_sides[i])
+        pyramid = ImagePyramid(get_thumbnail_bgr(file_path, *sizes[largest]))
+    for long_side in sorted(set(long_sides), reverse=True):
+        pyramid.level(long_side)
+    return [pyramid.level(long_side) for long_side in long_sides]
 
 
 def generate_thumbnails(
@@ -374,9 +515,20 @@ def generate_thumbnails(
     width: int,
     height: int,
     update_progress_fn,
+    cancel_event: Optional[threading.Event] = None,
+    sizes: Optional[Sequence[Tuple[int, int]]] = None,
+    analyzer: Optional[ImportAnalyzer] = None,
 ) -> None:
     """
-    生成给定文件列表的缩略图并保存为 WEBP，同时根据 EXIF 修改文件时间。
+    生成给定文件列表的缩略图并保存为 WEBP。
+
+    缩略图目录下的清单（utils/thumb_manifest.py）记录每张缩略图的来源与参数；
+    源文件大小 / mtime、请求尺寸、THUMBNAIL_VERSION 均未变化且缩略图仍在时跳过，只需 stat 源文件。
+    THUMB_STORE 为 "pack" 时写入单文件打包存储（utils/thumb_pack.py），清单以 pack_key 为键。
+    sizes 给出额外尺寸时每张图只解码一次，逐级缩小出全部尺寸（见 thumbnail_cascade）；
+    width x height 仍是主尺寸（{crc32}.webp），其他尺寸存为 {crc32}_{w}x{h}.webp，任一尺寸过期则整张重新生成。
+    传入 analyzer（utils/import_analysis.py）时，照片库中缺少特征的照片改为完整解码一次，
+    同时算出检测流程需要的特征并写入照片库，缩略图由同一金字塔得到。
 
     :param file_paths: 需要处理的图片绝对路径列表
     :param thumbs_path: 缩略图输出目录
@@ -384,30 +536,76 @@ def generate_thumbnails(
     :param height: 缩略图高度
     :param update_progress_fn: 用于更新进度的回调函数，
                                形如 update_progress_fn(message, worker_id, value, total)
+    :param cancel_event: 置位后尚未开始的图片直接跳过（已生成的照常登记到清单）
+    :param sizes: 额外的 (宽, 高) 列表，可以包含主尺寸（去重）
+    :param analyzer: 可选的融合分析器，调用方负责 close()
     """
     os.makedirs(thumbs_path, exist_ok=True)
 
-    # 过滤出真实存在、扩展名合法的文件
+    # 过滤出真实存在、扩展名合法的文件；stat 结果同时用于新鲜度判断
     image_files: List[str] = []
+    stats: Dict[str, os.stat_result] = {}
     for p in file_paths:
         if not isinstance(p, str):
             continue
         abs_path = p
         if not os.path.isabs(abs_path):
             abs_path = os.path.abspath(abs_path)
-        if not os.path.isfile(abs_path):
+        if not abs_path.lower().endswith(IMAGE_EXTENSIONS):
             continue
-        if not abs_path.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            continue
+        if not stat.S_ISREG(st.st_mode):
             continue
         image_files.append(abs_path)
+        stats[abs_path] = st
 
     if not image_files:
         print("No valid image files to process.")
         return
 
-    completed_count = 0
-    count_lock = threading.Lock()
+    manifest = ThumbManifest(thumbs_path)
+    known = manifest.load()
+    pack = open_pack(thumbs_path) if THUMB_STORE == "pack" else None
+    # 打包模式下"缩略图仍在"指索引里有这条记录
+    existing = pack.keys() if pack is not None else manifest.existing_files()
+
+    # 主尺寸在前；None 表示主尺寸的文件名 / 索引键不带尺寸后缀
+    targets: List[Tuple[int, int]] = [(width, height)]
+    for size in sizes or ():
+        size = (int(size[0]), int(size[1]))
+        if size not in targets:
+            targets.append(size)
+    name_sizes: List[Optional[Tuple[int, int]]] = [None] + targets[1:]
+
+    def entry_name(image_file: str, size: Optional[Tuple[int, int]]) -> str:
+        return pack_key(image_file, size) if pack is not None else thumbnail_name(image_file, size)
+
+    def wanted_entry(image_file: str, size: Tuple[int, int]) -> ThumbEntry:
+        st = stats[image_file]
+        return ThumbEntry(image_file, st.st_size, st.st_mtime_ns, size[0], size[1], THUMBNAIL_VERSION)
+
+    def is_fresh(image_file: str) -> bool:
+        for size, name_size in zip(targets, name_sizes):
+            name = entry_name(image_file, name_size)
+            if name not in existing or known.get(name) != wanted_entry(image_file, size):
+                return False
+        return True
+
+    stale_files = [f for f in image_files if not is_fresh(f)]
+    # 缩略图已新鲜、但照片库缺特征的照片也要经过融合分析（否则之后检测时仍要解码）
+    if analyzer is not None:
+        stale_set = set(stale_files)
+        stale_files += [f for f in image_files if f not in stale_set and analyzer.wants(f)]
     total_files = len(image_files)
+    print(f"[THUMBS] {total_files - len(stale_files)}/{total_files} up to date, {len(stale_files)} to generate")
+
+    # 跳过的文件直接计入完成数
+    completed_count = total_files - len(stale_files)
+    count_lock = threading.Lock()
+    generated: List[Tuple[str, ThumbEntry]] = []
 
     update_progress_fn(
         "缩略图生成中",
@@ -416,34 +614,46 @@ def generate_thumbnails(
     def process_image(image_file: str) -> None:
         """
         单张图片的处理逻辑：
-        1. 调用 get_thumbnail 生成缩略图
+        1. 调用 thumbnail_cascade 一次解码生成全部尺寸
         2. 以归一化路径的 CRC32 命名 .webp 文件
-        3. 根据 EXIF 拍摄时间设置缩略图文件的 mtime/atime
-        4. 通过 update_progress_fn 上报进度
+        3. 登记到清单，通过 update_progress_fn 上报进度
         """
         nonlocal completed_count
 
-        # 生成缩略图（BMP 数据）
-        bmp_data = get_thumbnail(image_file, width, height)
-
-        # 使用 OpenCV 处理 BMP 数据
-        img_array = np.frombuffer(bmp_data, dtype=np.uint8)
-        image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-
-        if image is None:
-            raise RuntimeError(f"Failed to decode thumbnail for {image_file}")
+        if cancel_event is not None and cancel_event.is_set():
+            return
 
-        # 使用归一化路径 (lower + '/') 生成 CRC32 作为文件名
-        normalized_path = image_file.replace("\\", "/").lower()
-        crc32_hash = zlib.crc32(normalized_path.encode("utf-8"))
-        crc32_hex = f"{crc32_hash:08x}"
-        output_file = os.path.join(thumbs_path, f"{crc32_hex}.webp")
-
-        # 保存为 WEBP（使用支持中文路径的函数）
-        cv_imwrite(output_file, image)
+        entries: List[Tuple[str, ThumbEntry]] = []
+        try:
+            # 生成缩略图（直接拿像素，不经过 BMP 编码 / 解码）
+            full_decode = analyzer is not None and analyzer.wants(image_file)
+            # 解码占用计入共享内存预算，超大图片排队，不与其他大图同时解码
+            with admit_decode(image_file, None if full_decode else max(max(size) for size in targets)):
+                pyramid = None
+                if full_decode:
+                    pyramid = analyzer.decode(image_file)
+                    analyzer.analyze(image_file, pyramid)
+                images = thumbnail_cascade(image_file, targets, pyramid)
+                if pyramid is not None:
+                    pyramid.release_full(THUMBS_STAGE)
+            for image, size, name_size in zip(images, targets, name_sizes):
+                name = entry_name(image_file, name_size)
+                # 主尺寸保持原有的无损编码，额外尺寸用有损编码
+                quality = None if name_size is None else PREVIEW_WEBP_QUALITY
+                if pack is not None:
+                    pack.put(image_file, encode_webp(image, quality), name_size)
+                else:
+                    # 保存为 WEBP（使用支持中文路径的函数）
+                    cv_imwrite(os.path.join(thumbs_path, name), image, quality)
+                entries.append((name, wanted_entry(image_file, size)))
+        except Exception as e:
+            # 失败的文件不登记（已写出的尺寸也不登记），下次调用会重试
+            print(f"[THUMBS] failed {image_file}: {e}")
+            entries = []
 
         # 更新进度
         with count_lock:
+            generated.extend(entries)
             completed_count += 1
             try:
                 update_progress_fn(
@@ -456,14 +666,22 @@ def generate_thumbnails(
                 print(f"update_progress_fn error: {e}")
 
     # 使用线程池并行处理图片
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.map(process_image, image_files)
+    try:
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            executor.map(process_image, stale_files)
+    finally:
+        # 先提交打包索引，再登记清单：清单里有的条目在包里一定读得到
+        if pack is not None:
+            pack.flush()
+        manifest.record(generated)
+        manifest.close()
 
     try:
+        # 被取消时 completed_count 小于总数，如实上报
         update_progress_fn(
             "空闲中",
             worker_id=0,
-            value=total_files,
+            value=completed_count,
             total=total_files,
         )
     except Exception as e:
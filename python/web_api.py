@@ -5,20 +5,27 @@ import traceback
 from datetime import datetime
 
 import asyncio
-import io
 import time
 import threading  # 新增：用于后台退出线程
-import numpy as np
-import cv2
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.concurrency import run_in_threadpool
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 
-from utils.image_compute import process_and_group_images  # 使用 ONNX 版本的图像处理函数
-from utils.thumbnails import generate_thumbnails, get_thumbnail
+from utils.exposure import refresh_exposure_metrics
+from utils.image_compute import process_and_group_images, raw_display_jpeg  # 使用 ONNX 版本的图像处理函数
+from utils.inference_onnx import get_model_status, warmup_models
+from utils.metadata import extract_library_metadata
+from utils.phash import DUPLICATE_MAX_DISTANCE, find_duplicate_clusters
+from utils.ranking import DEFAULT_TOP_K, rank_library, refresh_face_summary
+from utils.raw import IMAGE_EXTENSIONS, is_raw
+from utils.thumb_jobs import ThumbnailJobManager
+from utils.thumb_pack import has_pack, open_pack
+from utils.thumb_cache import cache_stats as thumbnail_cache_stats_fn
+from utils.thumb_cache import etag_matches, iter_thumbnail_batch, note_not_modified, serve_thumbnail, thumbnail_etag
 
 # ============================
 # 环境检测 & 日志基础设施
@@ -146,7 +153,29 @@ class TaskManager:
                 global_state["task_queue_length"] = 0
 
 
-app = FastAPI()
+# 启动后是否在后台预热模型（设为 "0" 关闭，回到纯懒加载行为，便于低内存机器或调试）
+ENABLE_MODEL_WARMUP = os.environ.get("MEDIA_TOOLBOX_WARMUP", "1") != "0"
+
+
+def _warmup_models_in_background() -> None:
+    """后台线程入口：预热失败只记日志，检测任务仍会走懒加载。"""
+    try:
+        warmup_models()
+        _log(f"[warmup] 模型预热结束: {get_model_status()}")
+    except Exception as e:
+        _log(f"[warmup] 模型预热异常: {e}")
+        _log(traceback.format_exc())
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # uvicorn 完成启动后才进入这里；放到守护线程中执行，不阻塞端口监听与 /status 响应
+    if ENABLE_MODEL_WARMUP:
+        threading.Thread(target=_warmup_models_in_background, name="model-warmup", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 task_manager = TaskManager()
 
 # 正确设置允许的 CORS 来源
@@ -159,6 +188,44 @@ app.add_middleware(
 )
 
 
+_TRUE_STRINGS = frozenset(("true", "1", "yes", "on"))
+_FALSE_STRINGS = frozenset(("false", "0", "no", "off"))
+
+
+def _parse_bool(data: dict, key: str, default: bool) -> bool:
+    """
+    读取请求体中的布尔开关：JSON 布尔值直接使用，字符串按 true/false 等显式解析，缺省或 null 取 default。
+
+    不用 bool(...)：bool("false") 为 True，会把客户端明确关闭的开关当成打开。其他取值返回 400。
+    """
+    value = data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in _TRUE_STRINGS:
+            return True
+        if text in _FALSE_STRINGS:
+            return False
+    raise HTTPException(status_code=400, detail=f"{key} must be a boolean, got {value!r}")
+
+
+def _parse_dimension(data: dict, key: str, default: int, maximum: int = 4096) -> int:
+    """读取请求体中的缩略图宽 / 高：必须是 1..maximum 的整数，否则返回 400（而不是 500 或生成出错的流）。"""
+    value = data.get(key, default)
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        dimension = int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{key} must be an integer, got {value!r}")
+    if not 0 < dimension <= maximum:
+        raise HTTPException(status_code=400, detail=f"{key} must be in 1..{maximum}, got {dimension}")
+    return dimension
+
+
 def update_progress(status_text, worker_id=None, value=None, total=None):
     global global_state
     global_state["status"] = status_text
@@ -173,6 +240,10 @@ def update_progress(status_text, worker_id=None, value=None, total=None):
     _log(f"[Progress] {global_state}")
 
 
+# 缩略图后台任务（专用线程，按优先级执行；/generate_thumbnails 只负责提交）
+thumbnail_jobs = ThumbnailJobManager(update_progress, _log)
+
+
 def run_process_and_group(task_dict):
     """包装函数，确保参数传递正确"""
     _log(f"DEBUG: run_process_and_group received: {type(task_dict)} = {task_dict}")
@@ -183,6 +254,9 @@ def run_process_and_group(task_dict):
         similarity_threshold=task_dict["similarity_threshold"],
         update_progress=update_progress,
         show_disabled_photos=task_dict["show_disabled_photos"],
+        iqa_mode=task_dict.get("iqa_mode"),
+        similarity_window=task_dict.get("similarity_window"),
+        time_gap_seconds=task_dict.get("time_gap_seconds"),
     )
 
 
@@ -195,12 +269,16 @@ class StatusResponse(BaseModel):
     status: str
     workers: list
     task_queue_length: int
+    # 各模型就绪状态：{"iqa": "ready", "face": "loading", ...}
+    models: dict = {}
 
 
 class ThumbnailTask(BaseModel):
     photo_path: str
     height: int = 256
     width: int = 256
+    # 预生成缩略图所在目录（与 /generate_thumbnails 的 thumbs_path 相同），其中的新鲜缩略图直接返回
+    thumbs_path: str = "../.cache/.thumbs"
 
 
 class DetectionTask(BaseModel):
@@ -233,8 +311,10 @@ async def generate_thumbnails_endpoint(request: Request):
          "width": 128,
          "height": 128
        }
-       此时后端会在 folder_path 下扫描 .jpg/.jpeg/.png/.webp 文件，
+       此时后端会在 folder_path 下扫描 .jpg/.jpeg/.png/.webp 与 RAW（utils/raw.RAW_EXTENSIONS）文件，
        将其转换为 file_paths 列表后再统一处理。
+
+    可选字段 priority / supersede / sizes / analysis 见下方；立即返回 job_id，进度经 /status 与 /thumbnail_jobs/{job_id} 查询。
     """
     data = await request.json()
     _log(f"[generate_thumbnails] 请求数据: {data}")
@@ -249,7 +329,7 @@ async def generate_thumbnails_endpoint(request: Request):
         folder_path = data.get("folder_path")
         if folder_path and os.path.isdir(folder_path):
             # 从目录中收集所有图片文件
-            candidates = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))]
+            candidates = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith(IMAGE_EXTENSIONS)]
             file_paths = candidates
 
     # 如果依旧没有可用文件，直接返回提示信息
@@ -257,43 +337,162 @@ async def generate_thumbnails_endpoint(request: Request):
         _log("[generate_thumbnails] No image files found in the request.")
         return {"message": "未发现可处理的图片文件"}
 
-    # 调用实际执行函数（同步执行，内部使用线程池）
-    generate_thumbnails(file_paths, thumbs_path, width, height, update_progress)
-    return {"message": "缩略图生成任务已添加到后台"}
+    # 可选：priority 越大越先执行；supersede（默认 true）取消所有未完成的缩略图任务，新导入优先
+    try:
+        priority = int(data.get("priority", 0))
+    except (TypeError, ValueError):
+        priority = 0
+    supersede = _parse_bool(data, "supersede", True)
+
+    # 可选：sizes = [[宽, 高], ...]，额外尺寸与主尺寸共用一次解码（如网格 128 + 预览 512 + 大图 1600）
+    sizes = []
+    for size in data.get("sizes") or []:
+        try:
+            sizes.append((int(size[0]), int(size[1])))
+        except (TypeError, ValueError, IndexError):
+            raise HTTPException(status_code=400, detail=f"invalid size: {size!r}")
+
+    # 可选：analysis = {"db_path": ..., "faces": false, "iqa": false}，生成缩略图时顺带计算检测所需的特征
+    # 并写入照片库（见 utils/import_analysis.py），之后的 /detect_images 不再为这些照片解码
+    analysis = data.get("analysis") or None
+    if analysis is not None and (not isinstance(analysis, dict) or not analysis.get("db_path")):
+        raise HTTPException(status_code=400, detail="analysis requires db_path")
+
+    # 提交到后台线程后立即返回，不阻塞事件循环（/status、/get_thumbnail 照常响应）
+    job = thumbnail_jobs.submit(file_paths, thumbs_path, width, height, priority, supersede, sizes, analysis)
+    _log(f"[generate_thumbnails] job {job.job_id}: {job.total} files, priority={priority}, supersede={supersede}")
+    return {"message": "缩略图生成任务已添加到后台", "job_id": job.job_id}
+
+
+@app.get("/thumbnail_jobs")
+def list_thumbnail_jobs():
+    return {"jobs": thumbnail_jobs.list()}
+
+
+@app.get("/thumbnail_jobs/{job_id}")
+def get_thumbnail_job(job_id: str):
+    job = thumbnail_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown job: {job_id}")
+    return job
+
+
+@app.post("/thumbnail_jobs/{job_id}/cancel")
+def cancel_thumbnail_job(job_id: str):
+    cancelled = thumbnail_jobs.cancel(job_id)
+    _log(f"[thumbnail_jobs] cancel {job_id}: {cancelled}")
+    return {"job_id": job_id, "cancelled": cancelled}
 
 
 @app.get("/get_thumbnail")
-def get_thumbnail_endpoint(task: ThumbnailTask):
+def get_thumbnail_endpoint(request: Request, task: ThumbnailTask = Depends()):
+    """
+    返回单张缩略图（WebP）。参数走 query string，浏览器 / <img> 可以直接请求并按 ETag 协商缓存。
+
+    If-None-Match 与当前 ETag（由源文件 stat 推出）一致时直接回 304，不读图片；
+    否则依次查内存 LRU、缩略图目录中的预生成文件，最后才生成（见 utils/thumb_cache.py）。
+    """
     start_time = time.time()
-    _log(f"[get_thumbnail] 请求: {task}")
+    try:
+        etag = thumbnail_etag(task.photo_path, task.width, task.height)
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"file not found: {task.photo_path}")
 
-    img_bytes = get_thumbnail(task.photo_path, task.width, task.height)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        note_not_modified()
+        return Response(status_code=304, headers=headers)
 
-    # Convert BMP bytes to numpy array and decode using OpenCV
-    img_array = np.frombuffer(img_bytes, dtype=np.uint8)
-    image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    etag, data = serve_thumbnail(task.photo_path, task.width, task.height, task.thumbs_path)
+    headers["ETag"] = etag
 
-    if image is None:
-        raise RuntimeError(f"Failed to decode thumbnail for {task.photo_path}")
+    total_time = time.time() - start_time
+    _log(f"[get_thumbnail] {task.photo_path} ({task.width}x{task.height}) {total_time * 1000:.1f} ms")
 
-    # Encode to WEBP format
-    success, buffer = cv2.imencode(".webp", image)
-    if not success:
-        raise RuntimeError("Failed to encode image to WEBP format")
+    return Response(content=data, media_type="image/webp", headers=headers)
 
-    webp_io = io.BytesIO(buffer)
-    webp_io.seek(0)
 
-    total_time = time.time() - start_time
-    _log(f"[get_thumbnail] Total Time: {total_time:.2f} seconds")
+# 单次批量请求的照片数上限：前端按可视区域分批请求，远超此数基本是误用，且会长时间占住生成线程池
+THUMBNAIL_BATCH_MAX: int = 1000
+
 
-    return StreamingResponse(webp_io, media_type="image/webp")
+@app.post("/get_thumbnails_batch")
+async def get_thumbnails_batch(request: Request):
+    """
+    一次请求取多张缩略图，返回单个二进制流（application/octet-stream），每张一帧、按完成顺序流式输出：
+
+        uint32 下标（对应 photo_paths 中的位置） | uint8 状态（0 成功 / 1 失败） | uint32 长度 | 负载
+
+    全部为小端；成功时负载是 WebP 字节，失败时是 UTF-8 错误信息。并行生成，与 /get_thumbnail 共享缓存。
+    """
+    data = await request.json()
+    photo_paths = data.get("photo_paths") or []
+    if not isinstance(photo_paths, list):
+        raise HTTPException(status_code=400, detail="photo_paths must be a list")
+    if len(photo_paths) > THUMBNAIL_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"too many photo_paths: {len(photo_paths)} > {THUMBNAIL_BATCH_MAX}")
+    photo_paths = [str(p) for p in photo_paths]
+    width = _parse_dimension(data, "width", 256)
+    height = _parse_dimension(data, "height", 256)
+    thumbs_path = data.get("thumbs_path", "../.cache/.thumbs")
+
+    _log(f"[get_thumbnails_batch] {len(photo_paths)} photos ({width}x{height})")
+    return StreamingResponse(
+        iter_thumbnail_batch(photo_paths, width, height, thumbs_path),
+        media_type="application/octet-stream",
+        headers={"X-Thumbnail-Count": str(len(photo_paths))},
+    )
+
+
+@app.get("/raw_preview")
+def raw_preview(photo_path: str):
+    """RAW 文件内嵌的 JPEG 预览（前端大图查看用，浏览器无法直接显示 RAW）；不去马赛克。"""
+    if not is_raw(photo_path):
+        raise HTTPException(status_code=400, detail="not a RAW file")
+    if not os.path.isfile(photo_path):
+        raise HTTPException(status_code=404, detail="photo not found")
+    try:
+        data = raw_display_jpeg(photo_path)
+    except RuntimeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    return Response(content=data, media_type="image/jpeg")
+
+
+@app.get("/thumbnail_cache_stats")
+def thumbnail_cache_stats():
+    return thumbnail_cache_stats_fn()
+
+
+@app.post("/thumb_pack/compact")
+async def compact_thumb_pack(request: Request):
+    """重写 thumbs.pack，回收重新生成缩略图后留下的旧数据（MEDIA_TOOLBOX_THUMB_STORE=pack 时使用）。"""
+    data = await request.json()
+    thumbs_path = data.get("thumbs_path", "../.cache/.thumbs")
+    if not has_pack(thumbs_path):
+        raise HTTPException(status_code=404, detail="thumbnail pack not found")
+    pack = open_pack(thumbs_path)
+    reclaimed = await run_in_threadpool(pack.compact)
+    _log(f"[thumb_pack] compact {thumbs_path}: reclaimed {reclaimed} bytes")
+    return {"reclaimed_bytes": reclaimed, **pack.stats()}
+
+
+@app.post("/thumb_pack/export")
+async def export_thumb_pack(request: Request):
+    """把 thumbs.pack 导出为 dest_dir/{crc32}.webp 单文件（默认导出到缩略图目录本身）。"""
+    data = await request.json()
+    thumbs_path = data.get("thumbs_path", "../.cache/.thumbs")
+    dest_dir = data.get("dest_dir") or thumbs_path
+    if not has_pack(thumbs_path):
+        raise HTTPException(status_code=404, detail="thumbnail pack not found")
+    exported = await run_in_threadpool(open_pack(thumbs_path).export, dest_dir)
+    _log(f"[thumb_pack] export {thumbs_path} -> {dest_dir}: {exported} files")
+    return {"exported": exported, "dest_dir": dest_dir}
 
 
 @app.get("/status", response_model=StatusResponse)
 def get_status():
     _log(f"[status] {global_state}")
-    return global_state
+    return {**global_state, "models": get_model_status()}
 
 
 @app.post("/detect_images")
@@ -308,19 +507,124 @@ async def detect_images(request: Request):
 
     similarity_threshold = data.get("similarity_threshold", 0.8)
     show_disabled_photos = data.get("show_disabled_photos", False)
-
-    _log(f"[detect_images] 处理后参数: db_path={db_path}, threshold={similarity_threshold}, show_disabled={show_disabled_photos}")
+    # 可选："full" / "tiered"，缺省时使用 MEDIA_TOOLBOX_IQA_MODE
+    iqa_mode = data.get("iqa_mode")
+    # 可选：与前 k 张比较的窗口大小，缺省时使用 MEDIA_TOOLBOX_SIMILARITY_WINDOW
+    similarity_window = data.get("similarity_window")
+    # 可选：拍摄时间间隔门限（秒），超过即直接分组，缺省时使用 MEDIA_TOOLBOX_GROUP_TIME_GAP
+    time_gap_seconds = data.get("time_gap_seconds")
+
+    _log(
+        f"[detect_images] 处理后参数: db_path={db_path}, threshold={similarity_threshold}, "
+        f"show_disabled={show_disabled_photos}, iqa_mode={iqa_mode}, window={similarity_window}, "
+        f"time_gap={time_gap_seconds}"
+    )
 
     detection_task = {
         "description": f"图像检测 (阈值: {similarity_threshold})",
         "db_path": db_path,
         "similarity_threshold": similarity_threshold,
         "show_disabled_photos": show_disabled_photos,
+        "iqa_mode": iqa_mode,
+        "similarity_window": similarity_window,
+        "time_gap_seconds": time_gap_seconds,
     }
     await task_manager.add_task(detection_task)
     return {"message": "检测任务已添加到队列"}
 
 
+@app.post("/exposure_metrics")
+async def exposure_metrics(request: Request):
+    """由已缓存的直方图整库刷新曝光指标列（不读取图片，10 万张也是毫秒到秒级）。"""
+    data = await request.json()
+    db_path = data.get("db_path")
+    if not isinstance(db_path, str) or db_path == "{}" or not db_path:
+        db_path = "../.cache/photos.db"
+
+    updated = await run_in_threadpool(refresh_exposure_metrics, db_path)
+    _log(f"[exposure_metrics] db_path={db_path}, updated={updated}")
+    return {"updated": updated}
+
+
+@app.post("/extract_metadata")
+async def extract_metadata(request: Request):
+    """
+    为照片库中尚未提取元数据的照片读取文件头（尺寸、方向、拍摄时间、相机 / 镜头、内嵌缩略图位置）并批量写回。
+
+    只读文件头、不解码像素；可选 file_paths 限定范围（如刚导入的一批）。
+    """
+    data = await request.json()
+    db_path = data.get("db_path")
+    if not isinstance(db_path, str) or db_path == "{}" or not db_path:
+        db_path = "../.cache/photos.db"
+    file_paths = data.get("file_paths")
+    if file_paths is not None and not isinstance(file_paths, list):
+        raise HTTPException(status_code=400, detail="file_paths must be a list")
+
+    metadata = await run_in_threadpool(extract_library_metadata, db_path, file_paths)
+    _log(f"[extract_metadata] db_path={db_path}, extracted={len(metadata)}")
+    return {"extracted": len(metadata)}
+
+
+@app.post("/duplicate_clusters")
+async def duplicate_clusters(request: Request):
+    """整库近重复聚类：基于检测阶段写入的 dHash，返回成员数 >= 2 的簇（filePath 列表）。"""
+    data = await request.json()
+    db_path = data.get("db_path")
+    if not isinstance(db_path, str) or db_path == "{}" or not db_path:
+        db_path = "../.cache/photos.db"
+
+    try:
+        max_distance = int(data.get("max_distance", DUPLICATE_MAX_DISTANCE))
+    except (TypeError, ValueError):
+        max_distance = DUPLICATE_MAX_DISTANCE
+    # 分段数 = max_distance + 1，距离过大时 LSH 退化为全量比较，这里限制在 [0, 16]
+    max_distance = min(max(max_distance, 0), 16)
+    include_disabled = _parse_bool(data, "include_disabled", True)
+
+    clusters = await run_in_threadpool(find_duplicate_clusters, db_path, max_distance, include_disabled)
+    _log(f"[duplicate_clusters] db_path={db_path}, max_distance={max_distance}, clusters={len(clusters)}")
+    return {"max_distance": max_distance, "clusters": clusters}
+
+
+def _rank_with_backfill(db_path: str, weights, eye_mode: str, top_k: int, persist: bool):
+    # 旧库只有 faceData 没有汇总列：先补齐（只处理汇总为空的行，之后调用不再解析 JSON）
+    refresh_face_summary(db_path)
+    return rank_library(db_path, weights, eye_mode, top_k, persist)
+
+
+@app.post("/rank")
+async def rank(request: Request):
+    """
+    按给定权重对整库已分组照片重新排序，返回每组前 top_k 名并写回 rankScore / groupRank。
+
+    只读数据库中已有的指标列，不做任何推理，前端拖动权重时可直接反复调用。
+    """
+    data = await request.json()
+    db_path = data.get("db_path")
+    if not isinstance(db_path, str) or db_path == "{}" or not db_path:
+        db_path = "../.cache/photos.db"
+
+    weights = data.get("weights")
+    if not isinstance(weights, dict):
+        weights = None
+    eye_mode = str(data.get("eye_mode", "min"))
+    try:
+        top_k = int(data.get("top_k", DEFAULT_TOP_K))
+    except (TypeError, ValueError):
+        top_k = DEFAULT_TOP_K
+    persist = _parse_bool(data, "persist", True)
+
+    top = await run_in_threadpool(_rank_with_backfill, db_path, weights, eye_mode, top_k, persist)
+    _log(f"[rank] db_path={db_path}, weights={weights}, eye_mode={eye_mode}, top_k={top_k}, groups={len(top)}")
+    return {
+        "groups": [
+            {"groupId": gid, "photos": [{"filePath": path, "score": score} for path, score in ranked]}
+            for gid, ranked in top.items()
+        ]
+    }
+
+
 # ============================
 # 新增：后端自杀接口（给 Electron 调用）
 # ============================
@@ -0,0 +1,108 @@
+"""
+IQA 前处理的内存 / 耗时对比：原实现（每次新建 RGB 副本、float32 中间数组与转置副本） vs 线程 arena 复用缓冲区。
+
+用法（在仓库根目录）：
+    python scripts/bench_preprocess.py [--calls 5] [--sizes 6000x4000,1200x900]
+
+每个尺寸先各调用一次预热（arena 首次分配缓冲区），再用 tracemalloc 统计之后 --calls 次调用的峰值新增分配。
+numpy 的数组内存经 tracemalloc 跟踪，arena 稳态下应接近 0。
+输出差异分两个分支报告：synthetic 分支应只有 float32 舍入误差；authentic 分支自金字塔接入后
+从层级而不是原图缩放到 384，会有少量像素级差异。
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Tuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+
+from utils.inference_onnx import (  # noqa: E402
+    _IMAGENET_MEAN,
+    _IMAGENET_STD,
+    preprocess_iqa_from_bgr,
+    preprocess_iqa_from_pyramid,
+)
+from utils.pyramid import ImagePyramid  # noqa: E402
+
+
+def baseline_preprocess(img_bgr: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """改造前的 preprocess_iqa_from_bgr（逐字保留，作为对照）。"""
+    working = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    authentic = cv2.resize(working, (384, 384), interpolation=cv2.INTER_AREA)
+
+    h, w, _ = working.shape
+    crop_size = 1280
+    if h < crop_size or w < crop_size:
+        scale = crop_size / min(h, w)
+        new_w = int(round(w * scale))
+        new_h = int(round(h * scale))
+        resized = cv2.resize(working, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        h, w, _ = resized.shape
+        y0 = max((h - crop_size) // 2, 0)
+        x0 = max((w - crop_size) // 2, 0)
+        synthetic = resized[y0 : y0 + crop_size, x0 : x0 + crop_size]
+    else:
+        y0 = (h - crop_size) // 2
+        x0 = (w - crop_size) // 2
+        synthetic = working[y0 : y0 + crop_size, x0 : x0 + crop_size]
+
+    def _to_nchw_normalized(img: np.ndarray) -> np.ndarray:
+        arr = img.astype(np.float32) / 255.0
+        arr = (arr - _IMAGENET_MEAN) / _IMAGENET_STD
+        arr = np.transpose(arr, (2, 0, 1))
+        return arr[None, :, :, :].astype(np.float32)
+
+    return _to_nchw_normalized(authentic), _to_nchw_normalized(synthetic)
+
+
+def measure(fn: Callable[[], object], calls: int) -> Tuple[float, float]:
+    """预热一次后，返回 (calls 次调用的 tracemalloc 峰值 MB, 平均毫秒)。"""
+    fn()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    elapsed = (time.perf_counter() - start) / calls
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak - base) / (1024 * 1024), elapsed * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--sizes", default="6000x4000,1200x900", help="逗号分隔的 宽x高")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for spec in args.sizes.split(","):
+        width, height = (int(v) for v in spec.lower().split("x"))
+        img = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        # 检测流程里金字塔由各阶段共享，arena 的稳态只看前处理本身
+        pyramid = ImagePyramid(img)
+
+        before_mb, before_ms = measure(lambda: baseline_preprocess(img), args.calls)
+        after_mb, after_ms = measure(lambda: preprocess_iqa_from_pyramid(pyramid), args.calls)
+        api_mb, api_ms = measure(lambda: preprocess_iqa_from_bgr(img), args.calls)
+
+        old = baseline_preprocess(img)
+        new = preprocess_iqa_from_bgr(img)
+        authentic_diff, synthetic_diff = (float(np.abs(a - b).max()) for a, b in zip(old, new))
+        print(
+            f"{width}x{height}: before peak {before_mb:6.1f} MB, {before_ms:6.1f} ms/call; "
+            f"after (shared pyramid) {after_mb:6.1f} MB, {after_ms:6.1f} ms/call; "
+            f"preprocess_iqa_from_bgr {api_mb:6.1f} MB, {api_ms:6.1f} ms/call; "
+            f"max |diff| authentic {authentic_diff:.1e}, synthetic {synthetic_diff:.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
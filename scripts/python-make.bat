@@ -54,6 +54,10 @@ set "OUTPUT_DIR=out"
 REM ONNX 模型文件（.onnx + .onnx.data，放在 python/checkpoint 下）
 set "MODEL_DIR=checkpoint"
 
+REM 可选：python -m utils.quantize 生成的 INT8 模型（目录存在才打包，运行时由 MEDIA_TOOLBOX_MODEL_PRECISION=int8 选用）
+REM 注意：此处相对路径以 python 目录为准，判断放在 cd 之后执行
+set "INT8_ARG="
+
 REM 并行 C 编译 job 数
 set "JOBS=%NUMBER_OF_PROCESSORS%"
 
@@ -86,6 +90,8 @@ REM ============================
 echo [*] 切换到 python 目录（scripts 的上一级）...
 cd /d "%~dp0..\python"
 
+if exist "%MODEL_DIR%\int8" set "INT8_ARG=--include-data-dir=%MODEL_DIR%\int8=%MODEL_DIR%\int8"
+
 echo [*] 使用 Nuitka 编译 %MAIN_FILE% 为单文件 exe (--mode=onefile) ...
 
 "%PYTHON_EXE%" -m nuitka ^
@@ -101,6 +107,7 @@ echo [*] 使用 Nuitka 编译 %MAIN_FILE% 为单文件 exe (--mode=onefile) ...
   --include-data-file="%MODEL_DIR%\2d106det_batch.onnx=%MODEL_DIR%\2d106det_batch.onnx" ^
   --include-data-file="%MODEL_DIR%\det_10g.onnx=%MODEL_DIR%\det_10g.onnx" ^
   --include-data-file="%MODEL_DIR%\ocec_l.onnx=%MODEL_DIR%\ocec_l.onnx" ^
+  %INT8_ARG% ^
   --noinclude-dlls=opencv_videoio_ffmpeg*.dll ^
   --nofollow-import-to=websockets ^
   --nofollow-import-to=httptools ^
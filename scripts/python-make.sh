@@ -52,6 +52,12 @@ OUTPUT_DIR="out"
 MODEL_DIR="checkpoint"
 JOBS="$(sysctl -n hw.ncpu 2>/dev/null || echo 4)"
 
+# 可选：python -m utils.quantize 生成的 INT8 模型（目录存在才打包，运行时由 MEDIA_TOOLBOX_MODEL_PRECISION=int8 选用）
+INT8_ARGS=()
+if [ -d "${PYTHON_DIR}/${MODEL_DIR}/int8" ]; then
+  INT8_ARGS+=(--include-data-dir="${MODEL_DIR}/int8=${MODEL_DIR}/int8")
+fi
+
 # Nuitka 缓存目录：与 Windows 版保持一致的相对路径
 export NUITKA_CACHE_DIR="${NUITKA_CACHE_DIR:-${PYTHON_DIR}/.nuitka-cache}"
 
@@ -83,6 +89,7 @@ echo "[*] 使用 Nuitka 编译 ${MAIN_FILE} 为 app bundle（standalone + .app 
   --include-data-file="${MODEL_DIR}/2d106det_batch.onnx=${MODEL_DIR}/2d106det_batch.onnx" \
   --include-data-file="${MODEL_DIR}/det_10g.onnx=${MODEL_DIR}/det_10g.onnx" \
   --include-data-file="${MODEL_DIR}/ocec_l.onnx=${MODEL_DIR}/ocec_l.onnx" \
+  ${INT8_ARGS[@]+"${INT8_ARGS[@]}"} \
   --nofollow-import-to=websockets \
   --nofollow-import-to=httptools \
   --nofollow-import-to=yaml \
@@ -54,6 +54,28 @@ export const initializeDatabase = () => {
       "histS BLOB",
       "histV BLOB",
       "faceData TEXT",
+      "sharpness REAL",
+      "clipHighlights REAL",
+      "clipShadows REAL",
+      "meanBrightness REAL",
+      "saturationSpread REAL",
+      "dHash INTEGER",
+      "duplicateOf TEXT",
+      "captureTime REAL",
+      "imageWidth INTEGER",
+      "imageHeight INTEGER",
+      "orientation INTEGER",
+      "cameraMake TEXT",
+      "cameraModel TEXT",
+      "lensModel TEXT",
+      "thumbOffset INTEGER",
+      "thumbLength INTEGER",
+      "faceCount INTEGER",
+      "eyeOpenMin REAL",
+      "eyeOpenMean REAL",
+      "faceScore REAL",
+      "rankScore REAL",
+      "groupRank INTEGER",
     ];
     for (const table of tables) {
       for (const col of columns) {
@@ -22,6 +22,19 @@ export interface PhotoExtend {
   // Python 端写入的 JSON 串，包含人脸检测结果等扩展信息
   // 例如：{"faces":[{"bbox":[x1,y1,x2,y2],"score":0.9}, ...]}
   faceData?: string;
+  // Python 端由缓存直方图推导的画质 / 曝光指标（可作为排序列）
+  sharpness?: number;
+  clipHighlights?: number;
+  clipShadows?: number;
+  meanBrightness?: number;
+  saturationSpread?: number;
+  // 字节完全相同的重复导入：指向主副本的 filePath，非重复为 null
+  duplicateOf?: string | null;
+  // EXIF 拍摄时间（秒，按 UTC 换算，仅用于比较先后 / 间隔），无 EXIF 时为 null
+  captureTime?: number | null;
+  // Python 端组内综合排序：加权分数与组内名次（0 = 最佳），未分组 / 未启用为 null
+  rankScore?: number | null;
+  groupRank?: number | null;
 }
 
 // 初始化数据库（创建表）
@@ -43,7 +56,29 @@ export function initializeDatabase() {
             histH BLOB,
             histS BLOB,
             histV BLOB,
-            faceData TEXT
+            faceData TEXT,
+            sharpness REAL,
+            clipHighlights REAL,
+            clipShadows REAL,
+            meanBrightness REAL,
+            saturationSpread REAL,
+            dHash INTEGER,
+            duplicateOf TEXT,
+            captureTime REAL,
+            imageWidth INTEGER,
+            imageHeight INTEGER,
+            orientation INTEGER,
+            cameraMake TEXT,
+            cameraModel TEXT,
+            lensModel TEXT,
+            thumbOffset INTEGER,
+            thumbLength INTEGER,
+            faceCount INTEGER,
+            eyeOpenMin REAL,
+            eyeOpenMean REAL,
+            faceScore REAL,
+            rankScore REAL,
+            groupRank INTEGER
         )
     `;
   const sqlPrevious = `
@@ -63,7 +98,29 @@ export function initializeDatabase() {
             histH BLOB,
             histS BLOB,
             histV BLOB,
-            faceData TEXT
+            faceData TEXT,
+            sharpness REAL,
+            clipHighlights REAL,
+            clipShadows REAL,
+            meanBrightness REAL,
+            saturationSpread REAL,
+            dHash INTEGER,
+            duplicateOf TEXT,
+            captureTime REAL,
+            imageWidth INTEGER,
+            imageHeight INTEGER,
+            orientation INTEGER,
+            cameraMake TEXT,
+            cameraModel TEXT,
+            lensModel TEXT,
+            thumbOffset INTEGER,
+            thumbLength INTEGER,
+            faceCount INTEGER,
+            eyeOpenMin REAL,
+            eyeOpenMean REAL,
+            faceScore REAL,
+            rankScore REAL,
+            groupRank INTEGER
         )
     `;
   window.ElectronDB.exec(sqlPresent); // 调用 exec 执行 SQL
@@ -168,7 +225,16 @@ export function getPhotosExtend(): Promise<PhotoExtend[]> {
             similarity,
             IQA,
             isEnabled,
-            faceData
+            faceData,
+            sharpness,
+            clipHighlights,
+            clipShadows,
+            meanBrightness,
+            saturationSpread,
+            duplicateOf,
+            captureTime,
+            rankScore,
+            groupRank
         FROM present
     `;
   return window.ElectronDB.all(sql, []);
@@ -188,7 +254,16 @@ export function getEnabledPhotosExtend(): Promise<PhotoExtend[]> {
             similarity,
             IQA,
             isEnabled,
-            faceData
+            faceData,
+            sharpness,
+            clipHighlights,
+            clipShadows,
+            meanBrightness,
+            saturationSpread,
+            duplicateOf,
+            captureTime,
+            rankScore,
+            groupRank
         FROM present
         WHERE isEnabled = 1
     `;
@@ -217,7 +292,29 @@ export function clearPhotos() {
             histH,
             histS,
             histV,
-            faceData
+            faceData,
+            sharpness,
+            clipHighlights,
+            clipShadows,
+            meanBrightness,
+            saturationSpread,
+            dHash,
+            duplicateOf,
+            captureTime,
+            imageWidth,
+            imageHeight,
+            orientation,
+            cameraMake,
+            cameraModel,
+            lensModel,
+            thumbOffset,
+            thumbLength,
+            faceCount,
+            eyeOpenMin,
+            eyeOpenMean,
+            faceScore,
+            rankScore,
+            groupRank
         )
         SELECT
             fileName,
@@ -234,7 +331,29 @@ export function clearPhotos() {
             histH,
             histS,
             histV,
-            faceData
+            faceData,
+            sharpness,
+            clipHighlights,
+            clipShadows,
+            meanBrightness,
+            saturationSpread,
+            dHash,
+            duplicateOf,
+            captureTime,
+            imageWidth,
+            imageHeight,
+            orientation,
+            cameraMake,
+            cameraModel,
+            lensModel,
+            thumbOffset,
+            thumbLength,
+            faceCount,
+            eyeOpenMin,
+            eyeOpenMean,
+            faceScore,
+            rankScore,
+            groupRank
         FROM present;
         DELETE FROM present;
         COMMIT;
@@ -261,7 +380,16 @@ export function getPhotosExtendByCriteria(
             similarity,
       IQA,
       isEnabled,
-      faceData
+      faceData,
+      sharpness,
+      clipHighlights,
+      clipShadows,
+      meanBrightness,
+      saturationSpread,
+      duplicateOf,
+      captureTime,
+      rankScore,
+      groupRank
         FROM present
         WHERE 1=1
     `;
@@ -301,7 +429,16 @@ export async function getPhotoExtendByPhoto(
             similarity,
       IQA,
       isEnabled,
-      faceData
+      faceData,
+      sharpness,
+      clipHighlights,
+      clipShadows,
+      meanBrightness,
+      saturationSpread,
+      duplicateOf,
+      captureTime,
+      rankScore,
+      groupRank
         FROM present
         WHERE fileName = @fileName AND filePath = @filePath
     `;
@@ -618,6 +618,20 @@ class PhotoServiceImpl {
         }),
       });
 
+      // 文件头元数据（尺寸 / 拍摄时间 / 相机镜头）由后端并行读取、批量写库，不阻塞导入流程
+      const dbPath = await (
+        window as { ElectronDB?: { getDbPath?: () => Promise<string> } }
+      ).ElectronDB?.getDbPath?.();
+      if (dbPath) {
+        fetch(`${SERVER_BASE_URL}/extract_metadata`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ db_path: dbPath, file_paths: filePaths }),
+        }).catch((e) =>
+          console.warn("[PhotoService] Metadata extraction failed:", e),
+        );
+      }
+
       // 检查任务是否仍然有效
       if (taskId !== this.currentImportTaskId) {
         console.log(
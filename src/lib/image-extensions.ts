@@ -0,0 +1,33 @@
+/**
+ * 可导入的图片扩展名（小写、不带点），主进程与渲染进程共用同一份列表。
+ *
+ * RAW 列表须与 python/utils/raw.py 的 RAW_EXTENSIONS 保持一致：浏览器无法直接
+ * 显示 RAW，主进程把这些文件交给后端提取相机内嵌的 JPEG 预览。
+ */
+export const RAW_EXTENSIONS: readonly string[] = [
+  "nef",
+  "nrw",
+  "cr2",
+  "arw",
+  "sr2",
+  "srf",
+  "dng",
+  "orf",
+  "rw2",
+  "pef",
+  "srw",
+  "raf",
+  "rwl",
+  "3fr",
+  "erf",
+  "kdc",
+];
+
+/** 拖拽与文件选择允许的全部扩展名（普通图片 + RAW） */
+export const IMAGE_EXTENSIONS: readonly string[] = [
+  "png",
+  "jpg",
+  "jpeg",
+  "webp",
+  ...RAW_EXTENSIONS,
+];
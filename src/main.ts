@@ -10,6 +10,7 @@ import path from "path";
 import * as zlib from "zlib";
 import { initializeLogger, closeLogger } from "./lib/logger";
 import { toErrMsg } from "./lib/error-utils";
+import { RAW_EXTENSIONS } from "./lib/image-extensions";
 import { spawn, type ChildProcess } from "child_process";
 import * as http from "http"; // 新增：用于调用后端 /shutdown
 import { LruBufferCache } from "./helpers/cache/lru-buffer-cache";
@@ -65,6 +66,16 @@ function resolveLocalResourceCacheLimit(): {
   return { limitBytes: 512 * 1024 * 1024, freeMemGB };
 }
 
+// 浏览器无法直接显示的 RAW 格式，交给后端提取内嵌 JPEG 预览（path.extname 带点，这里同样带点）
+const RAW_EXTENSION_SET = new Set(RAW_EXTENSIONS.map((ext) => `.${ext}`));
+
+async function readRawPreview(filePath: string): Promise<Buffer> {
+  const query = new URLSearchParams({ photo_path: filePath });
+  const res = await fetch(`http://localhost:8000/raw_preview?${query}`);
+  if (!res.ok) throw new Error(`raw_preview ${res.status}`);
+  return Buffer.from(await res.arrayBuffer());
+}
+
 function detectMimeType(filePath: string): string {
   const ext = path.extname(filePath).toLowerCase();
   switch (ext) {
@@ -367,8 +378,11 @@ function createWindow() {
     }
 
     try {
-      const data = await fs.promises.readFile(fullPath);
-      const mimeType = detectMimeType(fullPath);
+      const isRaw = RAW_EXTENSION_SET.has(path.extname(fullPath).toLowerCase());
+      const data = isRaw
+        ? await readRawPreview(fullPath)
+        : await fs.promises.readFile(fullPath);
+      const mimeType = isRaw ? "image/jpeg" : detectMimeType(fullPath);
 
       if (localResourceCache.capacityBytes > 0) {
         localResourceCache.set(cacheKey, {
@@ -413,6 +427,35 @@ function createWindow() {
       const data = await fs.promises.readFile(thumbnailPath);
       return new Response(data as BodyInit);
     } catch (error: unknown) {
+      // 打包存储模式（MEDIA_TOOLBOX_THUMB_STORE=pack）下没有单个 .webp 文件，交给后端从 thumbs.pack 读取；
+      // 普通模式下缩略图尚未生成是常态（导入过程中网格会反复请求），直接报错，不为每张图多一次 HTTP 往返
+      let packMode = false;
+      try {
+        await fs.promises.access(path.join(cacheFolderPath, "thumbs.pack"));
+        packMode = true;
+      } catch {
+        // 没有 thumbs.pack：普通模式
+      }
+      if (packMode) {
+        const query = new URLSearchParams({
+          photo_path: fullPath,
+          width: "128",
+          height: "128",
+          thumbs_path: cacheFolderPath,
+        });
+        try {
+          const res = await fetch(
+            `http://localhost:8000/get_thumbnail?${query}`,
+          );
+          if (res.ok) {
+            return new Response(await res.arrayBuffer(), {
+              headers: { "Content-Type": "image/webp" },
+            });
+          }
+        } catch {
+          // 后端未就绪，按原逻辑报错
+        }
+      }
       console.error(`Failed to read thumbnail: ${toErrMsg(error)}`);
       return new Response(null, { status: 500 });
     }
@@ -19,6 +19,7 @@ import { ScrollArea } from "@/components/ui/scroll-area";
 import { initializeDatabase, clearPhotos } from "@/helpers/ipc/database/db";
 import { useTranslation } from "react-i18next";
 import { cn } from "@/lib/utils";
+import { IMAGE_EXTENSIONS } from "@/lib/image-extensions";
 import { usePhotoFilterStore } from "@/helpers/store/usePhotoFilterStore";
 import { PhotoService } from "@/helpers/services/PhotoService";
 import { Upload, FileWarning, Image as ImageIcon } from "lucide-react";
@@ -38,8 +39,8 @@ interface FileImportDrawerProps {
   onImported?: () => void;
 }
 
-// 允许的扩展名（用于拖拽和文件选择公用）
-const VALID_EXTENSIONS = ["png", "jpg", "jpeg", "webp"];
+// 允许的扩展名（用于拖拽和文件选择公用；RAW 由后端只读取内嵌的 JPEG 预览）
+const VALID_EXTENSIONS = IMAGE_EXTENSIONS;
 
 /** 判断是否为合法图片文件 */
 function isValidImageFile(file: File): boolean {
@@ -353,7 +354,7 @@ function FileImportDrawer({ onImported }: FileImportDrawerProps) {
                         ref={fileInputRef}
                         type="file"
                         multiple
-                        accept=".jpg,.jpeg,.png,.webp"
+                        accept={VALID_EXTENSIONS.map((ext) => `.${ext}`).join(",")}
                         className="hidden"
                         onChange={handleFileSelect}
                       />